@@ -92,9 +92,9 @@ const Dashboard = React.memo(() => {
     // Fetch user data on component mount
     (async () => {
       try{
-        const response = await axios.get('/api/logged_in_user/');
-        
-        let data = await response.data[0];
+        const response = await axios.get('/api/logged_in_user/me/');
+
+        let data = await response.data;
 
         if (response.status === 200) {
           setDataHandlerRef.current(data => {
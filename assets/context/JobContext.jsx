@@ -1,6 +1,7 @@
 import React, { createContext, useContext, useState, useEffect, useRef, useCallback } from 'react';
 import axios from "axios";
 import qs from "qs";
+import getCSRFToken from '../common/csrftoken';
 
 const JobContext = createContext();
 
@@ -32,9 +33,14 @@ export const JobProvider = ({ children }) => {
     ws.current.onmessage = (e) => {
       console.log("Received message...")
       const parsedData = JSON.parse(e.data);
+      // Server heartbeat, idle sockets get closed
+      if (parsedData.type === "ping") {
+        ws.current.send(JSON.stringify({ type: "pong" }));
+        return;
+      }
       let message = parsedData.message;
 
-      if ("job_id" in message) {
+      if (message && typeof message === "object" && "job_id" in message) {
         let updatedJobId = message.job_id;
         console.log(updatedJobId, " with message: ", message);
 
@@ -45,6 +51,10 @@ export const JobProvider = ({ children }) => {
           let thisJob = jobsRef.current[jobIndex];
           let thisJobDataHandler = thisJob.dataHandler;
           thisJobDataHandler(message);
+          // Final result, nothing left to cancel
+          if (message.stop !== false) {
+            jobsRef.current = jobsRef.current.filter((job) => job.jobId !== updatedJobId);
+          }
         }
       }
 
@@ -57,6 +67,19 @@ export const JobProvider = ({ children }) => {
     return () => ws.current?.close();
   }, []);
 
+  // Cancel a job, over the websocket if it is open
+  const cancelJob = useCallback(async (jobId) => {
+    jobsRef.current = jobsRef.current.filter((j) => j.jobId !== jobId);
+    if (ws.current?.readyState === WebSocket.OPEN) {
+      ws.current.send(JSON.stringify({ type: "cancel", job_id: jobId }));
+    } else {
+      await axios.post("/cancel_job/", null, {
+        params: { job_id: jobId },
+        headers: { "X-CSRFToken": getCSRFToken() },
+      });
+    }
+  }, []);
+
   // Updated initiateJob function to modify jobsRef.current directly
   const initiateJob = useCallback(async (kwargs = {}) => {
     console.log("initiateJob kwargs: ", kwargs);
@@ -69,6 +92,12 @@ export const JobProvider = ({ children }) => {
     } = kwargs;
 
     const payload = createPayload();
+    // Pick the job_id here, so this tab can subscribe to the job before the
+    // result can arrive; other tabs then don't receive it
+    const jobId = payload.job_id ?? crypto.randomUUID();
+    if (ws.current?.readyState === WebSocket.OPEN) {
+      ws.current.send(JSON.stringify({ type: "subscribe", job_id: jobId }));
+    }
 
     console.log("initiateJob payload: ", payload, dataHandler);
 
@@ -76,6 +105,7 @@ export const JobProvider = ({ children }) => {
       params: {
         callback: callbackName,
         ...payload,
+        job_id: jobId,
       },
       paramsSerializer: params => qs.stringify(params, { arrayFormat: 'repeat' })
     });
@@ -89,10 +119,13 @@ export const JobProvider = ({ children }) => {
       jobsRef.current.push({ jobId: newJobId, dataHandler: dataHandler });
 
       setTimeout(() => {
-        jobsRef.current = jobsRef.current.filter((j) => j.jobId !== newJobId);
+        // Nobody is waiting for it any more
+        if (jobsRef.current.some((j) => j.jobId === newJobId)) {
+          cancelJob(newJobId);
+        }
       }, timeoutSeconds * 1000);
     }
-  }, [currentDataHandler]);
+  }, [currentDataHandler, cancelJob]);
   
   const setDataHandler = useCallback((newHandler) => {
     setCurrentDataHandler(() => newHandler);
@@ -102,8 +135,9 @@ export const JobProvider = ({ children }) => {
   const contextValue = React.useMemo(() => ({
     jobs: jobsRef.current, // Provide direct access to jobs data
     initiateJob,
+    cancelJob,
     setDataHandler,
-  }), [initiateJob, setDataHandler]);
+  }), [initiateJob, cancelJob, setDataHandler]);
 
   return (
     <JobContext.Provider value={contextValue}>
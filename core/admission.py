@@ -0,0 +1,148 @@
+"""
+Admission control for interpretation submissions.
+
+Token buckets per user and per group tag, kept in the cache (the shared
+job store) so the limits hold across workers, answering with a fast 429
+and a Retry-After header. Group tag buckets are keyed on the tag's primary
+key, as sanitized names of distinct tags can clash. The read-modify-write
+on the cache is not atomic, so concurrent requests on different workers
+can occasionally over-admit by a token or two; that is fine for shedding
+a mis-configured dashboard.
+
+The per-worker cap on jobs in flight, and the bounded queue of jobs
+waiting for one, are the job scheduler's (see core/scheduler.py): a slot
+is taken when a job is dispatched and freed by release_job when its final
+result arrives, whereas the submission views return as soon as a job is
+queued.
+
+Configured by settings.ADMISSION_CONTROL.
+"""
+
+import math
+import time
+from collections import Counter
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from core.metrics import register_stats
+from core.utils import sanitize_string
+
+DEFAULTS = {
+    "ENABLED": True,
+    # tokens per second and bucket size, per user
+    "USER_RATE": 2.0,
+    "USER_BURST": 10,
+    # tokens per second and bucket size, per group tag
+    "GROUP_TAG_RATE": 20.0,
+    "GROUP_TAG_BURST": 100,
+}
+
+_outcomes = Counter()
+register_stats("admission", lambda: dict(_outcomes))
+
+
+def admission_setting(name):
+    return getattr(settings, "ADMISSION_CONTROL", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def _tokens(key, rate, burst, now):
+    tokens, updated = cache.get(key, (burst, now))
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def check_token(key, rate, burst, now=None):
+    """
+    Check whether the bucket stored under key has a token, without taking
+    it.
+
+    :param key: Cache key of the bucket
+    :param rate: Tokens added per second
+    :param burst: Bucket size
+    :param now: Current time, for testing
+    :return: (allowed, seconds until a token is available)
+    """
+    now = time.time() if now is None else now
+    tokens = _tokens(key, rate, burst, now)
+    if tokens >= 1:
+        return True, 0.0
+    return False, (1 - tokens) / rate
+
+
+def take_token(key, rate, burst, now=None):
+    """
+    Take one token from the bucket stored under key.
+
+    :param key: Cache key of the bucket
+    :param rate: Tokens added per second
+    :param burst: Bucket size
+    :param now: Current time, for testing
+    :return: (allowed, seconds until a token is available)
+    """
+    now = time.time() if now is None else now
+    tokens = _tokens(key, rate, burst, now)
+    timeout = math.ceil(burst / rate) + 1
+    if tokens >= 1:
+        cache.set(key, (tokens - 1, now), timeout)
+        return True, 0.0
+    cache.set(key, (tokens, now), timeout)
+    return False, (1 - tokens) / rate
+
+
+@sync_to_async
+def _fetch_rate_limit_identity(user):
+    return user.email, list(user.group_tags.values_list("pk", flat=True))
+
+
+def too_many_requests(retry_after, reason):
+    response = JsonResponse(
+        {'status': 'Request not made, ' + reason},
+        status=429
+    )
+    response["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admission_control(view_func):
+    """
+    Decorator for async submission views. Must run after
+    user_is_approved_for_request, so request.user is a real user.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        if not admission_setting("ENABLED"):
+            return await view_func(request, *args, **kwargs)
+
+        email, group_tag_pks = await _fetch_rate_limit_identity(request.user)
+
+        buckets = [(
+            sanitize_string(f"ratelimit_user_{email}"),
+            admission_setting("USER_RATE"),
+            admission_setting("USER_BURST"),
+            'user rate limit',
+        )] + [(
+            f"ratelimit_group_tag_{tag_pk}",
+            admission_setting("GROUP_TAG_RATE"),
+            admission_setting("GROUP_TAG_BURST"),
+            'group rate limit',
+        ) for tag_pk in group_tag_pks]
+
+        # check every bucket before taking from any, so a request rejected
+        # by one limit isn't charged to the others
+        for key, rate, burst, reason in buckets:
+            allowed, retry_after = check_token(key, rate, burst)
+            if not allowed:
+                _outcomes["rejected"] += 1
+                return too_many_requests(retry_after, reason)
+        for key, rate, burst, reason in buckets:
+            take_token(key, rate, burst)
+
+        _outcomes["admitted"] += 1
+        return await view_func(request, *args, **kwargs)
+
+    return _wrapped_view
@@ -0,0 +1,25 @@
+import logging
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from core.db import configure_sqlite
+
+        connection_created.connect(configure_sqlite)
+
+        if getattr(settings, "LOGGING_QUEUE_ENABLED", False):
+            from flaskappframework import logging_mp
+            from core.logs import install_queue_logging
+
+            install_queue_logging(
+                *(logging.getLogger(name)
+                  for name in settings.LOGGING_QUEUE_LOGGERS),
+                logging_mp.bring_logger_to_here(),
+            )
@@ -13,6 +13,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import core.routing
+from core.ingest import CallbackGate
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
@@ -20,7 +21,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+    # callbacks for unknown jobs are turned away before their bodies are read
+    "http": CallbackGate(django_asgi_app),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             core.routing.websocket_urlpatterns
@@ -0,0 +1,4 @@
+"""
+Benchmark and load-test helpers used by the bench_* and loadtest
+management commands.
+"""
@@ -0,0 +1,15 @@
+from core.payloads import SCALE_DEFAULTS, SCALE_PARAMS
+
+
+def add_scale_arguments(parser):
+    """
+    Add --sites, --turbines-per-site, ... options for the payload generator
+    to a management command.
+    """
+    for name in SCALE_PARAMS:
+        parser.add_argument("--" + name.replace("_", "-"), type=int,
+                            default=SCALE_DEFAULTS[name])
+
+
+def scale_from_options(options):
+    return {name: options[name] for name in SCALE_PARAMS}
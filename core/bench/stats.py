@@ -0,0 +1,55 @@
+import asyncio
+import time
+from collections import defaultdict
+
+from core.metrics import summarise
+
+# Stage name -> (start mark, end mark) recorded by JobTracker
+STAGES = {
+    "submit": ("submit_start", "submit_end"),
+    "backend": ("backend_received", "callback_start"),
+    "callback": ("callback_start", "callback_end"),
+    "delivery": ("callback_start", "delivered"),
+    "end_to_end": ("submit_start", "delivered"),
+}
+
+
+class JobTracker:
+    """
+    Records per-job timestamps from the harness, the stub host and the
+    clients, and lets clients wait for a job to finish or fail.
+    """
+
+    def __init__(self):
+        self.marks = defaultdict(dict)
+        self.failed = set()
+        self._futures = {}
+
+    def record(self, job_id, mark):
+        self.marks[job_id].setdefault(mark, time.perf_counter())
+
+    def future(self, job_id):
+        if job_id not in self._futures:
+            self._futures[job_id] = \
+                asyncio.get_running_loop().create_future()
+        return self._futures[job_id]
+
+    def deliver(self, job_id):
+        self.record(job_id, "delivered")
+        future = self.future(job_id)
+        if not future.done():
+            future.set_result(True)
+
+    def fail(self, job_id):
+        self.failed.add(job_id)
+        future = self.future(job_id)
+        if not future.done():
+            future.set_result(False)
+
+    def stage_summaries(self):
+        durations = defaultdict(list)
+        for marks in self.marks.values():
+            for stage, (start, end) in STAGES.items():
+                if start in marks and end in marks:
+                    durations[stage].append(marks[end] - marks[start])
+        return {stage: summarise(durations[stage]) for stage in STAGES}
@@ -0,0 +1,208 @@
+"""
+A local stand-in for the interpretation super-backend.
+
+It accepts submissions as JSON POSTs ({"job_id": ..., **kwargs}), replies
+with an acknowledgement, and after a configurable latency posts a payload
+back to callback_view through a pluggable deliver coroutine, the same way
+the super-backend does. A JSON POST of {"job_id": ...} to a path ending
+in /cancel drops a pending delivery. It speaks just enough HTTP/1.1 (with
+keep-alive) for httpx, over TCP or a Unix domain socket.
+"""
+
+import asyncio
+import json
+import random
+
+import httpx
+
+from core.compression import compress
+from core.payloads import generate_interpretation_payload
+
+
+def load_stub_payload(payload_kb=0, **scale):
+    """
+    Build a generated interpretation payload at the given scale (see
+    core.payloads), padded to roughly payload_kb kilobytes if it is smaller.
+    """
+    payload = generate_interpretation_payload(**scale)
+    padding = payload_kb * 1024 - len(json.dumps(payload))
+    if padding > 0:
+        payload["stub_padding"] = "x" * padding
+    return payload
+
+
+def _callback_body(payload, encoding):
+    body = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json"}
+    if encoding not in (None, "identity"):
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+def asgi_deliverer(client, encoding=None):
+    """
+    Deliver callbacks through an httpx client bound to the in-process
+    ASGI application, optionally compressed with encoding.
+    """
+    async def deliver(payload, params):
+        body, headers = _callback_body(payload, encoding)
+        return await client.post("/callback_view/", params=params,
+                                 content=body, headers=headers)
+    return deliver
+
+
+def http_deliverer(callback_url, encoding=None):
+    """
+    Deliver callbacks over HTTP to a running deployment, optionally
+    compressed with encoding.
+    """
+    client = httpx.AsyncClient()
+
+    async def deliver(payload, params):
+        body, headers = _callback_body(payload, encoding)
+        return await client.post(callback_url, params=params,
+                                 content=body, headers=headers)
+    return deliver
+
+
+class StubInterpretationHost:
+
+    def __init__(self, deliver, latency=0.05, jitter=0.0, error_rate=0.0,
+                 payload=None, tracker=None, host="127.0.0.1", port=0,
+                 uds_path=None):
+        self.deliver = deliver
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payload = payload if payload is not None else load_stub_payload()
+        self.tracker = tracker
+        self.host = host
+        self.port = port
+        self.uds_path = uds_path
+        self.submissions = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self._server = None
+        self._tasks = {}
+
+    @property
+    def url(self):
+        if self.uds_path:
+            return "http://localhost/submit"
+        return f"http://{self.host}:{self.port}/submit"
+
+    @property
+    def cancel_url(self):
+        return self.url.rsplit("/", 1)[0] + "/cancel"
+
+    async def start(self):
+        if self.uds_path:
+            self._server = await asyncio.start_unix_server(
+                self._handle, path=self.uds_path
+            )
+        else:
+            self._server = await asyncio.start_server(
+                self._handle, self.host, self.port
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(
+                    int(headers.get("content-length", 0))
+                )
+
+                path = request_line.split()[1].decode("latin-1")
+                if path.rstrip("/").endswith("/cancel"):
+                    status, reply = self._cancel(body)
+                else:
+                    status, reply = self._submit(body)
+                out = json.dumps(reply).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(out)}\r\n\r\n".encode() + out
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _submit(self, body):
+        self.submissions += 1
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            return "400 Bad Request", {"status": "invalid json"}
+        job_id = data.get("job_id")
+        if self.tracker is not None:
+            self.tracker.record(job_id, "backend_received")
+
+        if random.random() < self.error_rate:
+            self.rejected += 1
+            if self.tracker is not None:
+                self.tracker.fail(job_id)
+            return "500 Internal Server Error", {"status": "stub error"}
+
+        if job_id is not None:
+            task = asyncio.get_running_loop().create_task(
+                self._complete(job_id, data)
+            )
+            self._tasks[job_id] = task
+            task.add_done_callback(
+                lambda t: self._tasks.get(job_id) is t
+                and self._tasks.pop(job_id)
+            )
+        return "200 OK", {"status": "accepted", "job_id": job_id}
+
+    def _cancel(self, body):
+        try:
+            job_id = json.loads(body or b"{}").get("job_id")
+        except ValueError:
+            return "400 Bad Request", {"status": "invalid json"}
+        task = self._tasks.pop(job_id, None)
+        if task is None:
+            return "404 Not Found", {"status": "unknown job"}
+        task.cancel()
+        self.cancelled += 1
+        return "200 OK", {"status": "cancelled", "job_id": job_id}
+
+    async def _complete(self, job_id, data):
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        await asyncio.sleep(max(0.0, delay))
+
+        payload = {**self.payload, "job_id": job_id}
+        params = {"job_id": job_id, "user_email": data.get("user_email")}
+        if self.tracker is not None:
+            self.tracker.record(job_id, "callback_start")
+        try:
+            response = await self.deliver(payload, params)
+            ok = response.status_code == 200
+        except Exception:
+            ok = False
+        if self.tracker is not None:
+            self.tracker.record(job_id, "callback_end")
+            if not ok:
+                self.tracker.fail(job_id)
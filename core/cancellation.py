@@ -0,0 +1,176 @@
+"""
+Job cancellation.
+
+Jobs are registered to the user who submitted them. A job can be cancelled
+by its owner (cancel_job/ endpoint, or a {"type": "cancel"} websocket
+message), or automatically when the owner's last websocket disconnects and
+they aren't polling check_request_status either (tab closed, navigated
+away). Automatic cancellation waits GRACE_PERIOD seconds first, so a page
+reload doesn't cancel the jobs it is about to wait for again.
+
+A cancelled job is marked in the job store, so complete_job drops its
+result, is dropped from the scheduler queue if it hasn't been dispatched
+yet, and is otherwise reported to the super-backend through the transport.
+
+Configured by settings.JOB_CANCELLATION.
+"""
+
+import asyncio
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.logs import log_event
+from core.presence import user_is_present
+from core.scheduler import cancel_scheduled_job
+from core.transports import get_transport
+from core.utils import sanitize_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "AUTO_CANCEL": True,
+    # seconds to wait after the last socket closes before cancelling
+    "GRACE_PERIOD": 5.0,
+    # a user counts as polling for this long after a check_request_status
+    "POLL_ACTIVE_TIMEOUT": 10,
+    # how long a job stays marked as cancelled, to drop late results
+    "CANCELLED_TTL": 3600,
+    # how long a job's owner, and its user's job list, are kept; must
+    # outlive the jobs (SCHEDULER["JOB_TIMEOUT"] plus time queued)
+    "JOB_TTL": 3600,
+}
+
+# References to pending automatic cancellations, so they aren't garbage
+# collected before they run.
+_pending = set()
+
+
+def cancellation_setting(name):
+    return getattr(settings, "JOB_CANCELLATION", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def _user_jobs_key(user_email):
+    return sanitize_string(f"jobs_{user_email}")
+
+
+def _polling_key(user_email):
+    return sanitize_string(f"polling_{user_email}")
+
+
+def register_job(job_id, user_email):
+    """
+    Record the owner of a newly submitted job.
+
+    :param job_id: The job's id
+    :param user_email: Email of the user who submitted it
+    """
+    cache.set(f"owner_{job_id}", user_email,
+              cancellation_setting("JOB_TTL"))
+    # job ids are reused by refreshes
+    cache.delete(f"cancelled_{job_id}")
+    key = _user_jobs_key(user_email)
+    jobs = cache.get(key, [])
+    if job_id not in jobs:
+        jobs.append(job_id)
+        cache.set(key, jobs, cancellation_setting("JOB_TTL"))
+
+
+def finish_job(job_id, user_email):
+    """
+    Forget a job that has delivered its final result.
+    """
+    key = _user_jobs_key(user_email)
+    jobs = cache.get(key, [])
+    if job_id in jobs:
+        jobs.remove(job_id)
+        cache.set(key, jobs, cancellation_setting("JOB_TTL"))
+    cache.delete(f"owner_{job_id}")
+
+
+def job_is_cancelled(job_id):
+    return cache.get(f"cancelled_{job_id}", False)
+
+
+async def cancel_job(job_id, user_email=None, reason="user"):
+    """
+    Cancel a job.
+
+    :param job_id: The job to cancel
+    :param user_email: If given, only cancel the job if this user owns it
+    :param reason: Why the job was cancelled, for the logs
+    :return: True if the job was cancelled
+    """
+    owner = cache.get(f"owner_{job_id}")
+    if owner is None or (user_email is not None and owner != user_email):
+        return False
+
+    cache.set(f"cancelled_{job_id}", True,
+              cancellation_setting("CANCELLED_TTL"))
+    cache.delete_many([f"data_{job_id}", f"stop_{job_id}",
+                       f"result_{job_id}", f"extra_payload_{job_id}"])
+    finish_job(job_id, owner)
+
+    state = await cancel_scheduled_job(job_id)
+    if state != "queued":
+        # already dispatched (or dispatched by another worker)
+        try:
+            await get_transport().cancel(job_id)
+        except Exception as e:
+            log_event(logger, logging.WARNING, "cancel_job.transport_failed",
+                      job_id=job_id, exception=e)
+
+    log_event(logger, logging.INFO, "cancel_job", job_id=job_id,
+              user_email=owner, reason=reason, state=state)
+    return True
+
+
+async def cancel_user_jobs(user_email, reason="user"):
+    """
+    Cancel all of a user's outstanding jobs.
+
+    :return: The number of jobs cancelled
+    """
+    cancelled = 0
+    for job_id in list(cache.get(_user_jobs_key(user_email), [])):
+        if await cancel_job(job_id, user_email, reason):
+            cancelled += 1
+    return cancelled
+
+
+def note_poll(job_id):
+    """
+    Record that the owner of job_id is polling check_request_status, so
+    their jobs aren't cancelled when they have no websocket.
+    """
+    owner = cache.get(f"owner_{job_id}")
+    if owner is not None:
+        cache.set(_polling_key(owner), True,
+                  cancellation_setting("POLL_ACTIVE_TIMEOUT"))
+
+
+def socket_closed(user_email):
+    """
+    Schedule automatic cancellation of the user's jobs if the websocket
+    that just closed was their last one.
+    """
+    if user_is_present(user_email) \
+            or not cancellation_setting("AUTO_CANCEL"):
+        return
+    task = asyncio.get_running_loop().create_task(
+        _cancel_if_abandoned(user_email)
+    )
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
+
+
+async def _cancel_if_abandoned(user_email):
+    await asyncio.sleep(cancellation_setting("GRACE_PERIOD"))
+    if user_is_present(user_email):
+        return
+    if cache.get(_polling_key(user_email)):
+        return
+    await cancel_user_jobs(user_email, reason="abandoned")
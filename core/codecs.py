@@ -0,0 +1,173 @@
+"""
+Wire formats for job results on the websocket, negotiated as subprotocols.
+
+- "sentinel.json" (default, also used when the client offers none): JSON
+  text frames, as before.
+- "sentinel.json.deflate": the same JSON, raw-deflated into a binary frame
+  (decodable in browsers with DecompressionStream("deflate-raw")). Daphne
+  doesn't offer permessage-deflate, so this is the compression option
+  there; under servers that negotiate permessage-deflate themselves
+  (uvicorn) plain "sentinel.json" gets compressed anyway.
+- "sentinel.msgpack": MessagePack with a string-interning table. A frame
+  is two concatenated MessagePack objects: the table (a list of strings
+  used more than once), then the message with those strings replaced by
+  ext type 1 values holding their packed table index.
+- "sentinel.cbor": CBOR with standard string references (tags 256/25).
+
+msgpack and cbor2 are optional; their subprotocols are only offered when
+the package is installed. Control messages (pings, cancel replies) stay
+JSON text frames whatever the subprotocol.
+
+Configured by settings.WS_SUBPROTOCOLS.
+"""
+
+import json
+import zlib
+from collections import Counter
+
+from django.conf import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+DEFAULTS = {
+    # in order of server preference
+    "ENABLED": ["sentinel.msgpack", "sentinel.cbor",
+                "sentinel.json.deflate", "sentinel.json"],
+    "DEFLATE_LEVEL": 6,
+    # shorter strings aren't worth a table entry
+    "INTERN_MIN_LENGTH": 8,
+}
+
+# msgpack ext type of interned string references
+EXT_STRING_REF = 1
+
+
+def subprotocol_setting(name):
+    return getattr(settings, "WS_SUBPROTOCOLS", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+class JSONCodec:
+    subprotocol = "sentinel.json"
+
+    def encode(self, message):
+        return json.dumps(message)
+
+    def decode(self, frame):
+        return json.loads(frame)
+
+
+class DeflateJSONCodec(JSONCodec):
+    subprotocol = "sentinel.json.deflate"
+
+    def encode(self, message):
+        compressor = zlib.compressobj(
+            subprotocol_setting("DEFLATE_LEVEL"), zlib.DEFLATED, -15
+        )
+        text = json.dumps(message).encode()
+        return compressor.compress(text) + compressor.flush()
+
+    def decode(self, frame):
+        return json.loads(zlib.decompress(frame, -15))
+
+
+def _count_strings(obj, counts, min_length):
+    if isinstance(obj, str):
+        if len(obj) >= min_length:
+            counts[obj] += 1
+    elif isinstance(obj, dict):
+        for key, value in obj.items():
+            _count_strings(key, counts, min_length)
+            _count_strings(value, counts, min_length)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            _count_strings(value, counts, min_length)
+
+
+def _intern(obj, refs):
+    if isinstance(obj, str):
+        return refs.get(obj, obj)
+    if isinstance(obj, dict):
+        return {_intern(key, refs): _intern(value, refs)
+                for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_intern(value, refs) for value in obj]
+    return obj
+
+
+class MsgpackCodec:
+    subprotocol = "sentinel.msgpack"
+
+    def encode(self, message):
+        counts = Counter()
+        _count_strings(message, counts,
+                       subprotocol_setting("INTERN_MIN_LENGTH"))
+        table = [string for string, count in counts.items() if count > 1]
+        refs = {
+            string: msgpack.ExtType(EXT_STRING_REF, msgpack.packb(index))
+            for index, string in enumerate(table)
+        }
+        return msgpack.packb(table) + msgpack.packb(_intern(message, refs))
+
+    def decode(self, frame):
+        table = []
+
+        def ext_hook(code, data):
+            if code == EXT_STRING_REF:
+                return table[msgpack.unpackb(data)]
+            return msgpack.ExtType(code, data)
+
+        unpacker = msgpack.Unpacker(ext_hook=ext_hook,
+                                    strict_map_key=False)
+        unpacker.feed(frame)
+        table.extend(next(unpacker))
+        return next(unpacker)
+
+
+class CBORCodec:
+    subprotocol = "sentinel.cbor"
+
+    def encode(self, message):
+        return cbor2.dumps(message, string_referencing=True)
+
+    def decode(self, frame):
+        return cbor2.loads(frame)
+
+
+JSON_CODEC = JSONCodec()
+
+
+def available_codecs():
+    """
+    :return: {subprotocol: codec} of the codecs usable in this install
+    """
+    codecs = [JSON_CODEC, DeflateJSONCodec()]
+    if msgpack is not None:
+        codecs.append(MsgpackCodec())
+    if cbor2 is not None:
+        codecs.append(CBORCodec())
+    return {codec.subprotocol: codec for codec in codecs}
+
+
+def negotiate(offered):
+    """
+    Pick the codec for a websocket connection.
+
+    :param offered: Subprotocols offered by the client (scope
+        "subprotocols")
+    :return: (codec, subprotocol to accept with, or None)
+    """
+    codecs = available_codecs()
+    for subprotocol in subprotocol_setting("ENABLED"):
+        if subprotocol in offered and subprotocol in codecs:
+            return codecs[subprotocol], subprotocol
+    return JSON_CODEC, None
@@ -0,0 +1,245 @@
+"""
+HTTP body compression for callbacks and polling.
+
+- open_request_body: the body of a request sent with Content-Encoding
+  gzip, deflate or zstd, as a stream decompressed a chunk at a time up to
+  MAX_REQUEST_BYTES, so a small compressed body can't expand without
+  bound. callback_view reads super-backend results through it (see
+  core.ingest).
+- compress_response: decorator for async views returning JSON, which
+  compresses responses of at least MIN_SIZE bytes with the best encoding
+  the client accepts (zstd, gzip, deflate), so small status replies go out
+  as they are. A strong ETag gets the encoding appended, see
+  core.conditional.
+
+zstd needs the optional zstandard package.
+
+Configured by settings.HTTP_COMPRESSION.
+"""
+
+import io
+import zlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from core.conditional import representation_etag
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DEFAULTS = {
+    # in order of server preference
+    "ENCODINGS": ["zstd", "gzip", "deflate"],
+    "MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "ZSTD_LEVEL": 3,
+    "MAX_REQUEST_BYTES": 256 * 1024 * 1024,
+}
+
+# read size of the request stream, and of each decompressed piece
+CHUNK_SIZE = 64 * 1024
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class UnsupportedEncoding(Exception):
+    pass
+
+
+def compression_setting(name):
+    return getattr(settings, "HTTP_COMPRESSION", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def supported_encodings():
+    encodings = ["gzip", "deflate"]
+    if zstandard is not None:
+        encodings.append("zstd")
+    return encodings
+
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Reads a stream through a decompressor, a chunk at a time, raising
+    RequestTooLarge once more than limit bytes come out. Wrap it in an
+    io.BufferedReader for read(n).
+    """
+
+    def __init__(self, stream, encoding, limit):
+        if encoding in ("", "identity"):
+            self._mode = "identity"
+        elif encoding in ("gzip", "x-gzip", "deflate"):
+            self._mode = "zlib"
+        elif encoding == "zstd" and zstandard is not None:
+            self._mode = "zstd"
+            self._zstd = zstandard.ZstdDecompressor().stream_reader(stream)
+        else:
+            raise UnsupportedEncoding(encoding)
+        self._stream = stream
+        self._encoding = encoding
+        self._limit = limit
+        self._decompressor = None
+        self._pending = b""
+        self._total = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _zlib_decompressor(self, first_chunk):
+        if self._encoding != "deflate":
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        # zlib-wrapped per the RFC, but some clients send raw deflate
+        header = first_chunk[:2]
+        if len(header) == 2 and header[0] & 0x0F == 8 \
+                and int.from_bytes(header, "big") % 31 == 0:
+            return zlib.decompressobj(zlib.MAX_WBITS)
+        return zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def _next_piece(self):
+        if self._mode == "identity":
+            return self._stream.read(CHUNK_SIZE)
+        if self._mode == "zstd":
+            return self._zstd.read(CHUNK_SIZE)
+
+        while True:
+            if self._decompressor is not None \
+                    and self._decompressor.unconsumed_tail:
+                data = self._decompressor.unconsumed_tail
+            else:
+                data = self._stream.read(CHUNK_SIZE)
+                if self._decompressor is None:
+                    self._decompressor = self._zlib_decompressor(data)
+                if not data:
+                    return self._decompressor.flush()
+            # max_length bounds what a small, highly compressed chunk can
+            # expand to in one go
+            piece = self._decompressor.decompress(data, CHUNK_SIZE)
+            if piece or self._decompressor.eof:
+                return piece
+
+    def readinto(self, buffer):
+        while not self._pending and not self._eof:
+            piece = self._next_piece()
+            if not piece:
+                self._eof = True
+                break
+            self._total += len(piece)
+            if self._total > self._limit:
+                raise RequestTooLarge()
+            self._pending = piece
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def open_decompressed(stream, encoding, limit):
+    """
+    :param stream: File-like object with read(n)
+    :param encoding: Content-Encoding token
+    :param limit: Maximum decompressed size
+    :return: Buffered file-like object of the decompressed data
+    :raises UnsupportedEncoding: For encodings not supported here
+    """
+    return io.BufferedReader(DecompressingReader(stream, encoding, limit),
+                             CHUNK_SIZE)
+
+
+def decompress(data, encoding, limit):
+    """
+    :param data: Compressed bytes
+    :param encoding: Content-Encoding token
+    :param limit: Maximum decompressed size
+    :return: The decompressed bytes
+    :raises RequestTooLarge: If it would decompress to more than limit
+    :raises UnsupportedEncoding: For encodings not supported here
+    :raises ValueError: For corrupt data (zlib.error, zstandard.ZstdError)
+    """
+    return open_decompressed(io.BytesIO(data), encoding, limit).read()
+
+
+def open_request_body(request):
+    """
+    The request body as a stream, decompressed according to its
+    Content-Encoding. Reading it doesn't keep a copy on the request, unlike
+    request.body.
+    """
+    encoding = request.headers.get("Content-Encoding", "").strip().lower()
+    return open_decompressed(request, encoding,
+                             compression_setting("MAX_REQUEST_BYTES"))
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        compressor = zlib.compressobj(compression_setting("GZIP_LEVEL"),
+                                      zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == "deflate":
+        return zlib.compress(data, compression_setting("GZIP_LEVEL"))
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(
+            level=compression_setting("ZSTD_LEVEL")
+        ).compress(data)
+    raise UnsupportedEncoding(encoding)
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick a response encoding from an Accept-Encoding header.
+
+    :return: The encoding, or None to send the response as it is
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    available = supported_encodings()
+    for encoding in compression_setting("ENCODINGS"):
+        if encoding not in available:
+            continue
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress_response(view_func):
+    """
+    Decorator for async views. Compresses large responses when the client
+    accepts it.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        response = await view_func(request, *args, **kwargs)
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if response.streaming or response.has_header("Content-Encoding") \
+                or len(response.content) < compression_setting("MIN_SIZE"):
+            return response
+        encoding = negotiate_encoding(
+            request.headers.get("Accept-Encoding", "")
+        )
+        if encoding is None:
+            return response
+        response.content = compress(response.content, encoding)
+        response["Content-Length"] = str(len(response.content))
+        response["Content-Encoding"] = encoding
+        if response.has_header("ETag"):
+            response["ETag"] = representation_etag(response["ETag"],
+                                                   encoding)
+        return response
+
+    return _wrapped_view
@@ -0,0 +1,110 @@
+"""
+Conditional GET (ETag / If-None-Match) for repeated reads.
+
+Versions are opaque tokens kept in the cache next to the thing they
+version, and replaced whenever it changes: job results (version_{job_id},
+set by complete_job) and user profiles (see users.versioning). A response
+built from a version carries it as a strong ETag; a request whose
+If-None-Match names it gets a 304 before any callback or serializer runs.
+
+compress_response appends the content coding to a strong ETag
+("v" -> "v-gzip"), so each representation has its own tag;
+matching ignores that suffix.
+
+Configured by settings.CONDITIONAL_GET.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+
+DEFAULTS = {
+    # how long a final job result stays readable after the job stops
+    "RESULT_TTL": 300,
+    "CACHE_CONTROL": {"private": True, "no_cache": True},
+}
+
+
+def conditional_setting(name):
+    return getattr(settings, "CONDITIONAL_GET", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def new_version():
+    return uuid.uuid4().hex
+
+
+def job_version_key(job_id):
+    return f"version_{job_id}"
+
+
+def bump_job_version(job_id):
+    cache.set(job_version_key(job_id), new_version(),
+              conditional_setting("RESULT_TTL"))
+
+
+def job_etag(job_id):
+    version = cache.get(job_version_key(job_id))
+    if version is None:
+        return None
+    return f'"{version}"'
+
+
+def representation_etag(etag, encoding):
+    """
+    The strong ETag of a content-coded representation.
+    """
+    if etag.startswith("W/"):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _matches(tag, etag):
+    # If-None-Match uses the weak comparison
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    if tag == "*" or tag == etag:
+        return True
+    # a content-coded representation of the same version
+    return tag.startswith(etag[:-1] + "-") and tag.endswith('"')
+
+
+def not_modified(request, etag):
+    """
+    Check a request's If-None-Match against the current version.
+
+    :param request: The request
+    :param etag: The current ETag, or None if there is no version yet
+    :return: A 304 response if the client's copy is current, otherwise None
+    """
+    if etag is None:
+        return None
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return None
+    for tag in parse_etags(header):
+        if _matches(tag, etag):
+            response = HttpResponseNotModified()
+            # the tag of the representation the client holds
+            response["ETag"] = etag if tag == "*" else tag
+            patch_cache_control(response,
+                                **conditional_setting("CACHE_CONTROL"))
+            return response
+    return None
+
+
+def set_conditional_headers(response, etag):
+    """
+    :param response: A response built from the version etag names
+    :param etag: Its ETag, or None to only set Cache-Control
+    :return: The response
+    """
+    if etag is not None:
+        response["ETag"] = etag
+    patch_cache_control(response, **conditional_setting("CACHE_CONTROL"))
+    return response
@@ -1,19 +1,51 @@
 # consumers.py
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
 import json
 import logging
-from core.utils import sanitize_string
+from core.cancellation import (
+    cancel_job,
+    cancel_user_jobs,
+    socket_closed
+)
+from core.codecs import negotiate
+from core.heartbeat import CLOSE_CODE_IDLE, Heartbeat
+from core.outbound import OutboundQueue
+from core.presence import presence
+from core.subscriptions import (
+    group_tag_group_name,
+    interpretation_group_name,
+    job_group_name,
+    mark_subscribed,
+    user_group_name
+)
+from core.profiling import (
+    consumer_profiling_requested,
+    profile_consumer_handler
+)
 
 logger = logging.getLogger(__name__)
 
 
+@database_sync_to_async
+def fetch_group_tag_pks(user):
+    return list(user.group_tags.values_list('pk', flat=True))
+
+
 class JobConsumer(AsyncWebsocketConsumer):
     user = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user_group_name = None
+        self.subscriptions = set()
+        self.tag_groups = []
+        self.outbound = None
+        self.heartbeat = None
+        self.codec = None
+        self.left = False
+        self.profiling = False
 
     async def connect(self):
         self.user = self.scope["user"]
@@ -27,29 +59,89 @@ class JobConsumer(AsyncWebsocketConsumer):
             pass
         else:
             logger.info(f"WS is authenticated: {self.user}")
-            self.user_group_name = f"user_{self.user}"
-            self.user_group_name = sanitize_string(self.user_group_name)
+            self.user_group_name = user_group_name(self.user.email)
             await self.channel_layer.group_add(
                 self.user_group_name,
                 self.channel_name
             )
             logger.info(f"WS user_group_name: {self.user_group_name}")
-            await self.accept()
+            # for results broadcast to a group tag, see core.subscriptions
+            self.tag_groups = [
+                group_tag_group_name(tag_pk)
+                for tag_pk in await fetch_group_tag_pks(self.user)
+            ]
+            for group_name in self.tag_groups:
+                await self.channel_layer.group_add(group_name,
+                                                   self.channel_name)
+            self.profiling = await consumer_profiling_requested(self.scope)
+            self.codec, subprotocol = negotiate(
+                self.scope.get("subprotocols", [])
+            )
+            await self.accept(subprotocol=subprotocol)
+            self.outbound = OutboundQueue(
+                self.send_frame,
+                lambda code: self.close(code=code),
+                self.codec.encode,
+            )
+            self.outbound.start()
+            self.heartbeat = Heartbeat(
+                lambda text: self.send(text_data=text),
+                self.reap,
+            )
+            self.heartbeat.start()
+            presence.connect(self.user.email)
 
-    async def disconnect(self, close_code):
-        # Remove the channel from the group on disconnect
-        if self.user.is_authenticated:
+    async def send_frame(self, frame):
+        if isinstance(frame, bytes):
+            await self.send(bytes_data=frame)
+        else:
+            await self.send(text_data=frame)
+
+    async def leave(self):
+        # Remove the channel from its groups and the presence registry,
+        # once: on disconnect, or earlier when reaped
+        if self.left or self.outbound is None:
+            return
+        self.left = True
+        self.outbound.stop()
+        self.heartbeat.stop()
+        await self.channel_layer.group_discard(
+            self.user_group_name,
+            self.channel_name
+        )
+        for group_name in [*self.subscriptions, *self.tag_groups]:
             await self.channel_layer.group_discard(
-                self.user_group_name,
+                group_name,
                 self.channel_name
             )
+        presence.disconnect(self.user.email)
+        socket_closed(self.user.email)
+
+    async def disconnect(self, close_code):
+        await self.leave()
         try:
             await self.close()
         except Exception:
             print("WS is already closed")
 
+    async def reap(self):
+        # idle for too long, see core.heartbeat
+        await self.leave()
+        await self.close(code=CLOSE_CODE_IDLE)
+
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
+        self.heartbeat.touch(pong=text_data_json.get('type') == 'pong')
+        if text_data_json.get('type') == 'pong':
+            # lets the outbound writer send more, see core.outbound
+            self.outbound.ack()
+            return
+        if text_data_json.get('type') == 'cancel':
+            await self.cancel(text_data_json)
+            return
+        if text_data_json.get('type') in ('subscribe', 'unsubscribe'):
+            await self.subscribe(text_data_json)
+            return
         message = text_data_json['message']
 
         await self.send(text_data=json.dumps({
@@ -57,9 +149,57 @@ class JobConsumer(AsyncWebsocketConsumer):
             f"Received message '{message}' from user '{self.user.email}'"
         }))
 
+    async def subscribe(self, content):
+        # {"type": "subscribe", "job_id": ...} or
+        # {"type": "subscribe", "interpretation_key": ...}, and the same
+        # with "unsubscribe"
+        if 'job_id' in content:
+            group_name = job_group_name(self.user.email,
+                                        content['job_id'])
+        elif 'interpretation_key' in content:
+            group_name = interpretation_group_name(
+                self.user.email, content['interpretation_key']
+            )
+        else:
+            return
+        if content['type'] == 'subscribe':
+            await self.channel_layer.group_add(group_name,
+                                               self.channel_name)
+            self.subscriptions.add(group_name)
+            mark_subscribed(group_name)
+        elif group_name in self.subscriptions:
+            await self.channel_layer.group_discard(group_name,
+                                                   self.channel_name)
+            self.subscriptions.discard(group_name)
+
+    async def cancel(self, content):
+        # {"type": "cancel", "job_id": ...}, or without job_id to cancel
+        # all of the user's jobs
+        job_id = content.get('job_id')
+        if job_id is None:
+            cancelled = await cancel_user_jobs(self.user.email)
+        else:
+            cancelled = await cancel_job(job_id, self.user.email)
+        await self.send(text_data=json.dumps({
+            'type': 'cancelled',
+            'job_id': job_id,
+            'cancelled': cancelled,
+        }))
+
         # Custom handler for sending messages to this consumer
 
+    @profile_consumer_handler
     async def user_message(self, event):
         # logger.info(f"WS received event: {event}")
         message = event['message']
-        await self.send(text_data=json.dumps({"message": message}))
+        # queued, so a slow client doesn't hold up this worker
+        await self.outbound.put({"message": message})
+
+        # a job group is done with once the final result is in
+        if isinstance(message, dict) and message.get('stop', True) is True:
+            group_name = job_group_name(self.user.email,
+                                        message.get('job_id'))
+            if group_name in self.subscriptions:
+                await self.channel_layer.group_discard(group_name,
+                                                       self.channel_name)
+                self.subscriptions.discard(group_name)
@@ -0,0 +1,34 @@
+"""
+SQLite tuning for the production database profile.
+
+Django 5.0 has no SQLite init_command, so configure_sqlite runs
+settings.SQLITE_PRAGMAS on every new SQLite connection (connection_created)
+when settings.DB_PROFILE is "production":
+
+- journal_mode=WAL lets readers run alongside a writer, instead of logins,
+  sign-ups and admin edits blocking every dispatch lookup.
+- synchronous=NORMAL is durable under WAL except on power loss.
+- mmap_size, cache_size and temp_store keep hot pages in memory.
+
+The busy timeout is the sqlite3 "timeout" in DATABASES OPTIONS, and
+connections are kept open by CONN_MAX_AGE, see core/settings.py.
+"""
+
+from django.conf import settings
+
+
+def apply_pragmas(cursor, pragmas):
+    """
+    :param cursor: A DB-API cursor on a SQLite connection
+    :param pragmas: Mapping of PRAGMA name to value
+    """
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != "sqlite" \
+            or getattr(settings, "DB_PROFILE", None) != "production":
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, getattr(settings, "SQLITE_PRAGMAS", {}))
@@ -0,0 +1,280 @@
+"""
+Interpretation email digests.
+
+Users subscribe to interpretations through
+CustomUser.interpretation_keys_for_emails. send_digests groups the
+subscribed, approved users by (interpretation key, scope), the scope being
+what the super-backend tailors an interpretation by: the user's role,
+group tags and interest tags, as the interactive views send them. Then,
+per distinct group:
+
+- the interpretation is fetched once, through the configured transport,
+  and its final result read from the job store (see complete_job);
+- the email is rendered once (templates/emails/interpretation_digest.*);
+- it goes to the group's users as Bcc, BCC_BATCH_SIZE recipients a
+  message.
+
+Every message is sent through one email backend connection, so the work
+grows with the number of distinct groups, not with subscribers. Run it on
+a schedule (cron, a systemd timer) with the send_interpretation_digests
+command. Results are read from the cache, so the command and the web
+workers receiving callbacks must share one (or use the in-process
+transport); the command refuses to run on a process-local cache otherwise.
+
+Configured by settings.INTERPRETATION_DIGESTS.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import render_to_string
+
+from core.callbacks import passthrough_data, set_callbacks
+from core.cancellation import cancel_job, finish_job, register_job
+from core.logs import log_event
+from core.request_logic import prep_request
+from core.views import query_interpretation_host
+from users.models import CustomUser
+
+logger = logging.getLogger(__name__)
+
+# what an interpretation is requested for; tags as sorted tuples of names
+Scope = namedtuple("Scope", ["role", "group_tags", "interest_tags"])
+
+DEFAULTS = {
+    # None for DEFAULT_FROM_EMAIL
+    "FROM_EMAIL": None,
+    "SUBJECT": "{tab_name} digest",
+    "BCC_BATCH_SIZE": 50,
+    # interpretations fetched at once
+    "MAX_IN_FLIGHT": 4,
+    "RESULT_TIMEOUT": 300,
+    "POLL_INTERVAL": 0.5,
+    # rows of the result table shown in the email
+    "SUMMARY_ROWS": 20,
+    # extra super-backend kwargs per interpretation key
+    "INTERPRETATION_KWARGS": {},
+}
+
+
+def digest_setting(name):
+    return getattr(settings, "INTERPRETATION_DIGESTS", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def from_email():
+    return digest_setting("FROM_EMAIL") or settings.DEFAULT_FROM_EMAIL
+
+
+def digest_groups():
+    """
+    Group subscribed users by what their digest would contain, in three
+    queries.
+
+    :return: {(interpretation key, Scope): sorted emails}
+    """
+    subscribed = CustomUser.objects.filter(
+        approved=True, is_active=True,
+        interpretation_keys_for_emails__isnull=False,
+    )
+    keys_through = CustomUser.interpretation_keys_for_emails.through
+
+    users = {}
+    keys = defaultdict(set)
+    for user_id, email, role, key in keys_through.objects.filter(
+        customuser__approved=True, customuser__is_active=True,
+    ).values_list("customuser_id", "customuser__email", "customuser__role",
+                  "interpretationkeysforemail__name"):
+        users[user_id] = (email, role)
+        keys[user_id].add(key)
+
+    tags = {}
+    for field, tag_field in (("group_tags", "grouptag__name"),
+                             ("interest_tags", "interesttag__name")):
+        tags[field] = defaultdict(set)
+        through = getattr(CustomUser, field).through
+        for user_id, tag in through.objects.filter(
+            customuser__in=subscribed
+        ).values_list("customuser_id", tag_field):
+            tags[field][user_id].add(tag)
+
+    groups = defaultdict(list)
+    for user_id, user_keys in keys.items():
+        email, role = users[user_id]
+        scope = Scope(
+            role,
+            tuple(sorted(tags["group_tags"][user_id])),
+            tuple(sorted(tags["interest_tags"][user_id])),
+        )
+        for key in user_keys:
+            groups[(key, scope)].append(email)
+    return {group: sorted(members) for group, members in groups.items()}
+
+
+async def fetch_interpretation(key, scope, semaphore, timeout):
+    """
+    Request one interpretation from the super-backend and wait for its
+    final result.
+
+    :param key: The interpretation_key
+    :param scope: The Scope to request it for
+    :param semaphore: Bounds the interpretations in flight
+    :param timeout: Seconds to wait for the result
+    :return: The result, or None if it failed or timed out
+    """
+    job_id = str(uuid.uuid4())
+    sender = from_email()
+    kwargs = {
+        **digest_setting("INTERPRETATION_KWARGS").get(key, {}),
+        "interpretation_key": key,
+        "user_email": sender,
+        "user_role": scope.role,
+        "user_group_tags": list(scope.group_tags),
+        "user_interest_tags": list(scope.interest_tags),
+    }
+    async with semaphore:
+        await prep_request(job_id, passthrough_data)
+        # so a timed out job can be cancelled
+        register_job(job_id, sender)
+        try:
+            ack = await query_interpretation_host(job_id, **kwargs)
+            if ack is None:
+                return None
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline:
+                # partial results have stop False
+                if cache.get(f"stop_{job_id}") is True:
+                    return cache.get(f"data_{job_id}")
+                await asyncio.sleep(digest_setting("POLL_INTERVAL"))
+            log_event(logger, logging.WARNING, "digest.timeout",
+                      job_id=job_id, interpretation_key=key, scope=scope)
+            await cancel_job(job_id, reason="digest_timeout")
+            return None
+        finally:
+            finish_job(job_id, sender)
+            cache.delete_many([f"{prefix}_{job_id}" for prefix in (
+                "callback", "data", "stop", "version", "final",
+                "extra_payload",
+            )])
+
+
+async def fetch_interpretations(groups, timeout):
+    """
+    :param groups: Keys of digest_groups()
+    :param timeout: Seconds to wait for each result
+    :return: {(key, scope): result or None}
+    """
+    await set_callbacks()
+    semaphore = asyncio.Semaphore(digest_setting("MAX_IN_FLIGHT"))
+    groups = list(groups)
+    results = await asyncio.gather(*(
+        fetch_interpretation(key, scope, semaphore, timeout)
+        for key, scope in groups
+    ))
+    return dict(zip(groups, results))
+
+
+def summary_table(result):
+    """
+    The first SUMMARY_ROWS rows of a result's data_json table, which is in
+    pandas' column orientation ({column: {row: value}}).
+
+    :return: (columns, rows, total row count), or None without a table
+    """
+    try:
+        table = json.loads(result.get("data_json") or "null")
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(table, dict) or not table \
+            or not all(isinstance(v, dict) for v in table.values()):
+        return None
+    columns = list(table)
+    index = list(table[columns[0]])
+    # as text, for the templates' join
+    rows = [
+        ["" if table[column].get(i) is None else str(table[column].get(i))
+         for column in columns]
+        for i in index[:digest_setting("SUMMARY_ROWS")]
+    ]
+    return columns, rows, len(index)
+
+
+def render_digest(key, scope, result):
+    """
+    :return: (subject, text body, html body)
+    """
+    tab_name = result.get("tab_name") or key
+    table = summary_table(result)
+    context = {
+        "interpretation_key": key,
+        "tab_name": tab_name,
+        "group_tags": scope.group_tags,
+        "pages": [
+            page for page in (result.get("pages") or {}).values()
+            if isinstance(page, dict)
+        ],
+        "columns": table[0] if table else None,
+        "rows": table[1] if table else None,
+        "total_rows": table[2] if table else 0,
+    }
+    return (
+        digest_setting("SUBJECT").format(tab_name=tab_name,
+                                         interpretation_key=key),
+        render_to_string("emails/interpretation_digest.txt", context),
+        render_to_string("emails/interpretation_digest.html", context),
+    )
+
+
+def send_digests(dry_run=False, timeout=None):
+    """
+    Fetch, render and send every digest.
+
+    :param dry_run: Fetch and render, but don't send
+    :param timeout: Seconds to wait for each interpretation, RESULT_TIMEOUT
+        by default
+    :return: Counts of users, groups, fetch failures, renders and messages
+    """
+    groups = digest_groups()
+    results = asyncio.run(fetch_interpretations(
+        groups, timeout or digest_setting("RESULT_TIMEOUT")
+    ))
+
+    sender = from_email()
+    batch_size = digest_setting("BCC_BATCH_SIZE")
+    connection = get_connection()
+    messages = []
+    stats = {
+        "users": len({email for members in groups.values()
+                      for email in members}),
+        "groups": len(groups),
+        "failed": 0,
+        "renders": 0,
+    }
+    for (key, scope), members in groups.items():
+        result = results[(key, scope)]
+        if not isinstance(result, dict):
+            stats["failed"] += 1
+            continue
+        subject, text, html = render_digest(key, scope, result)
+        stats["renders"] += 1
+        for i in range(0, len(members), batch_size):
+            message = EmailMultiAlternatives(
+                subject, text, sender, to=[sender],
+                bcc=members[i:i + batch_size], connection=connection,
+            )
+            message.attach_alternative(html, "text/html")
+            messages.append(message)
+
+    stats["messages"] = len(messages)
+    # one connection for all of them
+    stats["sent"] = 0 if dry_run else connection.send_messages(messages)
+    log_event(logger, logging.INFO, "digest.sent", **stats)
+    return stats
@@ -0,0 +1,91 @@
+"""
+Server-driven websocket heartbeats for JobConsumer.
+
+Every PING_INTERVAL seconds the server sends {"type": "ping"}, which
+clients answer with {"type": "pong"}. Any message from the client counts
+as activity. A connection with no activity for IDLE_TIMEOUT seconds
+(sleeping laptop, dead network) is reaped: its group memberships and
+presence are cleaned up straight away, without waiting for the ASGI
+server to notice the dead socket, and it is closed.
+
+Configured by settings.WS_HEARTBEAT.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+
+from core.logs import log_event
+from core.metrics import register_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "PING_INTERVAL": 20,
+    "IDLE_TIMEOUT": 60,
+}
+
+# Close code for reaped connections
+CLOSE_CODE_IDLE = 4000
+
+_counters = Counter()
+_live = set()
+
+
+def heartbeat_setting(name):
+    return getattr(settings, "WS_HEARTBEAT", {}).get(name, DEFAULTS[name])
+
+
+class Heartbeat:
+
+    def __init__(self, send, reap):
+        """
+        :param send: Coroutine function sending one text frame
+        :param reap: Coroutine function called once the connection is idle
+        """
+        self._send = send
+        self._reap = reap
+        self._task = None
+        self.last_seen = time.monotonic()
+
+    def start(self):
+        _live.add(self)
+        if heartbeat_setting("ENABLED"):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        _live.discard(self)
+        if self._task is not None and \
+                self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._task = None
+
+    def touch(self, pong=False):
+        self.last_seen = time.monotonic()
+        if pong:
+            _counters["pongs"] += 1
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(heartbeat_setting("PING_INTERVAL"))
+            idle = time.monotonic() - self.last_seen
+            if idle > heartbeat_setting("IDLE_TIMEOUT"):
+                _counters["reaped"] += 1
+                log_event(logger, logging.INFO, "heartbeat.reap",
+                          idle_seconds=idle)
+                await self._reap()
+                return
+            await self._send(json.dumps({"type": "ping"}))
+            _counters["pings"] += 1
+
+
+def stats():
+    return {"live": len(_live), **_counters}
+
+
+register_stats("heartbeat", stats)
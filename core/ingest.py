@@ -0,0 +1,105 @@
+"""
+Streaming ingestion of super-backend callback bodies.
+
+request.body reads the whole body into bytes and keeps them on the request
+for as long as it lives, on top of the parsed result. load_json_body
+parses from the request stream instead, through core.compression's
+decompressing reader, so the raw (and decompressed) bytes are never held
+as one copy next to the result:
+
+- Under ASGI, Django already spools request bodies larger than
+  FILE_UPLOAD_MAX_MEMORY_SIZE to a temporary file, so that setting is the
+  spool threshold for large callbacks.
+- With the optional ijson package, JSON is parsed incrementally from the
+  stream; without it, the decompressed text is read once and parsed, and
+  released as soon as it is.
+
+As Django's ASGI handler receives the whole body before any view runs,
+CallbackGate (wrapped around the HTTP application in core/asgi.py) answers
+callbacks for unknown jobs, which have no callback_{job_id} record, before
+their bodies are received at all. The endpoint is unauthenticated, and
+bodies may decompress up to MAX_REQUEST_BYTES.
+"""
+
+import json
+from urllib.parse import parse_qs
+
+from django.core.cache import cache
+from django.urls import reverse
+
+from core.compression import open_request_body
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+
+def load_json_body(request):
+    """
+    Parse a request's JSON body from its stream.
+
+    :param request: The request; its body must not have been read
+    :return: The parsed body
+    :raises RequestTooLarge: If the body decompresses past
+        HTTP_COMPRESSION["MAX_REQUEST_BYTES"]
+    :raises UnsupportedEncoding: For an unsupported Content-Encoding
+    :raises ValueError: For an invalid body
+    """
+    stream = open_request_body(request)
+    if ijson is not None:
+        try:
+            return next(ijson.items(stream, "", use_float=True))
+        except (ijson.JSONError, StopIteration) as e:
+            raise ValueError(str(e))
+    return json.loads(stream.read())
+
+
+class CallbackGate:
+    """
+    ASGI middleware rejecting callback_view requests for unknown jobs with
+    the view's own 400, without receiving their bodies.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._path = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            if self._path is None:
+                self._path = reverse("callback_view")
+            path = scope["path"][len(scope.get("root_path", "")):]
+            if path == self._path:
+                query = parse_qs(scope.get("query_string", b"").decode())
+                job_id = query.get("job_id", [None])[-1]
+                if job_id is None \
+                        or cache.get(f"callback_{job_id}") is None:
+                    await self._reject(send, job_id)
+                    return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, job_id):
+        body = json.dumps(
+            {"status": "Invalid request ID: " + str(job_id)}
+        ).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 400,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def merge_params(data, params):
+    """
+    Add query params to a parsed callback body in place, without copying
+    it. Values in the body win, as they did with {**params, **body}.
+    """
+    for key, value in params.items():
+        data.setdefault(key, value)
+    return data
@@ -0,0 +1,249 @@
+"""
+Logging helpers for the request hot paths.
+
+- LogFields / log_event: structured key=value fields that are only rendered
+  if a handler actually emits the record, with each field capped in size
+  (reprlib limits, so huge payloads are never fully stringified).
+- SamplingFilter: per-logger sampling of DEBUG/INFO records, configured by
+  LOGGING_SAMPLE_RATES. WARNING and above are never sampled out.
+- install_queue_logging: moves the handlers of the given loggers behind a
+  bounded queue, so formatting and I/O happen on a listener thread instead
+  of the event loop. Records are dropped (and counted) if the queue is full
+  rather than blocking the loop. Mutable containers among the arguments
+  are shallow-copied when queued, so the caller can't change what is
+  rendered later.
+"""
+
+import atexit
+import copy
+import logging
+import queue
+import random
+import reprlib
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+_listeners = []
+
+# a _CappedRepr per thread, as it keeps a budget while rendering
+_reprs = threading.local()
+
+# copied when a record is queued, see DeferredQueueHandler
+_MUTABLE_CONTAINERS = (dict, list, set, deque, bytearray)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _snapshot(value):
+    """
+    :return: A shallow copy of value if it is a mutable container (or
+        LogFields), else value itself
+    """
+    if isinstance(value, LogFields):
+        return value.snapshot()
+    # QueryDicts (request.GET, ...) are immutable unless copied
+    if isinstance(value, _MUTABLE_CONTAINERS) \
+            and getattr(value, "_mutable", True):
+        return copy.copy(value)
+    return value
+
+
+class _CappedRepr(reprlib.Repr):
+    """
+    reprlib.Repr that also caps dict/list subclasses (QueryDict, etc.),
+    which reprlib would otherwise render in full via builtins.repr.
+
+    With a budget, it stops rendering ("...") once that many characters of
+    non-container values are rendered: the text is cut at
+    LOGGING_FIELD_MAX_CHARS anyway, so what's skipped would never show.
+    """
+
+    _containers = (dict, list, tuple, set, frozenset, deque)
+
+    budget = None
+
+    def repr1(self, x, level):
+        if self.budget is not None and self.budget <= 0:
+            return "..."
+        if isinstance(x, dict) and type(x) is not dict:
+            return self.repr_dict(x, level)
+        if isinstance(x, list) and type(x) is not list:
+            return self.repr_list(x, level)
+        text = super().repr1(x, level)
+        if self.budget is not None and not isinstance(x, self._containers):
+            self.budget -= len(text)
+        return text
+
+
+def _capped_repr():
+    capped = _CappedRepr()
+    capped.maxlevel = 3
+    capped.maxdict = 20
+    capped.maxlist = 20
+    capped.maxstring = 200
+    capped.maxother = 200
+    return capped
+
+
+class LogFields:
+    """
+    Lazily rendered structured log fields.
+
+    Pass as a %s argument so rendering only happens when the record is
+    formatted (on the queue listener thread when queue logging is on).
+    DeferredQueueHandler snapshots the mutable fields before queueing.
+    """
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, **fields):
+        self.event = event
+        self.fields = fields
+
+    @staticmethod
+    def _render(value):
+        if isinstance(value, str):
+            return value
+        capped = getattr(_reprs, "capped", None)
+        if capped is None:
+            capped = _reprs.capped = _capped_repr()
+        capped.budget = _setting("LOGGING_FIELD_MAX_CHARS", 500)
+        return capped.repr(value)
+
+    def snapshot(self):
+        """
+        :return: LogFields with shallow copies of the mutable container
+            values, still rendered later
+        """
+        return LogFields(self.event, **{
+            key: _snapshot(value) for key, value in self.fields.items()
+        })
+
+    def __str__(self):
+        max_chars = _setting("LOGGING_FIELD_MAX_CHARS", 500)
+        parts = [self.event]
+        for key, value in self.fields.items():
+            text = self._render(value)
+            if len(text) > max_chars:
+                text = text[:max_chars] + "...(truncated)"
+            parts.append(f"{key}={text}")
+        return " ".join(parts)
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Log a structured event without building any strings unless the logger
+    is enabled for the level.
+
+    :param logger: The logger to log to
+    :param level: logging level, e.g. logging.INFO
+    :param event: Short event name
+    :param fields: Structured fields, rendered lazily and capped
+    :return: None
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, "%s", LogFields(event, **fields))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of DEBUG/INFO records per logger name. Rates are looked
+    up by the longest matching logger name prefix in LOGGING_SAMPLE_RATES.
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = rates if rates is not None else \
+            _setting("LOGGING_SAMPLE_RATES", {})
+        self._resolved = {}
+
+    def rate_for(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate = 1.0
+            best = -1
+            for prefix, prefix_rate in self.rates.items():
+                if (name == prefix or name.startswith(prefix + ".")) \
+                        and len(prefix) > best:
+                    rate, best = prefix_rate, len(prefix)
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rate_for(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler that leaves formatting to the listener thread and never
+    blocks the caller when the queue is full.
+
+    Records are snapshotted when queued, as the caller may change what they
+    reference (kwargs dicts, ...) before the listener gets to them: mutable
+    containers among the arguments and LogFields values are shallow-copied,
+    which costs far less than rendering them. Other values are queued as
+    they are.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = _snapshot(record.msg)
+        if isinstance(record.args, tuple):
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        else:
+            # None, or the mapping of a %(name)s format
+            record.args = _snapshot(record.args)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def install_queue_logging(*loggers):
+    """
+    Move the handlers of the given loggers behind a DeferredQueueHandler
+    served by a QueueListener thread. Loggers that are already queued, or
+    have no handlers, are left alone.
+
+    :param loggers: logging.Logger instances (e.g. root, logging_mp's)
+    :return: None
+    """
+    for logger in loggers:
+        handlers = [
+            h for h in logger.handlers
+            if not isinstance(h, DeferredQueueHandler)
+        ]
+        if not handlers or len(handlers) != len(logger.handlers):
+            continue
+
+        log_queue = queue.Queue(_setting("LOGGING_QUEUE_SIZE", 10000))
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter())
+        listener = QueueListener(
+            log_queue, *handlers, respect_handler_level=True
+        )
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+        listener.start()
+        _listeners.append(listener)
+
+
+@atexit.register
+def _stop_listeners():
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,78 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.bench.scale import add_scale_arguments, scale_from_options
+from core.compression import (
+    compress,
+    compression_setting,
+    decompress,
+    supported_encodings
+)
+from core.payloads import generate_interpretation_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure bytes on the wire and CPU cost of each supported "
+        "Content-Encoding for callback bodies and polling responses, on "
+        "generated interpretation payloads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeats", type=int, default=10)
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        payload = generate_interpretation_payload(
+            **scale_from_options(options)
+        )
+        # check_request_status responds with the passthrough result
+        body = json.dumps({"status": "Response processed",
+                           "result": payload, "stop": True}).encode()
+
+        results = {"identity": {"bytes": len(body)}}
+        for encoding in supported_encodings():
+            results[encoding] = self._run(body, encoding,
+                                          options["repeats"])
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(
+            f"{len(body)} byte body, MIN_SIZE "
+            f"{compression_setting('MIN_SIZE')} bytes"
+        )
+        for encoding, result in results.items():
+            line = (f"{encoding:>10}: {result['bytes']:>10} bytes "
+                    f"({result['bytes'] / len(body):>6.1%})")
+            if "compress_ms" in result:
+                line += (f", compress {result['compress_ms']:8.2f}ms, "
+                         f"decompress {result['decompress_ms']:8.2f}ms, "
+                         f"{result['compress_mb_per_second']:7.1f} MB/s")
+            self.stdout.write(line)
+
+    def _run(self, body, encoding, repeats):
+        compress_times = []
+        decompress_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            data = compress(body, encoding)
+            compress_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            decompress(data, encoding, len(body))
+            decompress_times.append(time.perf_counter() - start)
+        compress_seconds = statistics.median(compress_times)
+        return {
+            "bytes": len(data),
+            "compress_ms": compress_seconds * 1000,
+            "decompress_ms": statistics.median(decompress_times) * 1000,
+            "compress_mb_per_second":
+                len(body) / compress_seconds / 1024 / 1024,
+        }
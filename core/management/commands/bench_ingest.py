@@ -0,0 +1,92 @@
+import json
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.bench.scale import add_scale_arguments, scale_from_options
+from core.compression import compress, decompress
+from core.ingest import load_json_body, merge_params
+from core.payloads import generate_interpretation_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure peak Python memory and time of parsing a callback body: "
+        "request.body + json.loads + merged copy (the old callback_view "
+        "path) against streaming ingestion (core.ingest), on generated "
+        "interpretation payloads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--encoding", default="identity",
+                            choices=["identity", "gzip", "deflate", "zstd"])
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        payload = generate_interpretation_payload(
+            **scale_from_options(options)
+        )
+        body = json.dumps(payload).encode()
+        del payload
+        if options["encoding"] != "identity":
+            body = compress(body, options["encoding"])
+
+        factory = RequestFactory()
+
+        def make_request():
+            headers = {}
+            if options["encoding"] != "identity":
+                headers["Content-Encoding"] = options["encoding"]
+            return factory.post(
+                "/callback_view/?job_id=bench&user_email=bench@example.com",
+                data=body, content_type="application/json", headers=headers,
+            )
+
+        results = {
+            "body_bytes": len(body),
+            "request_body": self._measure(make_request, self._old_path),
+            "streaming": self._measure(make_request, self._new_path),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f"{len(body)} byte {options['encoding']} body")
+        for name in ("request_body", "streaming"):
+            result = results[name]
+            self.stdout.write(
+                f"{name:>14}: peak {result['peak_bytes'] / 1024 / 1024:8.1f}"
+                f" MiB, {result['seconds'] * 1000:8.1f}ms"
+            )
+
+    @staticmethod
+    def _old_path(request):
+        # request.body is refused past DATA_UPLOAD_MAX_MEMORY_SIZE
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=None):
+            body = request.body
+        encoding = request.headers.get("Content-Encoding", "identity")
+        if encoding != "identity":
+            body = decompress(body, encoding, float("inf"))
+        body_data = json.loads(body)
+        return {**request.GET.dict(), **body_data}
+
+    @staticmethod
+    def _new_path(request):
+        return merge_params(load_json_body(request), request.GET.dict())
+
+    def _measure(self, make_request, parse):
+        request = make_request()
+        tracemalloc.start()
+        start = time.perf_counter()
+        data = parse(request)
+        seconds = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del data, request
+        return {"peak_bytes": peak, "seconds": seconds}
@@ -0,0 +1,101 @@
+import json
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from django.core.management.base import BaseCommand
+
+from core.bench.scale import add_scale_arguments, scale_from_options
+from core.logs import DeferredQueueHandler, SamplingFilter, log_event
+from core.payloads import generate_interpretation_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure caller-side logging cost of the hot path log statements: "
+        "eager string building with a synchronous file handler versus "
+        "lazy structured fields behind the queue handler."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=5000)
+        parser.add_argument("--sample-rate", type=float, default=0.1)
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        payload = generate_interpretation_payload(
+            **scale_from_options(options)
+        )
+
+        records = options["records"]
+        results = {
+            "eager_sync": self._run(records, payload, eager=True),
+            "lazy_queue": self._run(records, payload, queued=True),
+            "lazy_queue_sampled": self._run(
+                records, payload, queued=True,
+                sample_rate=options["sample_rate"]
+            ),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>20}: {result['records_per_second']:>12.0f} rec/s "
+                f"on the caller, drained in {result['drain_seconds']:.3f}s"
+            )
+
+    def _run(self, records, payload, eager=False, queued=False,
+             sample_rate=1.0):
+        logger = logging.getLogger(f"bench_logging.{id(payload)}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            file_handler = logging.FileHandler(os.path.join(tmp, "bench.log"))
+            file_handler.setFormatter(
+                logging.Formatter("%(asctime)s %(name)s %(message)s")
+            )
+            listener = None
+            if queued:
+                queue_handler = DeferredQueueHandler(queue.Queue(records))
+                queue_handler.addFilter(
+                    SamplingFilter({logger.name: sample_rate})
+                )
+                listener = QueueListener(queue_handler.queue, file_handler)
+                listener.start()
+                logger.addHandler(queue_handler)
+            else:
+                logger.addHandler(file_handler)
+
+            start = time.perf_counter()
+            for i in range(records):
+                if eager:
+                    logger.info("callback_view: " + str(i) + " kwargs: "
+                                + str(payload))
+                else:
+                    log_event(logger, logging.INFO, "callback_view",
+                              job_id=i, kwargs=payload)
+            caller_seconds = time.perf_counter() - start
+
+            if listener is not None:
+                listener.stop()
+            drain_seconds = time.perf_counter() - start
+
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+            file_handler.close()
+
+        return {
+            "records": records,
+            "caller_seconds": caller_seconds,
+            "records_per_second": records / caller_seconds,
+            "drain_seconds": drain_seconds,
+        }
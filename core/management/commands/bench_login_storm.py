@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+
+from core.metrics import summarise
+from core.views import fetch_user_group_tags
+from users.forms import LoginForm
+from users.hashing import validate_form
+from users.models import CustomUser
+
+PASSWORD = "bench-login-storm"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the latency of the ORM calls async views make "
+        "(fetch_user_group_tags, through sync_to_async) while a storm of "
+        "logins is validated: on the shared sync thread, as the sync login "
+        "view was run under ASGI, and in the password hashing pool "
+        "(users/hashing.py). Creates a temporary user in the configured "
+        "database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=50,
+                            help="Concurrent logins in the storm")
+        parser.add_argument("--probe-interval-ms", type=float, default=20)
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        user = CustomUser.objects.create_user(
+            "Bench", "Login", f"bench-login-{uuid.uuid4().hex}@example.com",
+            CustomUser.Role.USER, PASSWORD, approved=True,
+        )
+        try:
+            # one IP per login, so the per-IP cap doesn't shed the storm
+            with override_settings(PASSWORD_HASHING={
+                "MAX_CONCURRENT_PER_IP": options["logins"]
+            }):
+                results = {
+                    mode: asyncio.run(self._run(mode, user, options))
+                    for mode in ("idle", "shared_thread", "hashing_pool")
+                }
+        finally:
+            user.delete()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for mode, result in results.items():
+            probe = result["probe"]
+            line = (f"{mode:>14}: probe p50 {probe['p50_ms']:8.2f}ms, "
+                    f"p99 {probe['p99_ms']:8.2f}ms, "
+                    f"max {probe['max_ms']:8.2f}ms")
+            if "storm_seconds" in result:
+                line += (f"; {options['logins']} logins in "
+                         f"{result['storm_seconds']:.2f}s")
+            self.stdout.write(line)
+
+    async def _run(self, mode, user, options):
+        factory = RequestFactory()
+
+        async def login(i):
+            request = factory.post("/login/", {"username": user.email,
+                                               "password": PASSWORD},
+                                   REMOTE_ADDR="10.0.0.1")
+            form = LoginForm(data=request.POST)
+            if mode == "shared_thread":
+                valid = await sync_to_async(form.is_valid)()
+            else:
+                valid = await validate_form(request, form)
+            assert valid, form.errors
+
+        probes = []
+        stop = asyncio.Event()
+
+        async def probe():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await fetch_user_group_tags(user)
+                probes.append(time.perf_counter() - start)
+                await asyncio.sleep(options["probe_interval_ms"] / 1000)
+
+        prober = asyncio.create_task(probe())
+        result = {}
+        if mode == "idle":
+            await asyncio.sleep(1)
+        else:
+            start = time.perf_counter()
+            await asyncio.gather(*(login(i)
+                                   for i in range(options["logins"])))
+            result["storm_seconds"] = time.perf_counter() - start
+        stop.set()
+        await prober
+        result["probe"] = summarise(probes)
+        return result
@@ -0,0 +1,226 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.db import apply_pragmas
+from core.metrics import summarise
+from users.models import CustomUser, GroupTag, InterestTag
+
+# sqlite3's own busy timeout, which Django uses without OPTIONS
+DEFAULT_TIMEOUT = 5.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure read/write contention on SQLite: reader threads doing "
+        "dispatch profile lookups (user, group tags, interest tags) against "
+        "writer threads doing logins (last_login) and admin edits (role and "
+        "group tags), under Django's default settings and under the "
+        "production profile (SQLITE_PRAGMAS, see core/db.py). Runs on a "
+        "temporary migrated database, not the configured one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--duration", type=float, default=5,
+                            help="Seconds per profile")
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--tags", type=int, default=20)
+        parser.add_argument("--timeout", type=float, default=20,
+                            help="Busy timeout of the production profile")
+        parser.add_argument("--profile",
+                            choices=["default", "production", "both"],
+                            default="both")
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("bench_sqlite needs a SQLite database")
+
+        profiles = {
+            "default": ({"journal_mode": "DELETE"}, DEFAULT_TIMEOUT),
+            "production": (getattr(settings, "SQLITE_PRAGMAS", {}),
+                           options["timeout"]),
+        }
+        if options["profile"] != "both":
+            profiles = {options["profile"]: profiles[options["profile"]]}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.sqlite3")
+            connection.settings_dict["TEST"]["NAME"] = path
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False
+            )
+            try:
+                emails = self._seed(options["users"], options["tags"])
+                connection.close()
+                results = {
+                    name: self._run(path, pragmas, timeout, emails, options)
+                    for name, (pragmas, timeout) in profiles.items()
+                }
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(f"{name}:")
+            for kind in ("read", "login", "admin_edit"):
+                stats = result[kind]
+                self.stdout.write(
+                    f"  {kind:>10}: {stats['ops_per_second']:8.1f}/s, "
+                    f"p50 {stats.get('p50_ms', 0):7.2f}ms, "
+                    f"p99 {stats.get('p99_ms', 0):8.2f}ms, "
+                    f"{stats['locked']} locked"
+                )
+
+    @staticmethod
+    def _seed(users, tags):
+        group_tags = GroupTag.objects.bulk_create(
+            GroupTag(name=f"group-{i}") for i in range(tags)
+        )
+        interest_tags = InterestTag.objects.bulk_create(
+            InterestTag(name=f"interest-{i}") for i in range(tags)
+        )
+        password = make_password("bench")
+        created = CustomUser.objects.bulk_create(
+            CustomUser(email=f"bench-{i}@example.com", first_name="Bench",
+                       last_name=str(i), password=password, approved=True,
+                       role=CustomUser.Role.USER)
+            for i in range(users)
+        )
+        rng = random.Random(0)
+        for user in created:
+            user.group_tags.set(rng.sample(group_tags, 3))
+            user.interest_tags.set(rng.sample(interest_tags, 3))
+        return [user.email for user in created]
+
+    def _run(self, path, pragmas, timeout, emails, options):
+        user_table = CustomUser._meta.db_table
+        group_through = CustomUser.group_tags.through._meta.db_table
+        interest_through = CustomUser.interest_tags.through._meta.db_table
+        queries = {
+            "user": f'SELECT * FROM "{user_table}" WHERE "email" = ?',
+            "group_tags": (
+                f'SELECT t."name" FROM "{GroupTag._meta.db_table}" t '
+                f'JOIN "{group_through}" m ON m."grouptag_id" = t."id" '
+                f'JOIN "{user_table}" u ON u."id" = m."customuser_id" '
+                f'WHERE u."email" = ?'
+            ),
+            "interest_tags": (
+                f'SELECT t."name" FROM "{InterestTag._meta.db_table}" t '
+                f'JOIN "{interest_through}" m ON m."interesttag_id" = t."id" '
+                f'JOIN "{user_table}" u ON u."id" = m."customuser_id" '
+                f'WHERE u."email" = ?'
+            ),
+            "login": (
+                f'UPDATE "{user_table}" SET "last_login" = ? WHERE "id" = ?'
+            ),
+            "role": f'UPDATE "{user_table}" SET "role" = ? WHERE "id" = ?',
+            "clear_tags": (
+                f'DELETE FROM "{group_through}" WHERE "customuser_id" = ?'
+            ),
+            "add_tag": (
+                f'INSERT INTO "{group_through}" ("customuser_id", '
+                f'"grouptag_id") VALUES (?, ?)'
+            ),
+        }
+        user_ids = list(range(1, len(emails) + 1))
+        tag_ids = list(range(1, options["tags"] + 1))
+
+        latencies = {"read": [], "login": [], "admin_edit": []}
+        locked = {"read": 0, "login": 0, "admin_edit": 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def connect():
+            db = sqlite3.connect(path, timeout=timeout, isolation_level=None,
+                                 check_same_thread=False)
+            apply_pragmas(db.cursor(), pragmas)
+            return db
+
+        def read(db, rng):
+            email = rng.choice(emails)
+            db.execute(queries["user"], (email,)).fetchall()
+            db.execute(queries["group_tags"], (email,)).fetchall()
+            db.execute(queries["interest_tags"], (email,)).fetchall()
+            return "read"
+
+        def write(db, rng):
+            user_id = rng.choice(user_ids)
+            # Django's atomic() opens a deferred transaction
+            db.execute("BEGIN")
+            try:
+                if rng.random() < 0.8:
+                    kind = "login"
+                    db.execute(queries["login"], (time.time(), user_id))
+                else:
+                    kind = "admin_edit"
+                    db.execute(queries["role"],
+                               (rng.choice(["USER", "ADMIN"]), user_id))
+                    db.execute(queries["clear_tags"], (user_id,))
+                    for tag_id in rng.sample(tag_ids, 3):
+                        db.execute(queries["add_tag"], (user_id, tag_id))
+                db.execute("COMMIT")
+            except sqlite3.OperationalError:
+                db.execute("ROLLBACK")
+                raise
+            return kind
+
+        def worker(operation, seed):
+            rng = random.Random(seed)
+            db = connect()
+            try:
+                while not stop.is_set():
+                    start = time.perf_counter()
+                    try:
+                        kind = operation(db, rng)
+                    except sqlite3.OperationalError as e:
+                        if "locked" not in str(e) and "busy" not in str(e):
+                            raise
+                        kind = "read" if operation is read else "login"
+                        with lock:
+                            locked[kind] += 1
+                        continue
+                    with lock:
+                        latencies[kind].append(time.perf_counter() - start)
+            finally:
+                db.close()
+
+        # set the journal mode once, before the workers contend for it
+        connect().close()
+        threads = [
+            threading.Thread(target=worker, args=(read, i))
+            for i in range(options["readers"])
+        ] + [
+            threading.Thread(target=worker, args=(write, 1000 + i))
+            for i in range(options["writers"])
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        result = {}
+        for kind, values in latencies.items():
+            result[kind] = {
+                **summarise(values),
+                "ops_per_second": len(values) / options["duration"],
+                "locked": locked[kind],
+            }
+        return result
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+from core.metrics import summarise
+from core.bench.stub_host import StubInterpretationHost
+from core.transports import (
+    HTTPTransport,
+    InProcessTransport,
+    UnixSocketTransport,
+)
+
+
+async def _no_delivery(payload, params):
+    return None
+
+
+async def _ack(job_id, **kwargs):
+    return {"status": "accepted", "job_id": job_id}
+
+
+class _PerRequestClientTransport(HTTPTransport):
+    """
+    A fresh client (and TCP connection) per submission, for comparison
+    with the pooled transports.
+    """
+
+    async def submit(self, job_id, **kwargs):
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                self.url, json={"job_id": job_id, **kwargs}
+            )
+        response.raise_for_status()
+        return response.json()
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare job submission latency across interpretation host "
+        "transports (per-request HTTP, pooled HTTP, Unix domain socket, "
+        "in-process) against local stub hosts with no added latency."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--submissions", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=1)
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        results = asyncio.run(self._run(options))
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>20}: p50 {result['p50_ms']:.3f}ms "
+                f"p95 {result['p95_ms']:.3f}ms p99 {result['p99_ms']:.3f}ms"
+            )
+
+    async def _run(self, options):
+        kwargs = {"interpretation_key": "TransportBench"}
+        with tempfile.TemporaryDirectory() as tmp:
+            uds_path = os.path.join(tmp, "stub.sock")
+            tcp_stub = await StubInterpretationHost(
+                _no_delivery, latency=0, payload={}
+            ).start()
+            uds_stub = await StubInterpretationHost(
+                _no_delivery, latency=0, payload={}, uds_path=uds_path
+            ).start()
+            transports = {
+                "http_per_request": _PerRequestClientTransport(
+                    URL=tcp_stub.url
+                ),
+                "http_pooled": HTTPTransport(URL=tcp_stub.url),
+                "unix_socket_pooled": UnixSocketTransport(PATH=uds_path),
+                "in_process": InProcessTransport(HANDLER=_ack),
+            }
+            results = {}
+            try:
+                for name, transport in transports.items():
+                    results[name] = await self._measure(
+                        transport, options, kwargs
+                    )
+                    await transport.close()
+            finally:
+                await tcp_stub.close()
+                await uds_stub.close()
+        return results
+
+    async def _measure(self, transport, options, kwargs):
+        # warm up connections
+        await transport.submit("warmup", **kwargs)
+        durations = []
+        counter = iter(range(options["submissions"]))
+
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                await transport.submit(f"bench-{i}", **kwargs)
+                durations.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker()
+                               for _ in range(options["concurrency"])))
+        return summarise(durations)
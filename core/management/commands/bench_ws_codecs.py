@@ -0,0 +1,81 @@
+import json
+import os
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.bench.scale import add_scale_arguments, scale_from_options
+from core.codecs import available_codecs
+from core.payloads import generate_interpretation_payload
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the websocket subprotocols on a generated interpretation "
+        "payload: encode time, frame size and decode time. Decoding is "
+        "timed in Python; use --dump to write the frames out for a browser "
+        "decode benchmark."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeats", type=int, default=20)
+        parser.add_argument("--dump", metavar="DIR",
+                            help="Write one encoded frame per subprotocol "
+                                 "to DIR")
+        parser.add_argument("--json", action="store_true",
+                            help="Print machine-readable results")
+        add_scale_arguments(parser)
+
+    def handle(self, *args, **options):
+        payload = generate_interpretation_payload(
+            **scale_from_options(options)
+        )
+        # what JobConsumer.user_message queues
+        message = {"message": payload}
+
+        results = {}
+        for subprotocol, codec in available_codecs().items():
+            results[subprotocol] = self._run(codec, message,
+                                             options["repeats"])
+            if options["dump"]:
+                os.makedirs(options["dump"], exist_ok=True)
+                frame = codec.encode(message)
+                if isinstance(frame, str):
+                    frame = frame.encode()
+                with open(os.path.join(options["dump"], subprotocol),
+                          "wb") as f:
+                    f.write(frame)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        baseline = results["sentinel.json"]["frame_bytes"]
+        for subprotocol, result in results.items():
+            self.stdout.write(
+                f"{subprotocol:>22}: {result['frame_bytes']:>10} bytes "
+                f"({result['frame_bytes'] / baseline:>5.1%}), "
+                f"encode {result['encode_ms']:8.2f}ms, "
+                f"decode {result['decode_ms']:8.2f}ms"
+            )
+
+    def _run(self, codec, message, repeats):
+        encode_times = []
+        decode_times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            frame = codec.encode(message)
+            encode_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            decoded = codec.decode(frame)
+            decode_times.append(time.perf_counter() - start)
+        if decoded != message:
+            raise AssertionError(f"{codec.subprotocol} did not round trip")
+        return {
+            "frame_bytes": len(frame.encode() if isinstance(frame, str)
+                               else frame),
+            "encode_ms": statistics.median(encode_times) * 1000,
+            "decode_ms": statistics.median(decode_times) * 1000,
+        }
@@ -0,0 +1,313 @@
+import asyncio
+import json
+import sys
+import time
+import uuid
+from importlib import import_module
+
+import django
+import httpx
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY,
+    HASH_SESSION_KEY,
+    SESSION_KEY,
+)
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from core.bench.stats import JobTracker
+from core.bench.scale import add_scale_arguments, scale_from_options
+from core.metrics import collect_stats
+from core.transports import get_transport
+from core.bench.stub_host import (
+    StubInterpretationHost,
+    asgi_deliverer,
+    http_deliverer,
+    load_stub_payload,
+)
+from users.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end load test of the interpretation request path against a "
+        "local stub super-backend: async_interpretations_view -> stub ack -> "
+        "callback_view -> group_send -> JobConsumer (websocket clients) or "
+        "check_request_status (polling clients). Runs the ASGI application "
+        "in-process and creates temporary approved users in the configured "
+        "database. Reports throughput and p50/p95/p99 latency per stage."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--jobs-per-user", type=int, default=5)
+        parser.add_argument("--mode", choices=["ws", "poll", "both"],
+                            default="ws",
+                            help="Client type; 'both' splits users evenly")
+        parser.add_argument("--latency-ms", type=float, default=50)
+        parser.add_argument("--jitter-ms", type=float, default=0)
+        parser.add_argument("--error-rate", type=float, default=0.0)
+        parser.add_argument("--payload-kb", type=int, default=0,
+                            help="Pad stub payloads to this size")
+        add_scale_arguments(parser)
+        parser.add_argument("--think-ms", type=float, default=0,
+                            help="Pause between a user's jobs")
+        parser.add_argument("--poll-interval-ms", type=float, default=100)
+        parser.add_argument("--timeout", type=float, default=30,
+                            help="Per-job timeout in seconds")
+        parser.add_argument("--output", help="Write JSON results here")
+        parser.add_argument("--keep-users", action="store_true")
+        parser.add_argument("--admission-control", action="store_true",
+                            help="Keep rate limits on (429s are counted "
+                                 "as rejected)")
+        parser.add_argument("--stub-only", action="store_true",
+                            help="Only run the stub host, posting callbacks "
+                                 "to --callback-url, until interrupted")
+        parser.add_argument("--stub-port", type=int, default=0)
+        parser.add_argument("--callback-url",
+                            default="http://localhost:8000/callback_view/")
+        parser.add_argument("--callback-encoding",
+                            choices=["identity", "gzip", "deflate", "zstd"],
+                            default="identity",
+                            help="Content-Encoding of stub callbacks")
+
+    def handle(self, *args, **options):
+        if options["stub_only"]:
+            asyncio.run(self._run_stub_only(options))
+            return
+
+        run_id = uuid.uuid4().hex[:8]
+        users, sessions = self._create_users(run_id, options["users"])
+        try:
+            results = asyncio.run(self._run(options, sessions))
+        finally:
+            if not options["keep_users"]:
+                self._delete_users(users, sessions)
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def _create_users(self, run_id, count):
+        CustomUser.objects.bulk_create([
+            CustomUser(
+                email=f"loadtest-{run_id}-{i}@loadtest.invalid",
+                first_name="Load",
+                last_name=f"Test {i}",
+                password=make_password(None),
+                role=CustomUser.Role.USER,
+                approved=True,
+            )
+            for i in range(count)
+        ])
+        users = list(CustomUser.objects.filter(
+            email__startswith=f"loadtest-{run_id}-"
+        ))
+
+        SessionStore = import_module(settings.SESSION_ENGINE).SessionStore
+        sessions = []
+        for user in users:
+            session = SessionStore()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            sessions.append(session)
+        return users, sessions
+
+    def _delete_users(self, users, sessions):
+        for session in sessions:
+            session.delete()
+        CustomUser.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+    async def _run_stub_only(self, options):
+        stub = StubInterpretationHost(
+            http_deliverer(options["callback_url"],
+                           options["callback_encoding"]),
+            latency=options["latency_ms"] / 1000,
+            jitter=options["jitter_ms"] / 1000,
+            error_rate=options["error_rate"],
+            payload=load_stub_payload(options["payload_kb"],
+                                      **scale_from_options(options)),
+            port=options["stub_port"],
+        )
+        await stub.start()
+        self.stdout.write(
+            f"Stub interpretation host listening on {stub.url}, "
+            f"calling back {options['callback_url']}"
+        )
+        await asyncio.Event().wait()
+
+    async def _run(self, options, sessions):
+        from core.asgi import application
+
+        tracker = JobTracker()
+        transport = httpx.ASGITransport(app=application)
+        callback_client = httpx.AsyncClient(
+            transport=transport, base_url="http://localhost"
+        )
+        stub = StubInterpretationHost(
+            asgi_deliverer(callback_client, options["callback_encoding"]),
+            latency=options["latency_ms"] / 1000,
+            jitter=options["jitter_ms"] / 1000,
+            error_rate=options["error_rate"],
+            payload=load_stub_payload(options["payload_kb"],
+                                      **scale_from_options(options)),
+            tracker=tracker,
+        )
+        await stub.start()
+
+        modes = []
+        for i in range(len(sessions)):
+            if options["mode"] == "both":
+                modes.append("ws" if i % 2 == 0 else "poll")
+            else:
+                modes.append(options["mode"])
+
+        started = time.perf_counter()
+        try:
+            with override_settings(INTERPRETATION_HOST_TRANSPORT={
+                "BACKEND": "core.transports.HTTPTransport",
+                "OPTIONS": {"URL": stub.url, "CANCEL_URL": stub.cancel_url},
+            }, ADMISSION_CONTROL={
+                **getattr(settings, "ADMISSION_CONTROL", {}),
+                "ENABLED": options["admission_control"],
+            }):
+                outcomes = await asyncio.gather(*(
+                    self._simulate_user(application, transport, session,
+                                        mode, tracker, options)
+                    for session, mode in zip(sessions, modes)
+                ))
+                await get_transport().close()
+        finally:
+            await stub.close()
+            await callback_client.aclose()
+        wall_seconds = time.perf_counter() - started
+
+        completed = sum(o["completed"] for o in outcomes)
+        return {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ",
+                                           time.gmtime()),
+                "django": django.get_version(),
+                "python": sys.version.split()[0],
+                "options": {k: v for k, v in options.items()
+                            if k not in ("verbosity", "settings",
+                                         "pythonpath", "traceback",
+                                         "no_color", "force_color",
+                                         "skip_checks")},
+            },
+            "totals": {
+                "jobs": sum(o["jobs"] for o in outcomes),
+                "completed": completed,
+                "failed": sum(o["failed"] for o in outcomes),
+                "rejected": sum(o["rejected"] for o in outcomes),
+                "timed_out": sum(o["timed_out"] for o in outcomes),
+                "stub_submissions": stub.submissions,
+                "stub_rejected": stub.rejected,
+                "wall_seconds": wall_seconds,
+                "throughput_jobs_per_second": completed / wall_seconds,
+            },
+            "stages": tracker.stage_summaries(),
+            "worker": collect_stats(),
+        }
+
+    async def _simulate_user(self, application, transport, session, mode,
+                             tracker, options):
+        cookie = f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+        client = httpx.AsyncClient(
+            transport=transport, base_url="http://localhost",
+            headers={"Cookie": cookie},
+        )
+        communicator = None
+        listener = None
+        if mode == "ws":
+            communicator = WebsocketCommunicator(
+                application, "/ws/jobs/",
+                headers=[(b"cookie", cookie.encode())]
+            )
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise RuntimeError("Websocket connection was refused")
+            listener = asyncio.create_task(
+                self._listen(communicator, tracker)
+            )
+
+        outcome = {"jobs": 0, "completed": 0, "failed": 0, "rejected": 0,
+                   "timed_out": 0}
+        try:
+            for _ in range(options["jobs_per_user"]):
+                outcome["jobs"] += 1
+                result = await self._run_job(client, mode, tracker, options)
+                outcome[result] += 1
+                if options["think_ms"]:
+                    await asyncio.sleep(options["think_ms"] / 1000)
+        finally:
+            if listener is not None:
+                listener.cancel()
+                await communicator.disconnect()
+            await client.aclose()
+        return outcome
+
+    async def _run_job(self, client, mode, tracker, options):
+        submit_start = time.perf_counter()
+        response = await client.get(
+            "/async_interpretations_view/",
+            params={"callback": "passthrough_data",
+                    "interpretation_key": "LoadTest"},
+        )
+        if response.status_code == 429:
+            return "rejected"
+        if response.status_code != 200:
+            return "failed"
+        job_id = response.json()["job_id"]
+        tracker.marks[job_id]["submit_start"] = submit_start
+        tracker.record(job_id, "submit_end")
+
+        try:
+            if mode == "poll":
+                ok = await asyncio.wait_for(
+                    self._poll(client, job_id, tracker, options),
+                    options["timeout"]
+                )
+            else:
+                ok = await asyncio.wait_for(
+                    asyncio.shield(tracker.future(job_id)),
+                    options["timeout"]
+                )
+        except asyncio.TimeoutError:
+            return "timed_out"
+        return "completed" if ok else "failed"
+
+    async def _listen(self, communicator, tracker):
+        while True:
+            try:
+                text = await communicator.receive_from(timeout=3600)
+            except asyncio.TimeoutError:
+                continue
+            content = json.loads(text)
+            if content.get("type") == "ping":
+                # like the frontend; the outbound writer waits for it
+                await communicator.send_to(
+                    text_data=json.dumps({"type": "pong"})
+                )
+                continue
+            message = content.get("message")
+            if isinstance(message, dict) and "job_id" in message:
+                tracker.deliver(message["job_id"])
+
+    async def _poll(self, client, job_id, tracker, options):
+        while job_id not in tracker.failed:
+            response = await client.get("/check_request_status/",
+                                        params={"job_id": job_id})
+            body = response.json()
+            if "result" in body:
+                tracker.deliver(job_id)
+                return True
+            await asyncio.sleep(options["poll_interval_ms"] / 1000)
+        return False
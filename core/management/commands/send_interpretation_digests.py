@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+
+from core.digests import send_digests
+from core.transports import InProcessTransport, get_transport
+
+
+class Command(BaseCommand):
+    help = (
+        "Email every approved user a digest of the interpretations they "
+        "subscribed to (interpretation_keys_for_emails). Each distinct "
+        "(interpretation key, role, group tags, interest tags) group is "
+        "fetched and rendered once, as the interactive views would request "
+        "it, and sent Bcc over a single email connection, see "
+        "core/digests.py. "
+        "Meant to be run on a schedule, e.g. from cron or a systemd timer. "
+        "The web workers receiving the super-backend's callbacks must share "
+        "this command's cache, so it refuses to run on a process-local one "
+        "unless the in-process transport is configured."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true",
+                            help="Fetch and render, but don't send")
+        parser.add_argument("--timeout", type=float,
+                            help="Seconds to wait for each interpretation")
+
+    def handle(self, *args, **options):
+        # the callbacks land in a web worker, whose job store must be ours,
+        # or every fetch waits out its timeout
+        if isinstance(caches["default"], (LocMemCache, DummyCache)) \
+                and not isinstance(get_transport(), InProcessTransport):
+            raise CommandError(
+                "The default cache is local to this process, so results "
+                "the super-backend sends to the web workers would never "
+                "reach it. Configure a shared cache in CACHES (e.g. Redis "
+                "or memcached), or the in-process transport."
+            )
+
+        start = time.perf_counter()
+        stats = send_digests(dry_run=options["dry_run"],
+                             timeout=options["timeout"])
+        seconds = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{stats['users']} users in {stats['groups']} groups: "
+            f"{stats['renders']} rendered, {stats['failed']} failed, "
+            f"{stats['messages']} messages, {stats['sent']} sent over one "
+            f"connection in {seconds:.2f}s"
+        )
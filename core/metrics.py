@@ -0,0 +1,62 @@
+"""
+Per-worker runtime statistics.
+
+Subsystems (admission control, the job scheduler, ...) register a
+provider with register_stats; the admin-only worker_stats view returns
+everything for the worker that served the request.
+"""
+
+import os
+import socket
+
+# Identifies this worker process in stats and shared registries
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+_providers = {}
+
+
+def register_stats(name, provider):
+    """
+    :param name: Key of the stats in the worker_stats response
+    :param provider: Callable returning a JSON serializable dict
+    """
+    _providers[name] = provider
+
+
+def collect_stats():
+    stats = {"worker": WORKER_ID}
+    for name, provider in _providers.items():
+        stats[name] = provider()
+    return stats
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list.
+
+    :param sorted_values: Sorted list of numbers
+    :param pct: Percentile between 0 and 100
+    :return: The percentile value, or None for an empty list
+    """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1,
+                      int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+
+def summarise(values):
+    """
+    Summarise a list of durations in seconds as milliseconds.
+    """
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": values[-1] * 1000,
+    }
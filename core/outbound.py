@@ -0,0 +1,248 @@
+"""
+Bounded per-connection outbound queues for JobConsumer.
+
+Job results are serialized once (with the connection's codec, see
+core.codecs) and queued; a writer task per connection sends them one at a
+time, so a slow client only backs up its own queue. Each queue holds at
+most MAX_MESSAGES messages or MAX_BYTES of serialized frames (a single
+message larger than that is still let through on its own).
+On overflow the POLICY decides, each policy falling back to the next:
+
+- "coalesce": drop queued messages for the same job as the new one, which
+  supersedes them
+- "drop_intermediate": drop the oldest queued intermediate (stop=false)
+  chunk, or the new message if it is one; final results are never dropped
+- "disconnect": close the connection; the client reconnects and polls
+
+Daphne applies no websocket write backpressure: send() returns at once
+and frames pile up in its transport buffer. So the writer does its own
+flow control with the heartbeat's ping/pong (see core.heartbeat): once
+MAX_UNACKED_BYTES have been sent since the client last answered, it sends
+a ping and waits for the pong, which the client only sends after reading
+everything before the ping. Daphne then buffers at most about
+MAX_UNACKED_BYTES (plus one frame) per connection, and the queue above
+fills up and applies its policy instead. A pong to one of the heartbeat's
+own pings also counts, so the bound is approximate. Clients that stop
+answering are reaped by the heartbeat.
+
+If sending fails, the connection is closed.
+
+Configured by settings.WS_OUTBOUND_QUEUE.
+"""
+
+import asyncio
+import json
+import logging
+from collections import Counter, deque
+
+from django.conf import settings
+
+from core.logs import log_event
+from core.metrics import register_stats
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MAX_MESSAGES": 32,
+    "MAX_BYTES": 16 * 1024 * 1024,
+    "POLICY": "coalesce",
+    # sent without a pong from the client, see above
+    "MAX_UNACKED_BYTES": 4 * 1024 * 1024,
+}
+
+POLICIES = ("coalesce", "drop_intermediate", "disconnect")
+
+# Close code for connections dropped for not keeping up (RFC 6455 1013,
+# "try again later")
+CLOSE_CODE_SLOW_CLIENT = 1013
+
+_counters = Counter()
+_queues = set()
+
+
+def outbound_setting(name):
+    return getattr(settings, "WS_OUTBOUND_QUEUE", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+class QueuedMessage:
+    __slots__ = ("job_id", "final", "frame", "size")
+
+    def __init__(self, job_id, final, frame):
+        self.job_id = job_id
+        self.final = final
+        self.frame = frame
+        # bytes on the wire; text frames are sent as UTF-8
+        self.size = len(frame) if isinstance(frame, bytes) \
+            else len(frame.encode())
+
+
+class OutboundQueue:
+
+    def __init__(self, send, close, encode=json.dumps):
+        """
+        :param send: Coroutine function sending one frame (str or bytes)
+        :param close: Coroutine function closing the connection with a code
+        :param encode: Serializes a message to a frame
+        """
+        self._send = send
+        self._close = close
+        self._encode = encode
+        self._messages = deque()
+        self._bytes = 0
+        self._unacked = 0
+        self._ready = asyncio.Event()
+        self._acked = asyncio.Event()
+        self._task = None
+        self.closed = False
+
+    @property
+    def depth(self):
+        return len(self._messages)
+
+    @property
+    def queued_bytes(self):
+        return self._bytes
+
+    def start(self):
+        _queues.add(self)
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    def stop(self):
+        self.closed = True
+        _queues.discard(self)
+        if self._task is not None and \
+                self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._messages.clear()
+        self._bytes = 0
+
+    def ack(self):
+        """
+        The client answered a ping, so it has read everything sent before.
+        """
+        self._acked.set()
+
+    def _full(self, incoming):
+        if not self._messages:
+            return False
+        return (len(self._messages) >= outbound_setting("MAX_MESSAGES")
+                or self._bytes + incoming.size
+                > outbound_setting("MAX_BYTES"))
+
+    def _remove(self, message):
+        self._messages.remove(message)
+        self._bytes -= message.size
+
+    def _coalesce(self, incoming):
+        superseded = [m for m in self._messages
+                      if m.job_id is not None and m.job_id == incoming.job_id]
+        for message in superseded:
+            self._remove(message)
+        _counters["coalesced"] += len(superseded)
+
+    def _drop_oldest_intermediate(self):
+        for message in self._messages:
+            if not message.final:
+                self._remove(message)
+                _counters["dropped"] += 1
+                return True
+        return False
+
+    async def put(self, message):
+        """
+        Serialize and queue a message for the client.
+
+        :param message: JSON serializable message; a dict with job_id and
+            stop keys is treated as a job result
+        """
+        if self.closed:
+            return
+        result = message.get("message") if isinstance(message, dict) \
+            else None
+        if not isinstance(result, dict):
+            result = {}
+        incoming = QueuedMessage(result.get("job_id"),
+                                 result.get("stop", True) is not False,
+                                 self._encode(message))
+
+        policies = POLICIES[POLICIES.index(outbound_setting("POLICY")):]
+        for policy in policies:
+            if not self._full(incoming):
+                break
+            if policy == "coalesce":
+                self._coalesce(incoming)
+            elif policy == "drop_intermediate":
+                if not incoming.final:
+                    _counters["dropped"] += 1
+                    return
+                while self._full(incoming) \
+                        and self._drop_oldest_intermediate():
+                    pass
+            else:
+                await self._disconnect()
+                return
+
+        self._messages.append(incoming)
+        self._bytes += incoming.size
+        _counters["enqueued"] += 1
+        _counters["max_depth"] = max(_counters["max_depth"],
+                                     len(self._messages))
+        self._ready.set()
+
+    async def _disconnect(self):
+        _counters["disconnected"] += 1
+        log_event(logger, logging.WARNING, "outbound.disconnect",
+                  depth=self.depth, queued_bytes=self._bytes)
+        self.stop()
+        await self._close(CLOSE_CODE_SLOW_CLIENT)
+
+    async def _wait_for_ack(self):
+        self._acked.clear()
+        await self._send(json.dumps({"type": "ping"}))
+        _counters["flow_control_waits"] += 1
+        await self._acked.wait()
+        self._unacked = 0
+
+    async def _writer(self):
+        try:
+            while True:
+                while not self._messages:
+                    self._ready.clear()
+                    await self._ready.wait()
+                if self._unacked >= outbound_setting("MAX_UNACKED_BYTES"):
+                    # the queue keeps filling (and applying its policy)
+                    # meanwhile
+                    await self._wait_for_ack()
+                    continue
+                message = self._messages.popleft()
+                self._bytes -= message.size
+                await self._send(message.frame)
+                self._unacked += message.size
+                _counters["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _counters["send_failed"] += 1
+            log_event(logger, logging.WARNING, "outbound.send_failed",
+                      depth=self.depth, exception=e)
+            self.stop()
+            try:
+                await self._close(CLOSE_CODE_SLOW_CLIENT)
+            except Exception:
+                pass
+
+
+def stats():
+    depths = [queue.depth for queue in _queues]
+    return {
+        "connections": len(depths),
+        "queued_messages": sum(depths),
+        "queued_bytes": sum(queue.queued_bytes for queue in _queues),
+        "deepest": max(depths, default=0),
+        **_counters,
+    }
+
+
+register_stats("outbound", stats)
@@ -0,0 +1,241 @@
+"""
+Synthetic interpretation payloads scaled up from the test_data fixtures.
+
+generate_interpretation_payload keeps the structure of
+test_data/new_cms_lite.json (pages, data_json,
+suitable_node_paths_by_high_level_node_path, interpretation_kwargs) but
+scales it by sites, turbines per site, monitors per turbine, and optionally
+adds timeline widgets carrying time series, so serialization, caching and
+websocket work can be measured at production fleet sizes.
+
+Scales taken from requests (scale_from_params, for the test views) are
+bounded: each param is clamped to MAX_SCALE, and time_points further so
+that the timeline widgets carry at most MAX_SERIES_RECORDS records. The
+benchmarks' command line options are not bounded.
+"""
+
+import copy
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+# Keys of generate_interpretation_payload that can be set from query
+# params (test views) or command line options (benchmarks).
+SCALE_PARAMS = (
+    "sites",
+    "turbines_per_site",
+    "monitors_per_turbine",
+    "time_points",
+    "widgets",
+)
+
+# generate_interpretation_payload's defaults
+SCALE_DEFAULTS = {
+    "sites": 2,
+    "turbines_per_site": 2,
+    "monitors_per_turbine": 3,
+    "time_points": 0,
+    "widgets": 0,
+}
+
+# Upper bounds of the scale params accepted from requests; up to 30000
+# rows in data_json
+MAX_SCALE = {
+    "sites": 20,
+    "turbines_per_site": 50,
+    "monitors_per_turbine": 30,
+    "time_points": 5000,
+    "widgets": 10,
+}
+
+# widgets * monitors * time_points, for scales accepted from requests
+MAX_SERIES_RECORDS = 1000000
+
+
+class InvalidScale(Exception):
+    pass
+
+
+@lru_cache(maxsize=None)
+def load_fixture(file_name):
+    """
+    Parse a test_data fixture once and cache it. The returned object is
+    shared, so callers must copy anything they modify.
+
+    :param file_name: Name of the file in test_data/
+    :return: The parsed fixture
+    """
+    file_path = os.path.join(settings.BASE_DIR, "test_data", file_name)
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+@lru_cache(maxsize=None)
+def _monitor_templates(fixture):
+    """
+    (monitor_node_type_path, node path suffix) pairs found in a fixture.
+    """
+    template = load_fixture(fixture)
+    data = json.loads(template["data_json"])
+    suffixes = {
+        path.split("/", 3)[3].rsplit("/", 1)[-1].lower(): path.split("/", 3)[3]
+        for paths in template[
+            "suitable_node_paths_by_high_level_node_path"].values()
+        for path in paths
+    }
+    return tuple(
+        (type_path, suffixes[type_path.rsplit("/", 1)[-1]])
+        for type_path in sorted(set(data["monitor_node_type_path"].values()))
+        if type_path.rsplit("/", 1)[-1] in suffixes
+    )
+
+
+@lru_cache(maxsize=None)
+def _site_names(fixture):
+    template = load_fixture(fixture)
+    return tuple(sorted({
+        path.split("/")[0]
+        for path in template["suitable_node_paths_by_high_level_node_path"]
+    }))
+
+
+def _object_id(rng):
+    return "%024x" % rng.getrandbits(96)
+
+
+def generate_interpretation_payload(sites=2, turbines_per_site=2,
+                                    monitors_per_turbine=3, time_points=0,
+                                    widgets=0, seed=0, job_id=None,
+                                    fixture="new_cms_lite.json"):
+    """
+    Build an interpretation payload shaped like the fixture, at any scale.
+
+    :param sites: Number of sites
+    :param turbines_per_site: Turbines per site
+    :param monitors_per_turbine: Monitors per turbine. Beyond the monitor
+        types in the fixture, numbered variants of them are generated
+    :param time_points: Points per monitor time series in timeline widgets
+    :param widgets: Number of timeline widgets, each carrying a series for
+        every monitor (widgets * monitors * time_points records in total)
+    :param seed: Seed for the generated ids and values
+    :param job_id: job_id to set on the payload
+    :param fixture: Fixture in test_data/ to use as the template
+    :return: A new payload dict
+    """
+    rng = random.Random(seed)
+    template = load_fixture(fixture)
+    monitor_templates = _monitor_templates(fixture)
+    site_names = _site_names(fixture)
+
+    columns = {
+        "high_level_node_path": {},
+        "monitor_node_type_path": {},
+        "threshold_exceeded": {},
+        "percentage": {},
+    }
+    suitable_paths = {}
+    entity_ids = []
+    monitor_paths = []
+    row = 0
+    for site_index in range(sites):
+        site = site_names[site_index % len(site_names)]
+        if site_index >= len(site_names):
+            site = f"{site}-{site_index // len(site_names)}"
+        for turbine_index in range(1, turbines_per_site + 1):
+            high_level_path = f"{site}/T{turbine_index}"
+            entity_ids.append(_object_id(rng))
+            paths = suitable_paths.setdefault(high_level_path, [])
+            for monitor_index in range(monitors_per_turbine):
+                type_path, suffix = monitor_templates[
+                    monitor_index % len(monitor_templates)
+                ]
+                variant = monitor_index // len(monitor_templates)
+                if variant:
+                    type_path = f"{type_path}_{variant}"
+                    suffix = f"{suffix}_{variant}"
+                exceeded = rng.random() * 0.012
+                columns["high_level_node_path"][str(row)] = high_level_path
+                columns["monitor_node_type_path"][str(row)] = type_path
+                columns["threshold_exceeded"][str(row)] = exceeded
+                columns["percentage"][str(row)] = exceeded * 100
+                path = f"{high_level_path}/VESTAS_V52/{suffix}"
+                paths.append(path)
+                monitor_paths.append(path)
+                row += 1
+
+    payload = copy.deepcopy({
+        key: value for key, value in template.items()
+        if key not in ("data_json",
+                       "suitable_node_paths_by_high_level_node_path")
+    })
+    payload["job_id"] = job_id or template.get("job_id")
+    payload["interpretation_kwargs"]["entity_ids"] = entity_ids
+    payload["interpretation_kwargs"]["node_ids"] = list(entity_ids)
+    payload["data_json"] = json.dumps(columns)
+    payload["suitable_node_paths_by_high_level_node_path"] = suitable_paths
+
+    if widgets and time_points:
+        page = next(iter(payload["pages"].values()))
+        page["sections"]["trends"] = {
+            "title": "Trends",
+            "widgets": [
+                _timeline_widget(rng, index, monitor_paths, time_points)
+                for index in range(widgets)
+            ],
+            "controls": [],
+        }
+    return payload
+
+
+def _timeline_widget(rng, index, monitor_paths, time_points):
+    start = datetime(2024, 2, 1, tzinfo=timezone.utc)
+    step = timedelta(minutes=10)
+    times = [(start + step * i).isoformat() for i in range(time_points)]
+    records = [
+        {"id": path, "datetime": time, "value": rng.random()}
+        for path in monitor_paths
+        for time in times
+    ]
+    return {
+        "type": "timeline",
+        "options": {
+            "title": f"Trend {index + 1}",
+            "x_title": "Time",
+            "display_strs_by_id": {path: path for path in monitor_paths},
+            "data_json": json.dumps(records),
+        },
+    }
+
+
+def scale_from_params(params):
+    """
+    Pick the generator scale arguments out of a dict of (string) params,
+    clamped to MAX_SCALE and MAX_SERIES_RECORDS.
+
+    :param params: e.g. the extra_payload of a test view
+    :return: kwargs for generate_interpretation_payload, empty if none set
+    :raises InvalidScale: With the name of a param that isn't a
+        non-negative integer
+    """
+    scale = {}
+    for key in SCALE_PARAMS:
+        if key not in params:
+            continue
+        try:
+            value = int(params[key])
+        except (TypeError, ValueError):
+            raise InvalidScale(key) from None
+        if value < 0:
+            raise InvalidScale(key)
+        scale[key] = min(value, MAX_SCALE[key])
+
+    full = {**SCALE_DEFAULTS, **scale}
+    series = full["sites"] * full["turbines_per_site"] \
+        * full["monitors_per_turbine"] * full["widgets"]
+    if series and full["time_points"] * series > MAX_SERIES_RECORDS:
+        scale["time_points"] = MAX_SERIES_RECORDS // series
+    return scale
@@ -0,0 +1,145 @@
+"""
+Presence registry: which users have a live websocket, on which worker.
+
+JobConsumer.connect/disconnect keep a per-worker count of open sockets per
+user, mirrored into the cache as presence_{email} = {worker_id: count}.
+Each worker also refreshes a heartbeat key every HEARTBEAT_INTERVAL
+seconds and rewrites its entries; entries of workers whose heartbeat has
+expired (crashed, killed) are ignored. The read-modify-write of a user's
+entry isn't atomic across workers, but the heartbeat rewrite repairs a
+lost update within one interval.
+
+complete_job checks user_is_present before group_send, so results for
+users who are only polling go to the job store alone, instead of being
+buffered by the channel layer for nobody.
+
+Configured by settings.PRESENCE.
+"""
+
+import asyncio
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.logs import log_event
+from core.metrics import WORKER_ID, register_stats
+from core.utils import sanitize_string
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "ENABLED": True,
+    "HEARTBEAT_INTERVAL": 15,
+    # a worker's entries are ignored this long after its last heartbeat
+    "HEARTBEAT_TIMEOUT": 45,
+}
+
+
+def presence_setting(name):
+    return getattr(settings, "PRESENCE", {}).get(name, DEFAULTS[name])
+
+
+def _presence_key(user_email):
+    return sanitize_string(f"presence_{user_email}")
+
+
+def _heartbeat_key(worker_id):
+    return sanitize_string(f"presence_worker_{worker_id}")
+
+
+class PresenceRegistry:
+
+    def __init__(self):
+        self._local = Counter()
+        self._loop = None
+        self._task = None
+
+    def _ensure_heartbeat(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._beat()
+        self._task = loop.create_task(self._heartbeat())
+
+    def _beat(self):
+        cache.set(_heartbeat_key(WORKER_ID), True,
+                  presence_setting("HEARTBEAT_TIMEOUT"))
+
+    def _write(self, user_email):
+        key = _presence_key(user_email)
+        entry = cache.get(key, {})
+        count = self._local.get(user_email, 0)
+        if count:
+            entry[WORKER_ID] = count
+        else:
+            entry.pop(WORKER_ID, None)
+        if entry:
+            cache.set(key, entry, presence_setting("HEARTBEAT_TIMEOUT"))
+        else:
+            cache.delete(key)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(presence_setting("HEARTBEAT_INTERVAL"))
+            try:
+                self._beat()
+                for user_email in list(self._local):
+                    self._write(user_email)
+            except Exception as e:
+                log_event(logger, logging.WARNING, "presence.heartbeat",
+                          exception=e)
+
+    def connect(self, user_email):
+        self._ensure_heartbeat()
+        self._local[user_email] += 1
+        self._write(user_email)
+
+    def disconnect(self, user_email):
+        self._local[user_email] -= 1
+        if self._local[user_email] <= 0:
+            del self._local[user_email]
+        self._write(user_email)
+
+    def connections(self, user_email):
+        """
+        Live connection counts of a user, across workers.
+
+        :return: {worker_id: count}
+        """
+        entry = cache.get(_presence_key(user_email), {})
+        if not entry:
+            return {}
+        alive = cache.get_many([_heartbeat_key(w) for w in entry])
+        return {
+            worker_id: count for worker_id, count in entry.items()
+            if _heartbeat_key(worker_id) in alive
+        }
+
+    def is_present(self, user_email):
+        if self._local.get(user_email):
+            return True
+        return bool(self.connections(user_email))
+
+    def stats(self):
+        return {
+            "connections": sum(self._local.values()),
+            "users": len(self._local),
+            "by_user": dict(self._local),
+        }
+
+
+presence = PresenceRegistry()
+register_stats("presence", presence.stats)
+
+
+def user_is_present(user_email):
+    """
+    :return: True if the user has a live websocket on any worker (always
+        True when presence tracking is disabled)
+    """
+    if not presence_setting("ENABLED"):
+        return True
+    return presence.is_present(user_email)
@@ -0,0 +1,247 @@
+"""
+On-demand sampling profiler for admin-triggered requests.
+
+An admin asks for a profile by sending the PROFILING_HEADER header or the
+PROFILING_QUERY_PARAM query flag. While the view runs, a background thread
+samples the stack of the thread running it (the event loop, for async
+views) every PROFILING_INTERVAL seconds, and the result is stored in the
+cache as flamegraph-compatible collapsed stacks.
+
+With PROFILING_FOLLOW_JOBS, jobs submitted from a profiled request are
+marked in the cache, so the callback_view, check_request_status and
+websocket deliveries for those jobs are profiled too, without the
+super-backend needing to know about it. That costs a cache read per
+request or delivery carrying a job_id, so it is off by default.
+
+When profiling is not requested the only cost is a header/query lookup.
+"""
+
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+PROFILE_INDEX_KEY = "profile_index"
+PROFILE_INDEX_SIZE = 50
+
+# Set while a profiled request is running, so jobs created during it
+# (see request_logic.prep_request) are profiled end to end.
+current_profile = contextvars.ContextVar("current_profile", default=None)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def profiling_requested(request):
+    """
+    Cheap check for the profiling header or query flag on a request.
+
+    :param request: Django or DRF request
+    :return: True if the client asked for a profile
+    """
+    if not _setting("PROFILING_ENABLED", True):
+        return False
+    header = _setting("PROFILING_HEADER", "X-Sentinel-Profile")
+    param = _setting("PROFILING_QUERY_PARAM", "_profile")
+    flag = request.headers.get(header) or request.GET.get(param)
+    return flag not in (None, "", "0", "false", "False")
+
+
+@sync_to_async
+def user_is_admin(user):
+    from users.models import CustomUser
+    return bool(user.is_authenticated
+                and user.role == CustomUser.Role.ADMIN)
+
+
+def _following_jobs():
+    return _setting("PROFILING_ENABLED", True) \
+        and _setting("PROFILING_FOLLOW_JOBS", False)
+
+
+def mark_job_for_profiling(job_id):
+    if _following_jobs():
+        cache.set(f"profile_job_{job_id}", True,
+                  _setting("PROFILING_TTL", 60 * 60))
+
+
+def job_marked_for_profiling(job_id):
+    if not job_id or not _following_jobs():
+        return False
+    return bool(cache.get(f"profile_job_{job_id}"))
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread, the one creating the sampler, at a
+    fixed interval and aggregates them into collapsed stack counts.
+    """
+
+    def __init__(self, interval=None):
+        self.interval = interval or _setting("PROFILING_INTERVAL", 0.005)
+        self.thread_id = threading.get_ident()
+        self.thread_name = threading.current_thread().name
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(
+            target=self._run, name="sentinel-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(
+                    f"{code.co_name} "
+                    f"({os.path.basename(code.co_filename)}"
+                    f":{frame.f_lineno})"
+                )
+                frame = frame.f_back
+            stack.append(self.thread_name)
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "\n".join(
+            f"{stack} {count}" for stack, count in self.counts.most_common()
+        )
+
+
+def store_profile(label, sampler):
+    """
+    Store a finished profile in the cache and add it to the profile index.
+
+    :param label: Human readable description of what was profiled
+    :param sampler: A stopped StackSampler
+    :return: The profile id
+    """
+    ttl = _setting("PROFILING_TTL", 60 * 60)
+    profile_id = str(uuid.uuid4())
+    cache.set(f"profile_{profile_id}", {
+        "label": label,
+        "created": time.time(),
+        "duration": sampler.duration,
+        "samples": sampler.samples,
+        "stacks": sampler.collapsed(),
+    }, ttl)
+    index = cache.get(PROFILE_INDEX_KEY, [])
+    index = [{"id": profile_id, "label": label,
+              "created": time.time()}] + index[:PROFILE_INDEX_SIZE - 1]
+    cache.set(PROFILE_INDEX_KEY, index, ttl)
+    logger.info("Stored profile %s for %s (%d samples)",
+                profile_id, label, sampler.samples)
+    return profile_id
+
+
+def get_profile(profile_id):
+    return cache.get(f"profile_{profile_id}")
+
+
+def list_profiles():
+    return cache.get(PROFILE_INDEX_KEY, [])
+
+
+async def _run_profiled(label, coro_func, *args, **kwargs):
+    sampler = StackSampler()
+    token = current_profile.set(label)
+    sampler.start()
+    try:
+        result = await coro_func(*args, **kwargs)
+    finally:
+        sampler.stop()
+        current_profile.reset(token)
+        profile_id = store_profile(label, sampler)
+    return result, profile_id
+
+
+def profile_request(view_func):
+    """
+    Decorator for async views. Profiles the view when an admin asks for it,
+    or when the request's job_id belongs to a profiled job.
+    """
+    @wraps(view_func)
+    async def _wrapped_view(request, *args, **kwargs):
+        job_id = request.GET.get("job_id")
+        if profiling_requested(request):
+            active = await user_is_admin(request.user)
+        else:
+            active = job_marked_for_profiling(job_id)
+
+        if not active:
+            return await view_func(request, *args, **kwargs)
+
+        label = f"{view_func.__name__} {job_id or ''}".strip()
+        response, profile_id = await _run_profiled(
+            label, view_func, request, *args, **kwargs
+        )
+        response["X-Sentinel-Profile-Id"] = profile_id
+        return response
+
+    return _wrapped_view
+
+
+async def consumer_profiling_requested(scope):
+    """
+    Check a websocket scope for the profiling query flag and an admin user.
+    Meant to be called once, on connect.
+    """
+    if not _setting("PROFILING_ENABLED", True):
+        return False
+    param = _setting("PROFILING_QUERY_PARAM", "_profile")
+    query = parse_qs(scope.get("query_string", b"").decode())
+    flag = query.get(param, [None])[0]
+    if flag in (None, "", "0", "false", "False"):
+        return False
+    return await user_is_admin(scope["user"])
+
+
+def profile_consumer_handler(handler):
+    """
+    Decorator for consumer event handlers. Profiles the handler when the
+    socket was opened with the profiling flag by an admin, or when the
+    event carries a profiled job.
+    """
+    @wraps(handler)
+    async def _wrapped_handler(self, event):
+        active = getattr(self, "profiling", False)
+        if not active:
+            message = event.get("message")
+            if isinstance(message, dict):
+                active = job_marked_for_profiling(message.get("job_id"))
+
+        if not active:
+            return await handler(self, event)
+
+        label = f"{type(self).__name__}.{handler.__name__}"
+        result, _ = await _run_profiled(label, handler, self, event)
+        return result
+
+    return _wrapped_handler
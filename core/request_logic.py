@@ -1,14 +1,38 @@
-import json
 import traceback
 
 from adrf.decorators import api_view
+from django.conf import settings
 from django.core.cache import cache
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from channels.layers import get_channel_layer
-from users.models import CustomUser
-from asgiref.sync import sync_to_async
-from core.utils import sanitize_string
+from core.cancellation import finish_job, job_is_cancelled, note_poll
+from core.conditional import (
+    bump_job_version,
+    conditional_setting,
+    job_etag,
+    not_modified,
+    set_conditional_headers
+)
+from core.compression import (
+    RequestTooLarge,
+    UnsupportedEncoding,
+    compress_response
+)
+from core.ingest import load_json_body, merge_params
+from core.logs import log_event
+from core.presence import user_is_present
+from core.subscriptions import (
+    UnknownGroupTag,
+    fetch_group_tag_pk,
+    result_group_name
+)
+from core.scheduler import release_job
+from core.profiling import (
+    current_profile,
+    mark_job_for_profiling,
+    profile_request
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,6 +52,8 @@ async def prep_request(job_id, callback, extra_payload=None):
     """
     key = f"callback_{job_id}"
     cache.set(key, callback.__name__)
+    if current_profile.get() is not None:
+        mark_job_for_profiling(job_id)
     if extra_payload:
         cache.set(f"extra_payload_{job_id}", extra_payload)
     return None
@@ -55,6 +81,9 @@ async def get_callback_and_payload_from_request(request):
     callback_method = CALLBACKS.get(callback_method_name, None)
     if "callback" in parsed_params:
         del parsed_params['callback']
+    parsed_params.pop(
+        getattr(settings, "PROFILING_QUERY_PARAM", "_profile"), None
+    )
     return callback_method, parsed_params
 
 
@@ -86,13 +115,74 @@ async def get_callback_and_job_id(request):
     return job_id, callback_name, callback
 
 
-@sync_to_async
-def get_user_by_email(email):
-    return CustomUser.objects.filter(email=email).first()
+async def complete_job(job_id, data, user_email, group_tag=None):
+    """
+    The complete_job function is the internal job-completion API. It stores
+    a job result in the job store (cache) for check_request_status, sets
+    the stop flag, and sends the result to the websockets that asked for it
+    (see core.subscriptions), if the user has any, or to every socket of
+    users carrying group_tag when one is given. callback_view calls it
+    for results from the super-backend, and in-process producers (like the
+    test views) call it directly instead of posting back to callback_view
+    over HTTP.
+
+    :param job_id: The job the result belongs to
+    :param data: The result, as callback_view would have parsed it
+    :param user_email: Email of the user who made the request
+    :param group_tag: Name of a group tag to broadcast the result to
+    :return: The stop flag stored for the job
+    :raises UnknownGroupTag: If there is no group tag named group_tag
+    """
+    if job_is_cancelled(job_id):
+        log_event(logger, logging.INFO, "complete_job.cancelled",
+                  job_id=job_id)
+        await release_job(job_id)
+        return True
+
+    group_tag_pk = None
+    if group_tag is not None:
+        group_tag_pk = await fetch_group_tag_pk(group_tag)
+
+    # before the data, so a poll never tags new data with an old version
+    bump_job_version(job_id)
+    key_data = f"data_{job_id}"
+    cache.set(key_data, data)
+
+    stop = True
+    if isinstance(data, dict) and "stop" in data:
+        stop = data["stop"]
+
+    key_stop = f"stop_{job_id}"
+    cache.set(key_stop, stop)
+
+    if group_tag_pk is not None or user_is_present(user_email):
+        group_name = result_group_name(job_id, user_email, data,
+                                       group_tag_pk)
+
+        log_event(logger, logging.INFO, "complete_job.group_send",
+                  job_id=job_id, group_name=group_name)
+        channel_layer = get_channel_layer()
+        await channel_layer.group_send(
+            group_name,
+            {
+                "type": "user_message",
+                "message": data,
+            }
+        )
+    else:
+        # polling only, the job store is enough
+        log_event(logger, logging.INFO, "complete_job.absent",
+                  job_id=job_id, user_email=user_email)
+
+    if stop is True:
+        finish_job(job_id, user_email)
+        await release_job(job_id)
+    return stop
 
 
 @csrf_exempt
 @api_view(['POST'])
+@profile_request
 async def callback_view(request):
     """
     The callback_view function is a Django view that handles the callback
@@ -101,7 +191,11 @@ async def callback_view(request):
     check_request_status function. It also sets a flag to indicate
     whether to stop polling for results. This flag is set either by the
     stop parameter this request (defaults true), or by the stop parameter
-    in the data.
+    in the data. The body may be compressed (Content-Encoding gzip,
+    deflate or zstd, see core.compression). With a broadcast_group_tag
+    parameter, the result goes out once to the websockets of every user
+    carrying that group tag (e.g. a site-wide alarm summary), rather than
+    to the requesting user's.
 
     :param request: Get the job_id from the url
     :return: A jsonresponse object
@@ -115,56 +209,40 @@ async def callback_view(request):
          callback_name,
          callback) = await get_callback_and_job_id(request)
 
-        logger.info(job_id + " received.")
-
-        request_get = request.GET
-        logger.info("Request GET: " + str(request_get))
-
-        user_email = request.GET.get('user_email')
-        logger.info("User email in callback: " + str(user_email))
-        user = await get_user_by_email(user_email)
-        user_group_name = f"user_{user}"
-        user_group_name = sanitize_string(user_group_name)
-        logger.info("User group name: " + str(user_group_name))
-        channel_layer = get_channel_layer()
-
-        body_data = json.loads(request.body)
-        params = request.GET.dict()
-
-        if type(body_data) is dict:
-            data = {**params, **body_data}
-            if "job_id" not in data:
-                data['job_id'] = job_id
-        else:
-            data = body_data
+        log_event(logger, logging.INFO, "callback_view.received",
+                  job_id=job_id, get=request.GET)
 
         if type(callback) is JsonResponse:
             # callback is an error response!
             return callback
 
-        key_data = f"data_{job_id}"
-        cache.set(key_data, data)
-        # logger.debug(job_id + " received data: " + str(data))
-
-        stop = True
-        if isinstance(data, dict) and "stop" in data:
-            stop = data["stop"]
-
-        key_stop = f"stop_{job_id}"
-        cache.set(key_stop, stop)
-
-        logger.info(
-            "Sending message for job id: " + str(job_id) +
-            " and user group name: " + str(user_group_name)
-        )
-        await channel_layer.group_send(
-            user_group_name,
-            {
-                "type": "user_message",
-                "message": data,
-            }
-        )
+        try:
+            # parsed from the request stream, see core.ingest
+            data = load_json_body(request)
+        except RequestTooLarge:
+            return JsonResponse({'status': 'Response too large'},
+                                status=413)
+        except UnsupportedEncoding as e:
+            return JsonResponse({'status': 'Unsupported encoding: '
+                                 + str(e)},
+                                status=415)
+
+        if type(data) is dict:
+            merge_params(data, request.GET.dict())
+            if "job_id" not in data:
+                data['job_id'] = job_id
 
+        try:
+            await complete_job(job_id, data, request.GET.get('user_email'),
+                               request.GET.get('broadcast_group_tag'))
+        except UnknownGroupTag as e:
+            return JsonResponse({'status': 'Unknown group tag: '
+                                 + str(e)},
+                                status=400)
+
+        if job_is_cancelled(job_id):
+            # lets streaming producers stop early
+            return JsonResponse({'status': 'Job cancelled'}, status=200)
         return JsonResponse({'status': 'Response processed'}, status=200)
     except Exception:
         traceback.print_exc()
@@ -174,13 +252,19 @@ async def callback_view(request):
         )
 
 
+@profile_request
+@compress_response
 async def check_request_status(request):
     """
     The check_request_status function is called by react to check
     if a response has been processed. It takes in a job_id and returns
     the result of that request, or an error message if no
     data exists for that id. Note that it pre-processes the response using
-    the callback function before returning it to react.
+    the callback function before returning it to react. Responses carry an
+    ETag of the job's result version, and a client sending it back in
+    If-None-Match gets a 304 without the callback running (see
+    core.conditional). The final result stays readable for
+    CONDITIONAL_GET["RESULT_TTL"] seconds after the job stops.
 
     :param request: Get the job_id from the url
     :return: A json response with the status of the request
@@ -191,10 +275,28 @@ async def check_request_status(request):
         # callback is an error response!
         return callback
 
+    if job_is_cancelled(job_id):
+        return JsonResponse({'status': 'Job cancelled', 'stop': True},
+                            status=200)
+    note_poll(job_id)
+
+    # the client already has the result of the current version
+    response = not_modified(request, job_etag(job_id))
+    if response is not None:
+        return response
+
     key_data = f"data_{job_id}"
     data = cache.get(key_data)
     if data is None:
+        final = cache.get(f"final_{job_id}")
+        if final is not None:
+            # a stopped job, read again
+            etag, payload = final
+            return set_conditional_headers(
+                JsonResponse(payload, status=200), etag
+            )
         return JsonResponse({'status': 'Data is none'}, status=200)
+    etag = job_etag(job_id)
 
     if "job_id" not in data:
         data["job_id"] = job_id
@@ -209,24 +311,19 @@ async def check_request_status(request):
     cache.set(key_data, None)
     extra_payload = cache.get(f"extra_payload_{job_id}", None)
 
+    payload = {'status': 'Response processed',
+               'result': processed_response}
+    if extra_payload:
+        payload["extra_payload"] = extra_payload
+    payload["stop"] = stop
+
     if stop is True:
         cache.delete(key_stop)
         cache.delete(key_data)
         cache.delete(key_result)
         cache.delete(f"extra_payload_{job_id}")
+        # kept for repeated reads, without running the callback again
+        cache.set(f"final_{job_id}", (etag, payload),
+                  conditional_setting("RESULT_TTL"))
 
-    if extra_payload:
-        return JsonResponse(
-            {'status': 'Response processed',
-             'result': processed_response,
-             "extra_payload": extra_payload,
-             "stop": stop},
-            status=200
-        )
-    else:
-        return JsonResponse(
-            {'status': 'Response processed',
-             'result': processed_response,
-             "stop": stop},
-            status=200
-        )
+    return set_conditional_headers(JsonResponse(payload, status=200), etag)
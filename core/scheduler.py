@@ -0,0 +1,437 @@
+"""
+Priority job scheduler in front of the super-backend dispatcher.
+
+Jobs are queued per priority class (interactive users, admin/test views,
+background pre-warm) and released to the super-backend as capacity frees
+up: at most MAX_IN_FLIGHT jobs outstanding per worker, and at most
+MAX_IN_FLIGHT_PER_KEY (or MAX_IN_FLIGHT_BY_KEY[key]) per
+interpretation_key; jobs without one only count towards the first limit.
+Within a class, users share capacity by weighted fair
+queueing (start-time fair queueing on a virtual clock), so one user's
+burst can't starve everyone else.
+
+A job holds its slot until its final result (stop=True) reaches
+complete_job, which calls release_job. Results may arrive on a different
+worker than the one that dispatched the job, so each worker records its
+scheduler's channel against the jobs it dispatches, and release_job sends
+the release to that channel, or broadcasts it over the channel layer when
+the dispatching worker isn't known. Slots of jobs that
+never complete are reclaimed after JOB_TIMEOUT. Cancelled jobs are
+dropped from the queue, or release their slot, the same way. A job whose
+submission fails (no acknowledgement) is completed with an error, as its
+client was already told it is queued and would otherwise wait for it
+forever.
+
+The queue holds at most MAX_QUEUED jobs per worker; submit raises
+QueueFull beyond that, which the views answer with a 429. Submission views
+return as soon as a job is queued, so the slots taken here on dispatch are
+the worker's in-flight cap, and the queue bound is what sheds a burst;
+admission control only rate limits.
+
+Configured by settings.SCHEDULER.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter, deque
+from enum import IntEnum
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+
+from core.logs import log_event
+from core.metrics import register_stats, summarise
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_GROUP = "job_scheduler"
+
+DEFAULTS = {
+    "ENABLED": True,
+    "MAX_IN_FLIGHT": 100,
+    "MAX_IN_FLIGHT_PER_KEY": 10,
+    "MAX_IN_FLIGHT_BY_KEY": {},
+    # fair queueing weight per user role
+    "ROLE_WEIGHTS": {"ADMIN": 1.0, "USER": 1.0},
+    "JOB_TIMEOUT": 300,
+    # jobs waiting for a slot, per worker
+    "MAX_QUEUED": 1000,
+}
+
+# how often fair queueing state of idle users is dropped
+EVICT_INTERVAL = 60.0
+
+# before the listener restarts after a failure
+LISTEN_RETRY_DELAY = 1.0
+
+
+def scheduler_setting(name):
+    return getattr(settings, "SCHEDULER", {}).get(name, DEFAULTS[name])
+
+
+def _dispatcher_key(job_id):
+    return f"scheduler_{job_id}"
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    ADMIN = 1
+    BACKGROUND = 2
+
+
+class QueueFull(Exception):
+    pass
+
+
+class ScheduledJob:
+    __slots__ = ("job_id", "dispatch", "priority", "user", "key",
+                 "enqueued", "tag")
+
+    def __init__(self, job_id, dispatch, priority, user, key, tag):
+        self.job_id = job_id
+        self.dispatch = dispatch
+        self.priority = priority
+        self.user = user
+        self.key = key
+        self.tag = tag
+        self.enqueued = time.monotonic()
+
+
+class JobScheduler:
+
+    def __init__(self):
+        self._heaps = {priority: [] for priority in Priority}
+        self._virtual_time = {priority: 0.0 for priority in Priority}
+        self._user_finish = {}
+        self._seq = itertools.count()
+        self._queued = {}
+        self._in_flight = {}
+        self._per_key = Counter()
+        self._wait_times = {priority: deque(maxlen=1000)
+                            for priority in Priority}
+        self.dispatched = 0
+        self.expired = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self._evicted_at = time.monotonic()
+        self._loop = None
+        self._wakeup = None
+        self._tasks = set()
+        # this worker's channel, once the listener has one
+        self.channel = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self.channel = None
+        for coro in (self._run(), self._listen(), self._renew_membership()):
+            task = loop.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def submit(self, job_id, dispatch, priority=Priority.INTERACTIVE,
+                     user=None, key=None, weight=1.0):
+        """
+        Queue a job. Returns immediately; dispatch() is awaited once the
+        job is released.
+
+        :param job_id: The job's id
+        :param dispatch: Zero-argument coroutine function that submits the
+            job and returns the acknowledgement (None on failure)
+        :param priority: Priority class
+        :param user: Email of the job's user, for fair queueing and to
+            report a failed submission to
+        :param key: interpretation_key, for per-key concurrency limits
+            (None for no per-key limit)
+        :param weight: Fair queueing weight of the user
+        :return: The queue acknowledgement, or dispatch()'s acknowledgement
+            when the scheduler is disabled
+        :raises QueueFull: If MAX_QUEUED jobs are queued already
+        """
+        if not scheduler_setting("ENABLED"):
+            return await _submit(job_id, dispatch, user)
+
+        if len(self._queued) >= scheduler_setting("MAX_QUEUED"):
+            self.rejected += 1
+            raise QueueFull(job_id)
+
+        self._ensure_running()
+        start = max(self._virtual_time[priority],
+                    self._user_finish.get((priority, user), 0.0))
+        tag = start + 1.0 / weight
+        self._user_finish[(priority, user)] = tag
+
+        job = ScheduledJob(job_id, dispatch, priority, user, key, tag)
+        heapq.heappush(self._heaps[priority], (tag, next(self._seq), job))
+        self._queued[job_id] = job
+        self._wakeup.set()
+        return {"status": "queued", "queue_depth": len(self._queued)}
+
+    def release(self, job_id):
+        """
+        Free the slot held by a dispatched job.
+
+        :return: True if the job was in flight on this worker
+        """
+        entry = self._in_flight.pop(job_id, None)
+        if entry is None:
+            return False
+        key = entry[0]
+        if key is not None:
+            self._per_key[key] -= 1
+            if self._per_key[key] <= 0:
+                del self._per_key[key]
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return True
+
+    def cancel(self, job_id):
+        """
+        Drop a queued job, or free the slot of a dispatched one.
+
+        :return: "queued" or "in_flight" if the job was known on this
+            worker, else None
+        """
+        if self._queued.pop(job_id, None) is not None:
+            self.cancelled += 1
+            return "queued"
+        if self.release(job_id):
+            self.cancelled += 1
+            return "in_flight"
+        return None
+
+    def _key_limit(self, key):
+        return scheduler_setting("MAX_IN_FLIGHT_BY_KEY").get(
+            key, scheduler_setting("MAX_IN_FLIGHT_PER_KEY")
+        )
+
+    def _next_eligible(self):
+        if len(self._in_flight) >= scheduler_setting("MAX_IN_FLIGHT"):
+            return None
+        for priority in Priority:
+            heap = self._heaps[priority]
+            blocked = []
+            chosen = None
+            while heap:
+                entry = heapq.heappop(heap)
+                job = entry[2]
+                if self._queued.get(job.job_id) is not job:
+                    continue  # no longer queued (e.g. cancelled)
+                if job.key is not None and \
+                        self._per_key[job.key] >= self._key_limit(job.key):
+                    blocked.append(entry)
+                    continue
+                chosen = job
+                break
+            for entry in blocked:
+                heapq.heappush(heap, entry)
+            if chosen is not None:
+                return chosen
+        return None
+
+    def _expire(self):
+        now = time.monotonic()
+        for job_id, (_, deadline) in list(self._in_flight.items()):
+            if deadline < now:
+                self.expired += 1
+                self.release(job_id)
+
+    def _evict_idle_users(self):
+        # a finish tag behind its class's virtual clock no longer affects
+        # the user's next start tag, so it can go
+        now = time.monotonic()
+        if now - self._evicted_at < EVICT_INTERVAL:
+            return
+        self._evicted_at = now
+        for (priority, user), finish in list(self._user_finish.items()):
+            if finish <= self._virtual_time[priority]:
+                del self._user_finish[(priority, user)]
+
+    async def _run(self):
+        while True:
+            job = None
+            try:
+                self._expire()
+                self._evict_idle_users()
+                job = self._next_eligible()
+                if job is None:
+                    self._wakeup.clear()
+                    # not wait_for, which can swallow a cancellation that
+                    # coincides with a wakeup
+                    timer = self._loop.call_later(1.0, self._wakeup.set)
+                    try:
+                        await self._wakeup.wait()
+                    finally:
+                        timer.cancel()
+                    continue
+
+                del self._queued[job.job_id]
+                self._in_flight[job.job_id] = (
+                    job.key,
+                    time.monotonic() + scheduler_setting("JOB_TIMEOUT")
+                )
+                if job.key is not None:
+                    self._per_key[job.key] += 1
+                self._virtual_time[job.priority] = job.tag
+                if self.channel is not None:
+                    cache.set(_dispatcher_key(job.job_id), self.channel,
+                              scheduler_setting("JOB_TIMEOUT"))
+                self._wait_times[job.priority].append(
+                    time.monotonic() - job.enqueued
+                )
+                self.dispatched += 1
+                task = asyncio.create_task(self._dispatch(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                # one bad job mustn't stop dispatching for everyone
+                log_event(logger, logging.ERROR, "scheduler.run_failed",
+                          job_id=getattr(job, "job_id", None), exception=e)
+                if job is not None:
+                    self._queued.pop(job.job_id, None)
+                    self.release(job.job_id)
+                await asyncio.sleep(0.1)
+
+    async def _dispatch(self, job):
+        ack = await _submit(job.job_id, job.dispatch, job.user)
+        if ack is None:
+            # normally released already, by completing the job
+            self.release(job.job_id)
+
+    async def _listen(self):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        while True:
+            try:
+                if self.channel is None:
+                    self.channel = await channel_layer.new_channel()
+                # again on a restart, in case the failure cost the membership
+                await channel_layer.group_add(SCHEDULER_GROUP, self.channel)
+                while True:
+                    message = await channel_layer.receive(self.channel)
+                    if message.get("type") == "scheduler.release":
+                        self.release(message["job_id"])
+                    elif message.get("type") == "scheduler.cancel":
+                        self.cancel(message["job_id"])
+            except Exception:
+                logger.exception("scheduler.listen_failed")
+                await asyncio.sleep(LISTEN_RETRY_DELAY)
+
+    async def _renew_membership(self):
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        # group membership expires, so it is renewed well before that
+        renew = getattr(channel_layer, "group_expiry", 86400) / 2
+        while True:
+            await asyncio.sleep(renew)
+            if self.channel is None:
+                continue
+            try:
+                await channel_layer.group_add(SCHEDULER_GROUP, self.channel)
+            except Exception:
+                logger.exception("scheduler.group_add_failed")
+
+    def stats(self):
+        return {
+            "queued": {
+                priority.name: sum(
+                    1 for job in self._queued.values()
+                    if job.priority == priority
+                )
+                for priority in Priority
+            },
+            "in_flight": len(self._in_flight),
+            "in_flight_by_key": dict(self._per_key),
+            "dispatched": self.dispatched,
+            "expired": self.expired,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "fair_queueing_users": len(self._user_finish),
+            "wait": {
+                priority.name: summarise(list(self._wait_times[priority]))
+                for priority in Priority
+            },
+        }
+
+
+scheduler = JobScheduler()
+register_stats("scheduler", scheduler.stats)
+
+
+async def _submit(job_id, dispatch, user_email):
+    """
+    Await a job's dispatch(), and complete the job with an error if it
+    fails, so its pollers and sockets get a final result.
+
+    :return: dispatch()'s acknowledgement, or None if it failed
+    """
+    try:
+        ack = await dispatch()
+    except Exception as e:
+        log_event(logger, logging.WARNING, "scheduler.dispatch_failed",
+                  job_id=job_id, exception=e)
+        ack = None
+    if ack is not None:
+        return ack
+
+    # imported here, as core.request_logic releases jobs through this module
+    from core.request_logic import complete_job
+    try:
+        await complete_job(job_id, {
+            "job_id": job_id,
+            "error": "Submission to the interpretation host failed",
+            "stop": True,
+        }, user_email)
+    except Exception as e:
+        log_event(logger, logging.ERROR, "scheduler.fail_job_failed",
+                  job_id=job_id, exception=e)
+    return None
+
+
+async def release_job(job_id):
+    """
+    Release a finished job's slot, on whichever worker dispatched it.
+    """
+    if not scheduler_setting("ENABLED") or scheduler.release(job_id):
+        return
+    dispatcher = cache.get(_dispatcher_key(job_id))
+    if dispatcher is not None and dispatcher == scheduler.channel:
+        # dispatched here, and released already
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    message = {"type": "scheduler.release", "job_id": job_id}
+    if dispatcher is None:
+        await channel_layer.group_send(SCHEDULER_GROUP, message)
+    else:
+        await channel_layer.send(dispatcher, message)
+
+
+async def cancel_scheduled_job(job_id):
+    """
+    Cancel a job in the scheduler, on whichever worker queued it.
+
+    :return: "queued" or "in_flight" if the job was known on this worker,
+        else None (another worker is told to drop it, if it has it)
+    """
+    if not scheduler_setting("ENABLED"):
+        return None
+    state = scheduler.cancel(job_id)
+    if state is None:
+        channel_layer = get_channel_layer()
+        if channel_layer is not None:
+            await channel_layer.group_send(
+                SCHEDULER_GROUP,
+                {"type": "scheduler.cancel", "job_id": job_id}
+            )
+    return state
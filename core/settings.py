@@ -44,6 +44,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 
     # own
+    'core',
     'users',
 
     # 3rd party
@@ -93,6 +94,31 @@ DATABASES = {
     }
 }
 
+# Database profile, "development" or "production", from the
+# SENTINEL_DB_PROFILE environment variable. Production keeps connections
+# open, waits out locks instead of failing, and runs SQLITE_PRAGMAS on each
+# new connection (see core/db.py).
+DB_PROFILE = os.environ.get("SENTINEL_DB_PROFILE", "development")
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    # negative is KiB
+    "cache_size": -64 * 1024,
+    "temp_store": "MEMORY",
+}
+
+if DB_PROFILE == "production":
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # seconds a connection waits on a lock (busy_timeout)
+            'timeout': 20,
+        },
+    })
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -156,6 +182,15 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
+# Session users are resolved from the cache, see users/backends.py.
+# ModelBackend only loads the users of sessions stored under it.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 ASGI_APPLICATION = 'core.asgi.application'
 
 CHANNEL_LAYERS = {
@@ -167,3 +202,183 @@ CHANNEL_LAYERS = {
 LOGIN_REDIRECT_URL = "users:index"
 LOGOUT_REDIRECT_URL = "users:login"
 LOGIN_URL = 'users:login'
+
+# On-demand request profiling (admins only), see core/profiling.py
+PROFILING_ENABLED = True
+PROFILING_HEADER = "X-Sentinel-Profile"
+PROFILING_QUERY_PARAM = "_profile"
+# Seconds between stack samples while a profile is running
+PROFILING_INTERVAL = 0.005
+# Also profile the callbacks, polls and websocket deliveries of jobs
+# submitted from a profiled request; costs a cache read per request or
+# delivery carrying a job_id, so turn it on while investigating
+PROFILING_FOLLOW_JOBS = False
+# Seconds stored profiles are kept for download
+PROFILING_TTL = 60 * 60
+
+# Hot path logging, see core/logs.py
+# Move log formatting and I/O onto a listener thread
+LOGGING_QUEUE_ENABLED = True
+LOGGING_QUEUE_SIZE = 10000
+# Loggers whose handlers are moved behind the queue ("" is the root logger),
+# in addition to the logging_mp logger
+LOGGING_QUEUE_LOGGERS = ["", "django"]
+# Fraction of DEBUG/INFO records kept per logger name prefix,
+# e.g. {"core.request_logic": 0.1}. WARNING and above are always kept.
+LOGGING_SAMPLE_RATES = {}
+# Maximum characters rendered per structured log field
+LOGGING_FIELD_MAX_CHARS = 500
+
+# How jobs are submitted to the super-backend, see core/transports.py.
+# e.g. {"BACKEND": "core.transports.HTTPTransport",
+#       "OPTIONS": {"URL": "http://127.0.0.1:5000/submit"}}
+# or   {"BACKEND": "core.transports.UnixSocketTransport",
+#       "OPTIONS": {"PATH": "/run/super-backend.sock"}}
+INTERPRETATION_HOST_TRANSPORT = {
+    "BACKEND": "core.transports.FlaskAppWrapperTransport",
+}
+
+# Seconds the test views wait before delivering their test data in-process,
+# so the client has registered the job_id first
+TEST_VIEWS_DELIVERY_DELAY = 0.1
+
+# Rate limiting for /async_interpretations_view/, see core/admission.py.
+# Rejected requests get a 429 with Retry-After. Jobs in flight are capped by
+# SCHEDULER below.
+ADMISSION_CONTROL = {
+    "ENABLED": True,
+    # token buckets (tokens per second, bucket size), shared via the cache
+    "USER_RATE": 2.0,
+    "USER_BURST": 10,
+    "GROUP_TAG_RATE": 20.0,
+    "GROUP_TAG_BURST": 100,
+}
+
+# Priority scheduler between the submission views and the super-backend,
+# see core/scheduler.py. Limits are per worker.
+SCHEDULER = {
+    "ENABLED": True,
+    # jobs outstanding at the super-backend
+    "MAX_IN_FLIGHT": 100,
+    "MAX_IN_FLIGHT_PER_KEY": 10,
+    # per interpretation_key overrides, e.g. {"CMSLiteTurbineSummary": 4}
+    "MAX_IN_FLIGHT_BY_KEY": {},
+    # fair queueing weight per user role
+    "ROLE_WEIGHTS": {"ADMIN": 1.0, "USER": 1.0},
+    # seconds before the slot of a job that never completed is reclaimed
+    "JOB_TIMEOUT": 300,
+    # jobs waiting for a slot, per worker; more are rejected with a 429
+    "MAX_QUEUED": 1000,
+}
+
+# Cancellation of abandoned jobs, see core/cancellation.py
+JOB_CANCELLATION = {
+    # cancel a user's jobs when their last websocket closes and they
+    # aren't polling
+    "AUTO_CANCEL": True,
+    "GRACE_PERIOD": 5.0,
+    "POLL_ACTIVE_TIMEOUT": 10,
+    "CANCELLED_TTL": 3600,
+    # owner and per-user job list keys; longer than any job lives
+    "JOB_TTL": 3600,
+}
+
+# Registry of users with live websockets, see core/presence.py. Results for
+# users without one are only stored for polling.
+PRESENCE = {
+    "ENABLED": True,
+    "HEARTBEAT_INTERVAL": 15,
+    "HEARTBEAT_TIMEOUT": 45,
+}
+
+# How long a per-job or per-interpretation websocket subscription group
+# keeps receiving results after the last subscribe, see
+# core/subscriptions.py
+WS_SUBSCRIPTION_TTL = 3600
+
+# Per-websocket outbound queue, see core/outbound.py. POLICY is one of
+# "coalesce", "drop_intermediate" or "disconnect"; each falls back to the
+# next when it can't make room.
+WS_OUTBOUND_QUEUE = {
+    "MAX_MESSAGES": 32,
+    "MAX_BYTES": 16 * 1024 * 1024,
+    "POLICY": "coalesce",
+    # sent before waiting for the client's pong; bounds what Daphne buffers
+    "MAX_UNACKED_BYTES": 4 * 1024 * 1024,
+}
+
+# Websocket heartbeats, see core/heartbeat.py. Connections silent for
+# IDLE_TIMEOUT seconds are closed and cleaned up.
+WS_HEARTBEAT = {
+    "ENABLED": True,
+    "PING_INTERVAL": 20,
+    "IDLE_TIMEOUT": 60,
+}
+
+# Websocket subprotocols for job results, see core/codecs.py. ENABLED is in
+# order of server preference; clients that offer none get JSON.
+WS_SUBPROTOCOLS = {
+    "ENABLED": ["sentinel.msgpack", "sentinel.cbor",
+                "sentinel.json.deflate", "sentinel.json"],
+    "DEFLATE_LEVEL": 6,
+    "INTERN_MIN_LENGTH": 8,
+}
+
+# Compression of callback bodies and polling responses, see
+# core/compression.py. zstd needs the zstandard package.
+HTTP_COMPRESSION = {
+    "ENCODINGS": ["zstd", "gzip", "deflate"],
+    # responses smaller than this are sent uncompressed
+    "MIN_SIZE": 1024,
+    "GZIP_LEVEL": 6,
+    "ZSTD_LEVEL": 3,
+    # decompressed callback bodies larger than this are rejected (413)
+    "MAX_REQUEST_BYTES": 256 * 1024 * 1024,
+}
+
+# ETags and Cache-Control for job results and the logged-in user API, see
+# core/conditional.py
+CONDITIONAL_GET = {
+    # how long a stopped job's final result can still be polled
+    "RESULT_TTL": 300,
+    "CACHE_CONTROL": {"private": True, "no_cache": True},
+}
+
+# How long a rendered api/logged_in_user/me response stays cached, see
+# users/versioning.py. Any change to the user bumps its version first.
+PROFILE_CACHE_TTL = 3600
+
+# Cached user snapshots for session auth, see users/backends.py. Saves and
+# logouts drop them; TTL bounds staleness from QuerySet.update().
+AUTH_USER_CACHE = {
+    "TTL": 300,
+}
+
+# Password hashing for the login, sign-up and change-password views, see
+# users/hashing.py. Runs in its own thread pool, off the thread the async
+# views' ORM calls share.
+PASSWORD_HASHING = {
+    "MAX_WORKERS": 4,
+    # logins in progress per client IP; more get a 429
+    "MAX_CONCURRENT_PER_IP": 3,
+}
+
+# The user admin estimates the row count of unfiltered changelists above
+# this many rows, instead of a COUNT(*) per page, see users/admin.py
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 10000
+
+# Users the user admin's bulk actions read and write at a time
+ADMIN_ACTION_CHUNK_SIZE = 1000
+
+# Interpretation email digests, see core/digests.py and the
+# send_interpretation_digests command. One fetch and one render per
+# (interpretation key, group tags) group, sent Bcc over one connection.
+INTERPRETATION_DIGESTS = {
+    "FROM_EMAIL": None,
+    "SUBJECT": "{tab_name} digest",
+    "BCC_BATCH_SIZE": 50,
+    "MAX_IN_FLIGHT": 4,
+    "RESULT_TIMEOUT": 300,
+    # super-backend kwargs per interpretation key
+    "INTERPRETATION_KWARGS": {},
+}
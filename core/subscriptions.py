@@ -0,0 +1,110 @@
+"""
+Per-job and per-interpretation websocket subscriptions.
+
+A socket can subscribe to one of its user's jobs ({"type": "subscribe",
+"job_id": ...}) or to all of its user's results for an interpretation_key
+({"type": "subscribe", "interpretation_key": ...}). Subscribing joins a
+channel layer group and flags the group in the cache; complete_job sends a
+result to the narrowest flagged group, so only the tabs that asked for it
+receive it. Every socket stays in its user group, which gets results
+nobody subscribed to (older clients, or results that beat the subscribe).
+
+Sockets also join a group per group tag of their user on connect. A result
+broadcast to a tag (callback_view's broadcast_group_tag) is sent to that
+one group, instead of once per user carrying the tag. The group is keyed
+on the tag's primary key, as sanitized names of distinct tags can clash.
+Tags added while a socket is open apply from its next connect.
+
+Configured by settings.WS_SUBSCRIPTION_TTL, how long a group stays
+flagged after the last subscribe.
+"""
+
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from core.metrics import register_stats
+from core.utils import sanitize_string
+
+_routes = Counter()
+register_stats("subscriptions", lambda: dict(_routes))
+
+
+def user_group_name(user_email):
+    return sanitize_string(f"user_{user_email}")
+
+
+def job_group_name(user_email, job_id):
+    # scoped to the user, as clients choose job ids
+    return sanitize_string(f"job_{user_email}_{job_id}")
+
+
+def interpretation_group_name(user_email, interpretation_key):
+    return sanitize_string(
+        f"interpretation_{user_email}_{interpretation_key}"
+    )
+
+
+class UnknownGroupTag(Exception):
+    pass
+
+
+def group_tag_group_name(tag_pk):
+    return f"group_tag_{tag_pk}"
+
+
+@sync_to_async
+def fetch_group_tag_pk(tag_name):
+    """
+    :param tag_name: Name of a group tag
+    :return: The tag's primary key
+    :raises UnknownGroupTag: If there is no such tag
+    """
+    from users.models import GroupTag
+
+    tag_pk = GroupTag.objects.filter(name=tag_name).values_list(
+        "pk", flat=True
+    ).first()
+    if tag_pk is None:
+        raise UnknownGroupTag(tag_name)
+    return tag_pk
+
+
+def mark_subscribed(group_name):
+    cache.set(f"subscribed_{group_name}", True,
+              getattr(settings, "WS_SUBSCRIPTION_TTL", 3600))
+
+
+def result_group_name(job_id, user_email, data, group_tag=None):
+    """
+    Pick the group a job result is sent to.
+
+    :param job_id: The job the result belongs to
+    :param user_email: Email of the user who made the request
+    :param data: The result
+    :param group_tag: Primary key of a group tag to broadcast the result to
+    :return: The group tag's group if broadcasting, else the job group if
+        a socket subscribed to the job, else the
+        interpretation group if one subscribed to its interpretation_key,
+        else the user group
+    """
+    if group_tag is not None:
+        _routes["group_tag"] += 1
+        return group_tag_group_name(group_tag)
+
+    group_name = job_group_name(user_email, job_id)
+    if cache.get(f"subscribed_{group_name}"):
+        _routes["job"] += 1
+        return group_name
+
+    key = data.get("interpretation_key") if isinstance(data, dict) else None
+    if key is not None:
+        group_name = interpretation_group_name(user_email, key)
+        if cache.get(f"subscribed_{group_name}"):
+            _routes["interpretation"] += 1
+            return group_name
+
+    _routes["user"] += 1
+    return user_group_name(user_email)
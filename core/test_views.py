@@ -1,16 +1,25 @@
-import os
-import httpx
 import asyncio
 
 from core.callbacks import set_callbacks
+from core.admission import too_many_requests
+from core.cancellation import finish_job, register_job
+from django.conf import settings
 from django.http import JsonResponse
 import uuid
 import logging
-import json
+from core.logs import log_event
+from core.payloads import (
+    InvalidScale,
+    generate_interpretation_payload,
+    load_fixture,
+    scale_from_params
+)
 from core.request_logic import (
+   complete_job,
    get_callback_and_payload_from_request,
    prep_request
 )
+from core.scheduler import Priority, QueueFull, scheduler
 from core.views import (
     user_is_approved_for_request,
     fetch_user_role,
@@ -22,6 +31,10 @@ from core.views import (
 
 logger = logging.getLogger(__name__)
 
+# References to in-flight loopback deliveries, so they aren't
+# garbage collected before they finish.
+_background_tasks = set()
+
 
 @api_view(['GET'])
 @user_is_approved_for_request
@@ -62,9 +75,9 @@ async def test_get_interpretations(request):
             request
         )
 
-        logger.info(
-            "test_get_interpretations: " + job_id + " callback: "
-            + str(callback) + " extra_payload: " + str(extra_payload))
+        log_event(logger, logging.INFO, "test_get_interpretations",
+                  job_id=job_id, callback=callback,
+                  extra_payload=extra_payload)
 
         if not callback:
             return JsonResponse(
@@ -72,6 +85,17 @@ async def test_get_interpretations(request):
                 status=400
             )
 
+        # pass sites, turbines_per_site, monitors_per_turbine, time_points
+        # and widgets to get a generated payload at that scale
+        try:
+            scale = scale_from_params(extra_payload)
+        except InvalidScale as e:
+            return JsonResponse(
+                {'status': 'Invalid ' + str(e)
+                 + ': must be a non-negative integer'},
+                status=400
+            )
+
         await prep_request(job_id, callback, extra_payload)
 
         if False:
@@ -94,20 +118,16 @@ async def test_get_interpretations(request):
 
         all_kwargs = {**extra_payload, **user_kwargs}
 
-        logger.info(
-            "test_get_interpretations: "
-            + job_id + " kwargs: " + str(all_kwargs)
-        )
+        log_event(logger, logging.INFO, "test_get_interpretations",
+                  job_id=job_id, kwargs=all_kwargs)
 
         response_data = "Request received for job_id: " + job_id
 
-        callback_data = {}
-        dir_path = "test_data"
-        file_name = "new_cms_lite.json"
-        file_path = os.path.join(dir_path, file_name)
-
-        with open(file_path, "r") as f:
-            callback_data = json.load(f)
+        if scale:
+            callback_data = generate_interpretation_payload(**scale)
+        else:
+            # shallow copy, the cached fixture is shared
+            callback_data = dict(load_fixture("new_cms_lite.json"))
 
         callback_data["job_id"] = job_id
         callback_data["user_email"] = user_kwargs["user_email"]
@@ -119,13 +139,19 @@ async def test_get_interpretations(request):
         # logger.info("test_get_interpretations: "
         #             + job_id + " callback_data: " + str(callback_data))
 
-        asyncio.create_task(
-            send_to_callback_view_async(
-                callback_data,
+        register_job(job_id, user_kwargs["user_email"])
+        # scheduled like a real submission, behind interactive users
+        try:
+            await scheduler.submit(
                 job_id,
-                params
+                lambda: deliver_in_background(callback_data, job_id, params),
+                priority=Priority.ADMIN,
+                user=user_kwargs["user_email"],
+                key=all_kwargs.get("interpretation_key"),
             )
-        )
+        except QueueFull:
+            finish_job(job_id, user_kwargs["user_email"])
+            return too_many_requests(1, 'queue full')
 
         logger.info("test_get_interpretations: "
                     + job_id + " returning.")
@@ -142,22 +168,34 @@ async def test_get_interpretations(request):
         )
 
 
-async def send_to_callback_view_async(callback_data, job_id, params):
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(
-                url="http://localhost:8000/callback_view/",
-                params=params,
-                json=callback_data,
-                headers={'Content-Type': 'application/json'},
-                timeout=1
-            )
-            logger.info("Async call to callback_view: "
-                        + job_id + " response: "
-                        + str(response.json()))
-        except Exception as e:
-            logger.info("Async call to callback_view: "
-                        + job_id + " request exception: " + str(e))
+async def deliver_in_background(callback_data, job_id, params):
+    """
+    Deliver test data to the job store and channel layer in-process through
+    complete_job, the way callback_view would for the super-backend,
+    without an HTTP round trip to our own callback_view.
+
+    :return: An acknowledgement, like the super-backend's
+    """
+    task = asyncio.create_task(
+        send_to_callback_loopback(callback_data, job_id, params)
+    )
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return {"status": "accepted", "job_id": job_id}
+
+
+async def send_to_callback_loopback(callback_data, job_id, params):
+    # Give the client time to receive the job_id and register the job
+    # before its result arrives on the websocket.
+    await asyncio.sleep(getattr(settings, "TEST_VIEWS_DELIVERY_DELAY", 0.1))
+    try:
+        data = {**params, **callback_data}
+        stop = await complete_job(job_id, data, params["user_email"])
+        log_event(logger, logging.INFO, "send_to_callback_loopback",
+                  job_id=job_id, stop=stop)
+    except Exception as e:
+        log_event(logger, logging.INFO, "send_to_callback_loopback",
+                  job_id=job_id, exception=e)
 
 
 @api_view(['GET'])
@@ -201,9 +239,9 @@ async def test_display_interpretation(request):
             request
         )
 
-        logger.info(
-            "test_display_interpretation: " + job_id + " callback: "
-            + str(callback) + " extra_payload: " + str(extra_payload))
+        log_event(logger, logging.INFO, "test_display_interpretation",
+                  job_id=job_id, callback=callback,
+                  extra_payload=extra_payload)
 
         if not callback:
             return JsonResponse(
@@ -211,6 +249,17 @@ async def test_display_interpretation(request):
                 status=400
             )
 
+        # pass sites, turbines_per_site, monitors_per_turbine, time_points
+        # and widgets to get a generated payload at that scale
+        try:
+            scale = scale_from_params(extra_payload)
+        except InvalidScale as e:
+            return JsonResponse(
+                {'status': 'Invalid ' + str(e)
+                 + ': must be a non-negative integer'},
+                status=400
+            )
+
         await prep_request(job_id, callback, extra_payload)
 
         if False:
@@ -230,24 +279,19 @@ async def test_display_interpretation(request):
             user_kwargs["user_interest_tags"] = await fetch_user_interest_tags(
                 request.user
             )
-        print('cunt', user_kwargs)
         all_kwargs = {**extra_payload, **user_kwargs}
 
-        logger.debug("test_display_interpretation: "
-                     + job_id + " kwargs: " + str(all_kwargs))
+        log_event(logger, logging.DEBUG, "test_display_interpretation",
+                  job_id=job_id, kwargs=all_kwargs)
 
         response_data = "Request received for job_id: " + job_id
 
-        callback_data = {}
-        dir_path = "test_data"
-
-        # change test data here
-
-        file_name = "new_cms_lite.json"
-
-        file_path = os.path.join(dir_path, file_name)
-        with open(file_path, "r") as f:
-            callback_data = json.load(f)
+        if scale:
+            callback_data = generate_interpretation_payload(**scale)
+        else:
+            # change test data here
+            # (shallow copy, the cached fixture is shared)
+            callback_data = dict(load_fixture("new_cms_lite.json"))
         callback_data["job_id"] = job_id
 
         # job_id and user_email must be in params.
@@ -256,18 +300,22 @@ async def test_display_interpretation(request):
         params["job_id"] = job_id
         params["user_email"] = user_kwargs["user_email"]
 
-        logger.debug(
-            "test_display_interpretation: "
-            + job_id + " callback_data: " + str(callback_data)
-        )
+        log_event(logger, logging.DEBUG, "test_display_interpretation",
+                  job_id=job_id, callback_data=callback_data)
 
-        asyncio.create_task(
-            send_to_callback_view_async(
-                callback_data,
+        register_job(job_id, user_kwargs["user_email"])
+        # scheduled like a real submission, behind interactive users
+        try:
+            await scheduler.submit(
                 job_id,
-                params
+                lambda: deliver_in_background(callback_data, job_id, params),
+                priority=Priority.ADMIN,
+                user=user_kwargs["user_email"],
+                key=all_kwargs.get("interpretation_key"),
             )
-        )
+        except QueueFull:
+            finish_job(job_id, user_kwargs["user_email"])
+            return too_many_requests(1, 'queue full')
 
         return JsonResponse(
             {'status': 'Request made, acknowledgement: '
@@ -0,0 +1,221 @@
+"""
+Transports for submitting jobs to the interpretation super-backend.
+
+The transport is selected by settings.INTERPRETATION_HOST_TRANSPORT, in the
+same BACKEND/OPTIONS shape as CACHES and CHANNEL_LAYERS:
+
+    INTERPRETATION_HOST_TRANSPORT = {
+        "BACKEND": "core.transports.UnixSocketTransport",
+        "OPTIONS": {"PATH": "/run/super-backend.sock"},
+    }
+
+- FlaskAppWrapperTransport: FlaskAppWrapper.query_interpretation_host, run
+  in a worker thread so it doesn't block the event loop (default).
+- HTTPTransport: JSON POST of {"job_id": ..., **kwargs} to URL over a
+  persistent, keep-alive connection pool.
+- UnixSocketTransport: the same over a Unix domain socket, for a
+  super-backend on the same host.
+- InProcessTransport: no super-backend at all. Acks immediately and
+  delivers a generated payload through complete_job, for tests and
+  embedded/demo modes.
+"""
+
+import asyncio
+import functools
+from abc import ABC, abstractmethod
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+_transport = None
+
+
+class InterpretationHostTransport(ABC):
+    """
+    Base class. submit() returns the super-backend's acknowledgement, and
+    may raise if the submission failed (query_interpretation_host logs
+    that and returns None).
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    @abstractmethod
+    async def submit(self, job_id, **kwargs):
+        pass
+
+    async def cancel(self, job_id):
+        """
+        Tell the super-backend a dispatched job is no longer wanted. The
+        default does nothing; complete_job drops late results anyway.
+        """
+        pass
+
+    async def close(self):
+        pass
+
+
+class FlaskAppWrapperTransport(InterpretationHostTransport):
+    """
+    FlaskAppWrapper has no cancellation call, so cancel() is a no-op.
+    """
+
+    async def submit(self, job_id, **kwargs):
+        from flaskappframework.flask_app_wrapper import FlaskAppWrapper
+
+        return await sync_to_async(
+            FlaskAppWrapper.query_interpretation_host,
+            thread_sensitive=False
+        )(job_id=job_id, **kwargs)
+
+
+class HTTPTransport(InterpretationHostTransport):
+    """
+    Options: URL, CANCEL_URL (optional, gets a JSON POST of {"job_id": ...}
+    when a dispatched job is cancelled), TIMEOUT (seconds), MAX_CONNECTIONS,
+    MAX_KEEPALIVE_CONNECTIONS.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.url = options["URL"]
+        self._client = None
+        self._loop = None
+
+    def _make_transport(self):
+        return httpx.AsyncHTTPTransport(limits=self._limits())
+
+    def _limits(self):
+        return httpx.Limits(
+            max_connections=self.options.get("MAX_CONNECTIONS", 100),
+            max_keepalive_connections=self.options.get(
+                "MAX_KEEPALIVE_CONNECTIONS", 20
+            ),
+        )
+
+    def _get_client(self):
+        # httpx clients are bound to the event loop they were used on
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                transport=self._make_transport(),
+                timeout=self.options.get("TIMEOUT", 10),
+            )
+            self._loop = loop
+        return self._client
+
+    async def submit(self, job_id, **kwargs):
+        response = await self._get_client().post(
+            self.url, json={"job_id": job_id, **kwargs}
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def cancel(self, job_id):
+        cancel_url = self.options.get("CANCEL_URL")
+        if cancel_url is None:
+            return
+        response = await self._get_client().post(
+            cancel_url, json={"job_id": job_id}
+        )
+        response.raise_for_status()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class UnixSocketTransport(HTTPTransport):
+    """
+    Options: PATH (socket path), URL (defaults to http://localhost/submit),
+    CANCEL_URL, TIMEOUT, MAX_CONNECTIONS, MAX_KEEPALIVE_CONNECTIONS.
+    """
+
+    def __init__(self, **options):
+        options.setdefault("URL", "http://localhost/submit")
+        super().__init__(**options)
+        self.path = options["PATH"]
+
+    def _make_transport(self):
+        return httpx.AsyncHTTPTransport(uds=self.path, limits=self._limits())
+
+
+class InProcessTransport(InterpretationHostTransport):
+    """
+    Options: HANDLER (async callable or dotted path, called as
+    handler(job_id, **kwargs) and returning the ack), DELAY (seconds before
+    the default handler delivers), SCALE (generate_interpretation_payload
+    kwargs for the default handler).
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        handler = options.get("HANDLER")
+        if isinstance(handler, str):
+            handler = import_string(handler)
+        self.handler = handler or self.loopback
+        self._tasks = {}
+
+    async def submit(self, job_id, **kwargs):
+        return await self.handler(job_id, **kwargs)
+
+    async def loopback(self, job_id, **kwargs):
+        task = asyncio.create_task(self._deliver(job_id, kwargs))
+        self._tasks[job_id] = task
+        task.add_done_callback(functools.partial(self._forget, job_id))
+        return {"status": "accepted", "job_id": job_id}
+
+    def _forget(self, job_id, task):
+        # job ids are reused by refreshes
+        if self._tasks.get(job_id) is task:
+            del self._tasks[job_id]
+
+    async def cancel(self, job_id):
+        task = self._tasks.pop(job_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _deliver(self, job_id, kwargs):
+        from core.payloads import generate_interpretation_payload
+        from core.request_logic import complete_job
+
+        await asyncio.sleep(self.options.get("DELAY", 0.1))
+        data = generate_interpretation_payload(
+            job_id=job_id, **self.options.get("SCALE", {})
+        )
+        data["user_email"] = kwargs.get("user_email")
+        await complete_job(job_id, data, kwargs.get("user_email"))
+
+
+def build_transport(config):
+    """
+    Build a transport from a BACKEND/OPTIONS dict.
+    """
+    backend = import_string(config["BACKEND"])
+    return backend(**config.get("OPTIONS", {}))
+
+
+def get_transport():
+    """
+    Return the transport configured by INTERPRETATION_HOST_TRANSPORT,
+    building it on first use.
+    """
+    global _transport
+    if _transport is None:
+        _transport = build_transport(getattr(
+            settings, "INTERPRETATION_HOST_TRANSPORT",
+            {"BACKEND": "core.transports.FlaskAppWrapperTransport"}
+        ))
+    return _transport
+
+
+@receiver(setting_changed)
+def _reset_transport(setting, **kwargs):
+    global _transport
+    if setting == "INTERPRETATION_HOST_TRANSPORT":
+        _transport = None
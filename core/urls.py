@@ -35,6 +35,22 @@ urlpatterns = [
          request_logic.check_request_status,
          name="check_request_status"
          ),
+    path("cancel_job/",
+         views.cancel_job_view,
+         name="cancel_job"
+         ),
+    path("profiles/",
+         views.profiles_view,
+         name="profiles"
+         ),
+    path("profiles/<uuid:profile_id>/",
+         views.profiles_view,
+         name="profile_download"
+         ),
+    path("worker_stats/",
+         views.worker_stats_view,
+         name="worker_stats"
+         ),
     path("test_get_interpretations/",
          test_views.test_get_interpretations,
          name="test_get_interpretations"),
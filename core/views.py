@@ -1,16 +1,23 @@
 import json
+import logging
 import traceback
 import uuid
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 import httpx
-from flaskappframework.flask_app_wrapper import FlaskAppWrapper
 from flaskappframework import logging_mp
 from core.request_logic import (
     get_callback_and_payload_from_request,
     prep_request
 )
+from .admission import admission_control, too_many_requests
 from .callbacks import set_callbacks
+from .profiling import profile_request, get_profile, list_profiles
+from .cancellation import cancel_job, finish_job, register_job
+from .logs import log_event
+from .metrics import collect_stats
+from .scheduler import Priority, QueueFull, scheduler, scheduler_setting
+from .transports import get_transport
 
 from functools import wraps
 from asgiref.sync import sync_to_async
@@ -21,18 +28,26 @@ from adrf.decorators import api_view
 logger = logging_mp.bring_logger_to_here()
 
 
+async def resolve_request_user(request):
+    """
+    The request's user, loaded in at most one thread hop (from the cache,
+    see users.backends).
+
+    :param request: A Django or DRF request
+    :return: The user, or AnonymousUser
+    """
+    return await request.auser()
+
+
 def user_is_approved_for_request(view_func):
     @wraps(view_func)
     async def _wrapped_view(request, *args, **kwargs):
         try:
 
-            # Wrap the synchronous checks in sync_to_async
-            is_authenticated = await sync_to_async(
-                lambda: request.user.is_authenticated
-            )()
-            is_approved = await sync_to_async(lambda: request.user.approved)()
+            user = await resolve_request_user(request)
 
-            if not is_authenticated or not is_approved:
+            if not user.is_authenticated \
+                    or not getattr(user, "approved", False):
                 return JsonResponse(
                     {'status':
                      'Request not made, incorrect user auth / approval'},
@@ -75,10 +90,34 @@ def fetch_user_email(user):
     return user.email
 
 
+async def query_interpretation_host(job_id, **kwargs):
+    """
+    Submit a job to the super-backend and return its acknowledgement.
+
+    The transport (FlaskAppWrapper, pooled HTTP, Unix domain socket or
+    in-process) is chosen by settings.INTERPRETATION_HOST_TRANSPORT,
+    see core/transports.py.
+
+    :param job_id: The job_id the super-backend should call back with
+    :param kwargs: The interpretation and user kwargs
+    :return: The acknowledgement, or None if the submission failed
+    """
+    try:
+        return await get_transport().submit(job_id, **kwargs)
+    except Exception as e:
+        # HTTP errors, acks that aren't JSON, FlaskAppWrapper's own errors
+        log_event(logger, logging.WARNING, "query_interpretation_host",
+                  job_id=job_id, exception=e)
+        return None
+
+
 @api_view(['GET'])
 @user_is_approved_for_request
+@admission_control
+@profile_request
 async def async_interpretations_view(request):
-    logger.info("async_interpretations_view " + str(request.GET))
+    log_event(logger, logging.INFO, "async_interpretations_view",
+              get=request.GET)
     """
     The async_interpretations_view function is a view that takes
     in a GET request and returns an acknowledgement of the request
@@ -119,8 +158,15 @@ async def async_interpretations_view(request):
     except KeyError:
         job_id = str(uuid.uuid4())
 
-    logger.debug("async_interpretations_view: " + job_id + " callback: "
-                 + str(callback) + " extra_payload: " + str(extra_payload))
+    # dashboards pre-warming data can ask to be scheduled behind
+    # interactive requests
+    if extra_payload.pop("priority", None) == "background":
+        priority = Priority.BACKGROUND
+    else:
+        priority = Priority.INTERACTIVE
+
+    log_event(logger, logging.DEBUG, "async_interpretations_view",
+              job_id=job_id, callback=callback, extra_payload=extra_payload)
 
     if not callback:
         return JsonResponse({'status': 'Invalid callback name'}, status=400)
@@ -141,16 +187,25 @@ async def async_interpretations_view(request):
     # instead, we have wrapped the user parameters in the extra_payload
     # from the react side (is that secure)?
     all_kwargs = {**extra_payload, **user_kwargs}
+    register_job(job_id, user_kwargs["user_email"])
 
-    logger.info(
-        "async_interpretations_view: " + job_id + " kwargs: "
-        + str(all_kwargs)
-    )
+    log_event(logger, logging.INFO, "async_interpretations_view",
+              job_id=job_id, kwargs=all_kwargs)
 
-    response_data = FlaskAppWrapper.query_interpretation_host(
-        job_id=job_id,
-        **all_kwargs
-    )
+    try:
+        response_data = await scheduler.submit(
+            job_id,
+            lambda: query_interpretation_host(job_id, **all_kwargs),
+            priority=priority,
+            user=user_kwargs["user_email"],
+            key=all_kwargs.get("interpretation_key"),
+            weight=scheduler_setting("ROLE_WEIGHTS").get(
+                user_kwargs["user_role"], 1.0
+            ),
+        )
+    except QueueFull:
+        finish_job(job_id, user_kwargs["user_email"])
+        return too_many_requests(1, 'queue full')
 
     return JsonResponse(
         {'status': 'Request made, acknowledgement: ' + str(response_data),
@@ -158,6 +213,84 @@ async def async_interpretations_view(request):
         status=200)
 
 
+@api_view(['GET'])
+@user_is_approved_for_request
+async def profiles_view(request, profile_id=None):
+    """
+    The profiles_view function lists the stored request profiles, or
+    downloads one of them as collapsed stacks (flamegraph.pl / speedscope
+    compatible) when a profile_id is given. Admins only.
+
+    :param request: Get the user from the request
+    :param profile_id: Optional id of the profile to download
+    :return: A jsonresponse with the profile index, or the collapsed stacks
+    """
+    user_role = await fetch_user_role(request.user)
+    if user_role.lower() != "ADMIN".lower():
+        return JsonResponse(
+            {'status': 'Request not made, incorrect user role'},
+            status=400
+        )
+
+    if profile_id is None:
+        return JsonResponse({'profiles': list_profiles()}, status=200)
+
+    profile = get_profile(profile_id)
+    if profile is None:
+        return JsonResponse(
+            {'status': 'Invalid profile ID: ' + str(profile_id)},
+            status=404
+        )
+
+    response = HttpResponse(profile["stacks"], content_type="text/plain")
+    response["Content-Disposition"] = \
+        f'attachment; filename="{profile_id}.collapsed"'
+    return response
+
+
+@api_view(['POST'])
+@user_is_approved_for_request
+async def cancel_job_view(request):
+    """
+    The cancel_job_view function cancels one of the user's jobs, given by
+    the job_id query parameter. The job is dropped from the scheduler queue
+    if it hasn't been sent to the super-backend yet, and its result is
+    discarded when it arrives.
+
+    :param request: Get the job_id from the url
+    :return: A jsonresponse with the status of the cancellation
+    """
+    job_id = request.GET.get('job_id')
+    user_email = await fetch_user_email(request.user)
+    if not await cancel_job(job_id, user_email):
+        return JsonResponse(
+            {'status': 'No outstanding job: ' + str(job_id)},
+            status=404
+        )
+    return JsonResponse({'status': 'Job cancelled', 'job_id': job_id},
+                        status=200)
+
+
+@api_view(['GET'])
+@user_is_approved_for_request
+async def worker_stats_view(request):
+    """
+    The worker_stats_view function returns the runtime statistics of the
+    worker that serves the request (scheduler queues, admission control,
+    ...). Admins only.
+
+    :param request: Get the user from the request
+    :return: A jsonresponse with the worker's stats
+    """
+    user_role = await fetch_user_role(request.user)
+    if user_role.lower() != "ADMIN".lower():
+        return JsonResponse(
+            {'status': 'Request not made, incorrect user role'},
+            status=400
+        )
+    return JsonResponse(collect_stats(), status=200)
+
+
 @csrf_exempt
 def control(request, name, action):
     if request.method == 'POST':
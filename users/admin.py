@@ -1,12 +1,98 @@
-from django.contrib import admin
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
 
+from .backends import invalidate_user
 from .models import (
     CustomUser,
     GroupTag,
     InterestTag,
     InterpretationKeysForEmail
 )
+from .versioning import bump_profile_version
+
+
+def estimated_row_count(model):
+    """
+    A cheap estimate of the number of rows in a model's table.
+
+    :return: The estimate, or None where the database has none
+    """
+    connection = connections[model.objects.db]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+    if connection.vendor == "sqlite":
+        # the largest rowid, read from the end of the primary key index;
+        # overestimates by the rows deleted
+        return model.objects.aggregate(max_pk=Max("pk"))["max_pk"] or 0
+    return None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that estimates the count of large unfiltered changelists,
+    instead of running COUNT(*) over the whole table on every page.
+    Filtered and searched changelists, and tables under
+    ADMIN_ESTIMATED_COUNT_THRESHOLD rows, are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model)
+            if estimate is not None and estimate > getattr(
+                settings, "ADMIN_ESTIMATED_COUNT_THRESHOLD", 10000
+            ):
+                return estimate
+        return super().count
+
+
+def pk_chunks(queryset):
+    """
+    The primary keys of a queryset, in chunks of ADMIN_ACTION_CHUNK_SIZE,
+    read one chunk at a time after the last key of the previous one. Rows
+    changed by the caller in between, even out of the queryset's filter,
+    don't affect the chunks that follow.
+
+    :param queryset: e.g. the selection of an admin action
+    :return: Generator of lists of primary keys
+    """
+    size = getattr(settings, "ADMIN_ACTION_CHUNK_SIZE", 1000)
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None \
+            else queryset.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list("pk", flat=True)[:size])
+        if pks:
+            yield pks
+        if len(pks) < size:
+            return
+        last_pk = pks[-1]
+
+
+class AssignGroupTagForm(forms.Form):
+    # looked up by name, rather than a select of every tag
+    group_tag = forms.ModelChoiceField(
+        queryset=GroupTag.objects.all(),
+        to_field_name='name',
+        widget=forms.TextInput,
+        help_text='Name of an existing group tag',
+    )
 
 
 class CustomUserAdmin(BaseUserAdmin):
@@ -66,8 +152,96 @@ class CustomUserAdmin(BaseUserAdmin):
     # Specify the filter options in the admin list view
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'role', 'approved')
 
+    # Large user bases: estimated counts, and tag widgets that only load
+    # the selected tags
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    autocomplete_fields = (
+        'group_tags',
+        'interest_tags',
+        'interpretation_keys_for_emails'
+    )
+
+    actions = ['approve_users', 'revoke_approval', 'assign_group_tag']
+
+    # The bulk actions write with an UPDATE or bulk insert per chunk of the
+    # selection (so "select all" on a large table neither loads every id
+    # nor exceeds the database's limit on query parameters). These send no
+    # signals, so they drop cached auth snapshots and bump profile versions
+    # themselves after each write (see users/backends.py and
+    # users/versioning.py)
+
+    @admin.action(description='Approve selected users')
+    def approve_users(self, request, queryset):
+        self._set_approved(request, queryset, True)
+
+    @admin.action(description='Revoke approval of selected users')
+    def revoke_approval(self, request, queryset):
+        self._set_approved(request, queryset, False)
+
+    def _set_approved(self, request, queryset, approved):
+        updated = 0
+        for user_ids in pk_chunks(queryset):
+            updated += CustomUser.objects.filter(pk__in=user_ids).update(
+                approved=approved
+            )
+            invalidate_user(*user_ids)
+            bump_profile_version(*user_ids)
+        self.message_user(
+            request,
+            f"{'Approved' if approved else 'Revoked approval of'} "
+            f"{updated} users.",
+            messages.SUCCESS,
+        )
+
+    @admin.action(description='Assign a group tag to selected users')
+    def assign_group_tag(self, request, queryset):
+        form = AssignGroupTagForm(
+            request.POST if 'apply' in request.POST else None
+        )
+        if form.is_valid():
+            tag = form.cleaned_data['group_tag']
+            through = CustomUser.group_tags.through
+            assigned = 0
+            for user_ids in pk_chunks(queryset):
+                through.objects.bulk_create(
+                    [through(customuser_id=user_id, grouptag_id=tag.pk)
+                     for user_id in user_ids],
+                    ignore_conflicts=True,
+                )
+                bump_profile_version(*user_ids)
+                assigned += len(user_ids)
+            self.message_user(
+                request,
+                f"Assigned {tag} to {assigned} users.",
+                messages.SUCCESS,
+            )
+            return None
+
+        # intermediate page picking the tag; posts back to this action
+        return TemplateResponse(
+            request,
+            'admin/users/customuser/assign_group_tag.html',
+            {
+                **self.admin_site.each_context(request),
+                'title': 'Assign a group tag',
+                'opts': self.model._meta,
+                'form': form,
+                'queryset': queryset,
+                'selected': request.POST.getlist(ACTION_CHECKBOX_NAME),
+                'select_across': request.POST.get('select_across', '0'),
+                'action_checkbox_name': ACTION_CHECKBOX_NAME,
+            },
+        )
+
+
+class TagAdmin(admin.ModelAdmin):
+    # searched by the user admin's autocomplete widgets
+    search_fields = ('name',)
+    ordering = ('name',)
+
 
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(GroupTag)
-admin.site.register(InterestTag)
-admin.site.register(InterpretationKeysForEmail)
+admin.site.register(GroupTag, TagAdmin)
+admin.site.register(InterestTag, TagAdmin)
+admin.site.register(InterpretationKeysForEmail, TagAdmin)
@@ -0,0 +1,99 @@
+"""
+Authentication backend that resolves session users from the cache.
+
+Every view request (AuthenticationMiddleware) and websocket connect
+(channels' AuthMiddlewareStack) loads the session's user through the
+backend's get_user. CachedModelBackend keeps a snapshot of the user row in
+the cache, so with cached_db sessions neither touches the database on the
+hot path. The snapshot leaves the password hash out. It holds the session
+auth hash and whether the password is usable instead, which is all
+session verification and the admin's pages need. The restored user has
+password deferred, so anything that does need it (a password check,
+save()) loads it from the database.
+
+Snapshots are dropped on every save of the user (approval, role, password
+changes, logins) and on logout, see users.signals; AUTH_USER_CACHE["TTL"]
+bounds staleness from QuerySet.update(), which sends no signals.
+
+Sessions stored under ModelBackend (from before this backend) keep
+working, as ModelBackend stays in AUTHENTICATION_BACKENDS; it only loads
+their users, authenticate() stops at this backend.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+
+DEFAULTS = {
+    "TTL": 300,
+}
+
+
+def auth_cache_setting(name):
+    return getattr(settings, "AUTH_USER_CACHE", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def user_cache_key(user_id):
+    return f"auth_user_{user_id}"
+
+
+def invalidate_user(*user_ids):
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
+
+
+def snapshot_user(user):
+    """
+    :param user: A user loaded from the database
+    :return: What the cache keeps of it: its fields but the password, its
+        session auth hash, and whether it has a usable password
+    """
+    return {
+        "fields": {
+            field.attname: getattr(user, field.attname)
+            for field in type(user)._meta.concrete_fields
+            if field.attname != "password"
+        },
+        "session_auth_hash": user.get_session_auth_hash(),
+        "has_usable_password": user.has_usable_password(),
+    }
+
+
+def restore_user(snapshot):
+    """
+    :param snapshot: A snapshot_user() result
+    :return: The user, with password deferred
+    """
+    fields = snapshot["fields"]
+    user = get_user_model().from_db(DEFAULT_DB_ALIAS, list(fields),
+                                    list(fields.values()))
+    user._session_auth_hash = snapshot["session_auth_hash"]
+    user._has_usable_password = snapshot["has_usable_password"]
+    return user
+
+
+class CachedModelBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username, password, **kwargs)
+        if user is None and password is not None:
+            # don't let ModelBackend, listed after this backend for old
+            # sessions, hash the same credentials again
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, snapshot_user(user), auth_cache_setting("TTL"))
+            return user
+        user = restore_user(snapshot)
+        # get_user returns None for users that can't log in
+        return user if self.user_can_authenticate(user) else None
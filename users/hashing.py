@@ -0,0 +1,135 @@
+"""
+Password hashing off the shared sync thread.
+
+authenticate() and set_password() spend most of their time in PBKDF2. Run
+through sync_to_async they occupy the thread every thread-sensitive ORM
+call shares, so a burst of logins at shift start would hold up the async
+interpretation views. The async login, sign-up and change-password views
+run their form validation (which hashes) in a dedicated pool of
+MAX_WORKERS threads instead, and only touch the shared thread for the
+session write.
+
+Logins in progress are also capped per client IP
+(MAX_CONCURRENT_PER_IP); attempts beyond it are answered with a 429
+without hashing anything.
+
+Configured by settings.PASSWORD_HASHING.
+"""
+
+import asyncio
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from core.metrics import register_stats
+
+DEFAULTS = {
+    "MAX_WORKERS": 4,
+    "MAX_CONCURRENT_PER_IP": 3,
+}
+
+_executor = None
+_in_flight = Counter()
+_counters = Counter()
+
+
+class TooManyAttempts(Exception):
+    pass
+
+
+def hashing_setting(name):
+    return getattr(settings, "PASSWORD_HASHING", {}).get(
+        name, DEFAULTS[name]
+    )
+
+
+def hashing_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=hashing_setting("MAX_WORKERS"),
+            thread_name_prefix="password-hashing",
+        )
+    return _executor
+
+
+async def run_hashing(func, *args, **kwargs):
+    """
+    Run a sync function that hashes passwords (and may query the database)
+    in the hashing pool.
+
+    :param func: The function
+    :return: Its result
+    """
+    def call():
+        # the pool's threads keep their own connections, so treat each call
+        # like a request
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    _counters["calls"] += 1
+    return await asyncio.get_running_loop().run_in_executor(
+        hashing_executor(), call
+    )
+
+
+async def validate_form(request, form, save=False):
+    """
+    Validate (and save) a form whose validation hashes passwords, in the
+    hashing pool and within one of the client IP's slots.
+
+    :param request: The request
+    :param form: A bound form
+    :param save: Whether to save the form if it is valid
+    :return: Whether the form is valid
+    :raises TooManyAttempts: If the IP has too many attempts in progress
+    """
+    def validate():
+        if not form.is_valid():
+            return False
+        if save:
+            form.save()
+        return True
+
+    with ip_slot(request):
+        return await run_hashing(validate)
+
+
+@contextmanager
+def ip_slot(request):
+    """
+    Hold one of the client IP's concurrent login slots.
+
+    :param request: The request
+    :raises TooManyAttempts: If the IP has MAX_CONCURRENT_PER_IP logins in
+        progress already
+    """
+    ip = request.META.get("REMOTE_ADDR", "")
+    if _in_flight[ip] >= hashing_setting("MAX_CONCURRENT_PER_IP"):
+        _counters["rejected"] += 1
+        raise TooManyAttempts(ip)
+    _in_flight[ip] += 1
+    try:
+        yield
+    finally:
+        _in_flight[ip] -= 1
+        if not _in_flight[ip]:
+            del _in_flight[ip]
+
+
+def stats():
+    return {
+        **_counters,
+        "max_workers": hashing_setting("MAX_WORKERS"),
+        "in_flight": sum(_in_flight.values()),
+        "ips": len(_in_flight),
+    }
+
+
+register_stats("password_hashing", stats)
@@ -0,0 +1,244 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from users.models import (
+    CustomUser,
+    GroupTag,
+    InterestTag,
+    InterpretationKeysForEmail
+)
+
+# input field -> (CustomUser M2M field, tag model)
+TAG_FIELDS = {
+    "group_tags": ("group_tags", GroupTag),
+    "interest_tags": ("interest_tags", InterestTag),
+    "interpretation_keys": ("interpretation_keys_for_emails",
+                            InterpretationKeysForEmail),
+}
+
+# separator of tag names within a CSV cell
+CSV_TAG_SEPARATOR = ";"
+
+
+def _init_worker(settings_module):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
+    django.setup()
+
+
+def _hash(password):
+    return make_password(password)
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users and their group tags, interest tags and interpretation "
+        "keys from a CSV or JSON file. CSV columns: email, first_name, "
+        "last_name, role, password, approved, group_tags, interest_tags, "
+        "interpretation_keys, with tag names separated by ';'. JSON: a list "
+        "of objects with the same keys, tags as lists. Users whose email "
+        "already exists are skipped; tags are created by name as needed. "
+        "Passwords are hashed in a process pool; users without one get an "
+        "unusable password (they can reset it)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=["csv", "json"],
+                            help="Defaults to the file extension")
+        parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                            help="Password hashing processes")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--approve", action="store_true",
+                            help="Approve users without an approved value")
+
+    def handle(self, *args, **options):
+        timings = {}
+        start = time.perf_counter()
+        rows = self._read(options["path"], options["format"])
+        timings["read"] = time.perf_counter() - start
+
+        users, links, skipped = self._prepare(rows, options["approve"])
+        if not users:
+            self.stdout.write(f"Nothing to import ({skipped} skipped)")
+            return
+
+        start = time.perf_counter()
+        self._hash_passwords(users, options["workers"])
+        timings["hash"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with transaction.atomic():
+            tags_created = self._upsert_tags(links)
+            CustomUser.objects.bulk_create(users,
+                                           batch_size=options["batch_size"])
+            # bulk_create doesn't set pks on every backend
+            emails = [user.email for user in users]
+            user_ids = {}
+            for i in range(0, len(emails), options["batch_size"]):
+                user_ids.update(
+                    CustomUser.objects.filter(
+                        email__in=emails[i:i + options["batch_size"]]
+                    ).values_list("email", "pk")
+                )
+            links_created = self._link(links, user_ids,
+                                       options["batch_size"])
+        timings["write"] = time.perf_counter() - start
+
+        total = sum(timings.values())
+        self.stdout.write(
+            f"Imported {len(users)} users ({skipped} skipped), "
+            f"{tags_created} new tags, {links_created} tag links in "
+            f"{total:.2f}s ({len(users) / total:.0f} users/s; "
+            + ", ".join(f"{name} {seconds:.2f}s"
+                        for name, seconds in timings.items())
+            + ")"
+        )
+
+    @staticmethod
+    def _read(path, fmt):
+        fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+        with open(path, newline="", encoding="utf-8") as f:
+            if fmt == "json":
+                return json.load(f)
+            if fmt == "csv":
+                rows = []
+                for row in csv.DictReader(f):
+                    for field in TAG_FIELDS:
+                        row[field] = (row.get(field) or "").split(
+                            CSV_TAG_SEPARATOR
+                        )
+                    rows.append(row)
+                return rows
+        raise CommandError(f"Unknown format: {fmt}")
+
+    @staticmethod
+    def _prepare(rows, approve):
+        """
+        :return: Unsaved users, {input tag field: {email: tag names}}, and
+            the number of rows skipped as existing users
+        """
+        roles = set(CustomUser.Role.values)
+        existing = set(CustomUser.objects.values_list("email", flat=True))
+        users = []
+        links = {field: {} for field in TAG_FIELDS}
+        skipped = 0
+        for number, row in enumerate(rows, 1):
+            email = CustomUser.objects.normalize_email(
+                (row.get("email") or "").strip()
+            )
+            if not email or not row.get("first_name") \
+                    or not row.get("last_name"):
+                raise CommandError(
+                    f"Row {number}: email, first_name and last_name are "
+                    f"required"
+                )
+            if email in existing:
+                skipped += 1
+                continue
+            existing.add(email)
+
+            role = row.get("role") or CustomUser.Role.USER
+            if role not in roles:
+                raise CommandError(f"Row {number}: unknown role {role!r}")
+            approved = row.get("approved")
+            if approved in (None, ""):
+                approved = approve
+            elif isinstance(approved, str):
+                approved = approved.strip().lower() in ("1", "true", "yes")
+
+            user = CustomUser(email=email, first_name=row["first_name"],
+                              last_name=row["last_name"], role=role,
+                              approved=bool(approved))
+            # hashed later, in the pool
+            user.password = row.get("password") or None
+            users.append(user)
+            for field in TAG_FIELDS:
+                value = row.get(field) or []
+                if not isinstance(value, list):
+                    raise CommandError(
+                        f"Row {number}: {field} must be a list of tag names"
+                    )
+                names = {str(name).strip() for name in value}
+                names.discard("")
+                if names:
+                    links[field][email] = names
+        return users, links, skipped
+
+    @staticmethod
+    def _hash_passwords(users, workers):
+        to_hash = [user for user in users if user.password]
+        for user in users:
+            if not user.password:
+                user.set_unusable_password()
+        if not to_hash:
+            return
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(os.environ["DJANGO_SETTINGS_MODULE"],),
+        ) as pool:
+            hashed = pool.map(_hash, [user.password for user in to_hash],
+                              chunksize=max(1, len(to_hash) // workers // 4))
+            for user, password in zip(to_hash, hashed):
+                user.password = password
+
+    @staticmethod
+    def _upsert_tags(links):
+        """
+        Create the tags that don't exist yet, by name.
+
+        :return: The number of tags created
+        """
+        created = 0
+        for field, (_, model) in TAG_FIELDS.items():
+            names = set().union(*links[field].values())
+            existing = set(
+                model.objects.filter(name__in=names)
+                .values_list("name", flat=True)
+            )
+            new = [model(name=name) for name in names - existing]
+            # group and interest tag names are unique, so concurrent
+            # imports can't duplicate them; those rows are skipped, and
+            # not counted
+            before = model.objects.count()
+            model.objects.bulk_create(new, ignore_conflicts=True)
+            created += model.objects.count() - before
+        return created
+
+    @staticmethod
+    def _link(links, user_ids, batch_size):
+        """
+        Insert the through-table rows linking users to their tags.
+
+        :return: The number of rows inserted
+        """
+        created = 0
+        for field, (m2m_field, model) in TAG_FIELDS.items():
+            names = set().union(*links[field].values())
+            tag_ids = {}
+            # interpretation key names aren't unique; take the oldest
+            for pk, name in (model.objects.filter(name__in=names)
+                             .order_by("-pk").values_list("pk", "name")):
+                tag_ids[name] = pk
+            through = getattr(CustomUser, m2m_field).through
+            tag_column = f"{model._meta.model_name}_id"
+            rows = [
+                through(customuser_id=user_ids[email],
+                        **{tag_column: tag_ids[name]})
+                for email, user_names in links[field].items()
+                for name in user_names
+            ]
+            # counted, as ignore_conflicts skips rows silently
+            before = through.objects.count()
+            through.objects.bulk_create(rows, batch_size=batch_size,
+                                        ignore_conflicts=True)
+            created += through.objects.count() - before
+        return created
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    """
+    Merge tags sharing a name into the oldest one, moving their users over,
+    so the names can be made unique.
+    """
+    CustomUser = apps.get_model('users', 'CustomUser')
+    for model_name, field in (('GroupTag', 'group_tags'),
+                              ('InterestTag', 'interest_tags')):
+        Tag = apps.get_model('users', model_name)
+        through = getattr(CustomUser, field).through
+        tag_column = f'{model_name.lower()}_id'
+        duplicated = (Tag.objects.values('name')
+                      .annotate(count=models.Count('id'))
+                      .filter(count__gt=1)
+                      .values_list('name', flat=True))
+        for name in list(duplicated):
+            keep, *merged = Tag.objects.filter(name=name).order_by('id')
+            merged_ids = [tag.id for tag in merged]
+            user_ids = set(
+                through.objects.filter(**{f'{tag_column}__in': merged_ids})
+                .values_list('customuser_id', flat=True)
+            )
+            user_ids -= set(
+                through.objects.filter(**{tag_column: keep.id})
+                .values_list('customuser_id', flat=True)
+            )
+            through.objects.bulk_create(
+                through(customuser_id=user_id, **{tag_column: keep.id})
+                for user_id in user_ids
+            )
+            Tag.objects.filter(id__in=merged_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_grouptag_interesttag_interpretationkeysforemail_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags,
+                             migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='grouptag',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='interesttag',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
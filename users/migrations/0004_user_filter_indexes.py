@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0003_unique_tag_names'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['approved', 'role'], name='users_custo_approve_451276_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['role'], name='users_custo_role_6a37b1_idx'),
+        ),
+    ]
@@ -15,10 +15,10 @@ class GroupTag(models.Model):
     Represents a group tag.
 
     Attributes:
-        name (str): The name of the group tag.
+        name (str): The unique name of the group tag.
     """
 
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
     def __str__(self):
         return self.name
@@ -29,10 +29,10 @@ class InterestTag(models.Model):
     Represents an interest tag.
 
     Attributes:
-        name (str): The name of the interest tag.
+        name (str): The unique name of the interest tag.
     """
 
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
 
     def __str__(self):
         return self.name
@@ -198,6 +198,26 @@ class CustomUser(AbstractUser):
 
     class Meta:
         verbose_name_plural = "Users"
+        indexes = [
+            # the admin's approved and role filters
+            models.Index(fields=['approved', 'role']),
+            models.Index(fields=['role']),
+        ]
 
     def __str__(self) -> str:
         return self.email
+
+    def get_session_auth_hash(self):
+        # users loaded from users.backends' snapshots carry the hash instead
+        # of the (deferred) password hash
+        if "password" not in self.__dict__ \
+                and hasattr(self, "_session_auth_hash"):
+            return self._session_auth_hash
+        return super().get_session_auth_hash()
+
+    def has_usable_password(self):
+        # the admin asks on every page, see get_session_auth_hash
+        if "password" not in self.__dict__ \
+                and hasattr(self, "_has_usable_password"):
+            return self._has_usable_password
+        return super().has_usable_password()
@@ -10,6 +10,9 @@ to and from JSON format for communication with the frontend or other services.
 from rest_framework import serializers
 from users.models import (
   CustomUser,
+  GroupTag,
+  InterestTag,
+  InterpretationKeysForEmail
 )
 
 
@@ -29,3 +32,43 @@ class CustomUserSerializer(serializers.ModelSerializer):
             'interest_tags', 'group_tags',
             'interpretation_keys_for_emails'
         )
+
+
+class GroupTagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GroupTag
+        fields = ('id', 'name')
+
+
+class InterestTagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InterestTag
+        fields = ('id', 'name')
+
+
+class InterpretationKeysForEmailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = InterpretationKeysForEmail
+        fields = ('id', 'name')
+
+
+class LoggedInUserSerializer(CustomUserSerializer):
+    """
+    Read-only serializer for the logged-in user, with tags nested by name.
+
+    The tag sets should be prefetched (see PREFETCH), so serializing takes
+    no further queries.
+    """
+
+    PREFETCH = (
+        'interest_tags', 'group_tags', 'interpretation_keys_for_emails'
+    )
+
+    interest_tags = InterestTagSerializer(many=True, read_only=True)
+    group_tags = GroupTagSerializer(many=True, read_only=True)
+    interpretation_keys_for_emails = InterpretationKeysForEmailSerializer(
+        many=True, read_only=True
+    )
+
+    class Meta(CustomUserSerializer.Meta):
+        read_only_fields = CustomUserSerializer.Meta.fields
@@ -0,0 +1,82 @@
+"""
+Signal handlers that bump profile versions (users.versioning) whenever a
+user, their tags, or the tags themselves change, and that drop cached
+auth snapshots (users.backends) when a user is saved or logs out.
+"""
+
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete
+)
+
+from users.models import (
+    CustomUser,
+    GroupTag,
+    InterestTag,
+    InterpretationKeysForEmail
+)
+from users.backends import invalidate_user
+from users.versioning import bump_profile_version
+
+TAG_FIELDS = {
+    GroupTag: "group_tags",
+    InterestTag: "interest_tags",
+    InterpretationKeysForEmail: "interpretation_keys_for_emails",
+}
+
+# fields saved on their own that the API doesn't return
+NOT_SERIALIZED = {"last_login", "password"}
+
+
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # every field, as the snapshot is the whole row
+    invalidate_user(instance.pk)
+    if update_fields and set(update_fields) <= NOT_SERIALIZED:
+        return
+    bump_profile_version(instance.pk)
+
+
+def tag_changed(sender, instance, **kwargs):
+    user_ids = list(
+        CustomUser.objects.filter(
+            **{TAG_FIELDS[sender]: instance}
+        ).values_list("pk", flat=True)
+    )
+    if user_ids:
+        bump_profile_version(*user_ids)
+
+
+def user_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.group_tags.add(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            bump_profile_version(instance.pk)
+    elif action in ("post_add", "post_remove") and pk_set:
+        # tag.customuser_set.add(...)
+        bump_profile_version(*pk_set)
+    elif action == "pre_clear":
+        # pk_set is None on clear, so look the users up first
+        tag_changed(type(instance), instance)
+
+
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.pk)
+
+
+post_save.connect(user_saved, sender=CustomUser)
+post_delete.connect(user_deleted, sender=CustomUser)
+user_logged_out.connect(user_logged_out_handler)
+for tag_model, field in TAG_FIELDS.items():
+    m2m_changed.connect(user_tags_changed,
+                        sender=getattr(CustomUser, field).through)
+    post_save.connect(tag_changed, sender=tag_model)
+    # before the cascade removes the through rows
+    pre_delete.connect(tag_changed, sender=tag_model)
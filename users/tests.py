@@ -0,0 +1,326 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from users.backends import user_cache_key
+from users.models import (
+    CustomUser,
+    GroupTag,
+    InterestTag,
+    InterpretationKeysForEmail
+)
+from users.versioning import profile_version
+
+# admin pages render {% static %}, which the manifest storage can't resolve
+# without collectstatic
+STATIC_STORAGES = {
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+
+# below the 151 users of the tests, so the unfiltered changelist estimates
+ESTIMATE_ABOVE = 100
+
+
+@override_settings(STORAGES=STATIC_STORAGES,
+                   ADMIN_ESTIMATED_COUNT_THRESHOLD=ESTIMATE_ABOVE)
+class UserAdminQueryTests(TestCase):
+    """
+    The user admin's query counts, which must not grow with the number of
+    users or tags (see users/admin.py). The admin's session and user come
+    from the cache, so the counts are the pages' own queries.
+    """
+
+    changelist_url = reverse("admin:users_customuser_changelist")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser(
+            "Admin", "User", "admin@example.com", "password"
+        )
+        cls.group_tags = GroupTag.objects.bulk_create(
+            GroupTag(name=f"site-{i}") for i in range(50)
+        )
+        InterestTag.objects.bulk_create(
+            InterestTag(name=f"interest-{i}") for i in range(50)
+        )
+        CustomUser.objects.bulk_create(
+            CustomUser(email=f"user-{i}@example.com", first_name="User",
+                       last_name=str(i), role=CustomUser.Role.USER,
+                       approved=bool(i % 2))
+            for i in range(150)
+        )
+        cls.user = CustomUser.objects.get(email="user-1@example.com")
+        cls.user.group_tags.add(*cls.group_tags[:2])
+        cls.user_ids = list(
+            CustomUser.objects.filter(email__startswith="user-")
+            .order_by("pk").values_list("pk", flat=True)[:5]
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+        # cache the session, the admin's snapshot and the content type
+        self.client.get(reverse("admin:index"))
+        ContentType.objects.get_for_model(CustomUser)
+
+    def test_unfiltered_changelist_estimates_the_count(self):
+        with self.assertNumQueries(2) as queries:
+            response = self.client.get(self.changelist_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any("COUNT(" in query["sql"]
+                             for query in queries.captured_queries))
+
+    def test_unfiltered_changelist_counts_small_tables(self):
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10000):
+            # the estimate, then the exact count under the threshold
+            with self.assertNumQueries(3) as queries:
+                response = self.client.get(self.changelist_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any("COUNT(" in query["sql"]
+                            for query in queries.captured_queries))
+        self.assertEqual(response.context["cl"].result_count, 151)
+
+    def test_filtered_changelist_counts_exactly(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                self.changelist_url,
+                {"approved__exact": "1", "role__exact": "USER"},
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["cl"].result_count, 75)
+
+    def test_change_form_only_loads_selected_tags(self):
+        url = reverse("admin:users_customuser_change", args=[self.user.pk])
+        # the user and its three tag fields, in a savepoint, then the
+        # selected group tags for the widget
+        with self.assertNumQueries(7):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "data-field-name=", count=3)
+        # the two selected group tags, not the 100 tags there are
+        self.assertContains(response, "<option value=", count=2 + 3)
+
+    def test_approve_users(self):
+        cache.set(user_cache_key(self.user_ids[0]), {})
+        versions = [profile_version(pk) for pk in self.user_ids]
+        with self.assertNumQueries(3):
+            self.client.post(self.changelist_url, {
+                "action": "approve_users",
+                ACTION_CHECKBOX_NAME: self.user_ids,
+            })
+        self.assertEqual(
+            CustomUser.objects.filter(pk__in=self.user_ids,
+                                      approved=True).count(),
+            5,
+        )
+        self.assertIsNone(cache.get(user_cache_key(self.user_ids[0])))
+        self.assertNotEqual(
+            [profile_version(pk) for pk in self.user_ids], versions
+        )
+
+    def test_revoke_approval(self):
+        cache.set(user_cache_key(self.user_ids[0]), {})
+        with self.assertNumQueries(3):
+            self.client.post(self.changelist_url, {
+                "action": "revoke_approval",
+                ACTION_CHECKBOX_NAME: self.user_ids,
+            })
+        self.assertFalse(
+            CustomUser.objects.filter(pk__in=self.user_ids,
+                                      approved=True).exists()
+        )
+        self.assertIsNone(cache.get(user_cache_key(self.user_ids[0])))
+
+    @override_settings(ADMIN_ACTION_CHUNK_SIZE=20)
+    def test_approve_all_pending_users_in_chunks(self):
+        pending = list(CustomUser.objects.filter(approved=False)
+                       .order_by("pk").values_list("pk", flat=True))
+        cache.set(user_cache_key(pending[-1]), {})
+        # the filter no longer matches the users approved by earlier chunks
+        self.client.post(self.changelist_url + "?approved__exact=0", {
+            "action": "approve_users",
+            ACTION_CHECKBOX_NAME: pending[:1],
+            "select_across": "1",
+        })
+        self.assertFalse(CustomUser.objects.filter(approved=False).exists())
+        self.assertIsNone(cache.get(user_cache_key(pending[-1])))
+
+    def test_assign_group_tag(self):
+        with self.assertNumQueries(1):
+            response = self.client.post(self.changelist_url, {
+                "action": "assign_group_tag",
+                ACTION_CHECKBOX_NAME: self.user_ids,
+            })
+        # the intermediate page, asking for the tag
+        self.assertContains(response, 'name="group_tag"')
+
+        with self.assertNumQueries(4):
+            self.client.post(self.changelist_url, {
+                "action": "assign_group_tag",
+                ACTION_CHECKBOX_NAME: self.user_ids,
+                "apply": "yes",
+                "group_tag": "site-7",
+            })
+        self.assertEqual(
+            GroupTag.objects.get(name="site-7").customuser_set.count(), 5
+        )
+
+    def test_assign_group_tag_across_filtered_changelist(self):
+        users = CustomUser.objects.filter(approved=True,
+                                          role=CustomUser.Role.USER)
+        with self.assertNumQueries(4):
+            self.client.post(
+                self.changelist_url + "?approved__exact=1&role__exact=USER",
+                {
+                    "action": "assign_group_tag",
+                    ACTION_CHECKBOX_NAME: self.user_ids,
+                    "select_across": "1",
+                    "apply": "yes",
+                    "group_tag": "site-7",
+                },
+            )
+        self.assertEqual(
+            GroupTag.objects.get(name="site-7").customuser_set.count(),
+            users.count(),
+        )
+
+
+class ImportUsersTests(TestCase):
+    """
+    The import_users command, on small CSV and JSON files.
+    """
+
+    CSV = (
+        "email,first_name,last_name,role,password,approved,group_tags,"
+        "interest_tags,interpretation_keys\n"
+        "ann@example.com,Ann,Lee,ADMIN,secret,yes,site-a;site-b,gearbox,"
+        "Summary\n"
+        "bob@example.com,Bob,Ray,,,,site-a,,\n"
+        # the same user again (domains are case-insensitive), skipped
+        "bob@EXAMPLE.com,Bob,Ray,,,,site-c,,\n"
+    )
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        GroupTag.objects.create(name="site-a")
+
+    def _write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        return path
+
+    def _import(self, path, *args):
+        out = StringIO()
+        call_command("import_users", path, "--workers", "1", *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_import_csv(self):
+        output = self._import(self._write("users.csv", self.CSV))
+        self.assertIn("Imported 2 users (1 skipped), 3 new tags, "
+                      "5 tag links", output)
+
+        ann = CustomUser.objects.get(email="ann@example.com")
+        self.assertEqual(ann.role, CustomUser.Role.ADMIN)
+        self.assertTrue(ann.approved)
+        self.assertTrue(ann.check_password("secret"))
+        self.assertEqual(
+            sorted(ann.group_tags.values_list("name", flat=True)),
+            ["site-a", "site-b"],
+        )
+        self.assertEqual(
+            list(ann.interest_tags.values_list("name", flat=True)),
+            ["gearbox"],
+        )
+        self.assertEqual(
+            list(ann.interpretation_keys_for_emails
+                 .values_list("name", flat=True)),
+            ["Summary"],
+        )
+
+        bob = CustomUser.objects.get(email="bob@example.com")
+        self.assertEqual(bob.role, CustomUser.Role.USER)
+        self.assertFalse(bob.approved)
+        self.assertFalse(bob.has_usable_password())
+        # linked to the existing tag, not a new one
+        self.assertEqual(
+            list(bob.group_tags.values_list("name", flat=True)), ["site-a"]
+        )
+        self.assertEqual(GroupTag.objects.filter(name="site-a").count(), 1)
+        self.assertFalse(GroupTag.objects.filter(name="site-c").exists())
+
+    def test_import_json(self):
+        path = self._write("users.json", json.dumps([
+            {"email": "cat@example.com", "first_name": "Cat",
+             "last_name": "Kim", "group_tags": ["site-a", "site-d"],
+             "interpretation_keys": ["Summary"]},
+            {"email": "dan@example.com", "first_name": "Dan",
+             "last_name": "Fox", "approved": False},
+        ]))
+        output = self._import(path, "--approve")
+        self.assertIn("Imported 2 users (0 skipped), 2 new tags, "
+                      "3 tag links", output)
+
+        cat = CustomUser.objects.get(email="cat@example.com")
+        self.assertTrue(cat.approved)
+        self.assertEqual(
+            sorted(cat.group_tags.values_list("name", flat=True)),
+            ["site-a", "site-d"],
+        )
+        self.assertFalse(
+            CustomUser.objects.get(email="dan@example.com").approved
+        )
+
+    def test_rerun_is_idempotent(self):
+        path = self._write("users.csv", self.CSV)
+        self._import(path)
+        counts = (CustomUser.objects.count(), GroupTag.objects.count(),
+                  InterestTag.objects.count(),
+                  InterpretationKeysForEmail.objects.count(),
+                  CustomUser.group_tags.through.objects.count())
+
+        output = self._import(path)
+        self.assertIn("Nothing to import (3 skipped)", output)
+        self.assertEqual(
+            (CustomUser.objects.count(), GroupTag.objects.count(),
+             InterestTag.objects.count(),
+             InterpretationKeysForEmail.objects.count(),
+             CustomUser.group_tags.through.objects.count()),
+            counts,
+        )
+
+    def test_malformed_rows(self):
+        cases = [
+            ("missing.csv",
+             "email,first_name,last_name\neve@example.com,Eve,\n",
+             "Row 1: email, first_name and last_name are required"),
+            ("role.csv",
+             "email,first_name,last_name,role\n"
+             "eve@example.com,Eve,Park,OWNER\n",
+             "Row 1: unknown role 'OWNER'"),
+            ("tags.json",
+             json.dumps([{"email": "eve@example.com", "first_name": "Eve",
+                          "last_name": "Park", "group_tags": "site-a"}]),
+             "Row 1: group_tags must be a list of tag names"),
+        ]
+        for name, content, message in cases:
+            with self.subTest(name):
+                with self.assertRaisesMessage(CommandError, message):
+                    self._import(self._write(name, content))
+        self.assertFalse(
+            CustomUser.objects.filter(email="eve@example.com").exists()
+        )
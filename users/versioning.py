@@ -0,0 +1,59 @@
+"""
+Profile versions for the logged-in user API.
+
+Each user has an opaque version token in the cache, replaced whenever
+anything the API returns for them changes (see users.signals). ETags are
+built from it, see core.conditional, and the rendered api/logged_in_user/me
+JSON is cached under it, so a bump leaves the old copy to expire.
+
+Configured by settings.PROFILE_CACHE_TTL.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.conditional import new_version
+
+
+def profile_version_key(user_id):
+    return f"profile_version_{user_id}"
+
+
+def profile_version(user_id):
+    """
+    :param user_id: Primary key of the user
+    :return: The user's current profile version
+    """
+    key = profile_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # first read, or evicted: any new token will do
+        cache.add(key, new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_profile_version(*user_ids):
+    cache.set_many(
+        {profile_version_key(user_id): new_version() for user_id in user_ids},
+        None
+    )
+
+
+def profile_etag(user_id):
+    return f'"{profile_version(user_id)}"'
+
+
+def cached_profile_json(user_id, version, render):
+    """
+    :param user_id: Primary key of the user
+    :param version: Their profile version, as read before rendering
+    :param render: Called on a miss, returns the JSON bytes
+    :return: The JSON bytes for that version
+    """
+    key = f"profile_json_{user_id}_{version}"
+    content = cache.get(key)
+    if content is None:
+        content = render()
+        cache.set(key, content, getattr(settings, "PROFILE_CACHE_TTL", 3600))
+    return content
@@ -1,15 +1,29 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import (
-    authenticate,
-    get_user_model,
-    login,
-    update_session_auth_hash
+    alogin,
+    aupdate_session_auth_hash,
+    get_user_model
 )
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from users.forms import SignUpForm, LoginForm, ChangePassword
+from users.hashing import TooManyAttempts, validate_form
 
 User = get_user_model()
 
+TOO_MANY_ATTEMPTS = (
+    "Too many attempts in progress from your address, "
+    "please try again shortly."
+)
+
+
+def too_many_attempts(request, template_name, form):
+    # an unbound form, as validating the submitted one would hash;
+    # add_error expects cleaned_data
+    form.cleaned_data = {}
+    form.add_error(None, TOO_MANY_ATTEMPTS)
+    return render(request, template_name, {"form": form}, status=429)
+
 
 @login_required
 def index(request):
@@ -20,36 +34,58 @@ def redirect_to_cms(request):
     return redirect('/cms/')
 
 
-@login_required
-def change_password(request):
-    form = ChangePassword(user=request.user, data=request.POST or None)
+async def change_password(request):
+    # async, so login_required (sync only before Django 5.1) can't wrap it
+    user = await request.auser()
+    if not user.is_authenticated:
+        return redirect_to_login(request.get_full_path())
+
+    form = ChangePassword(user=user, data=request.POST or None)
     if request.method == "POST":
-        if form.is_valid():
-            form.save()
-            update_session_auth_hash(request, form.user)
+        try:
+            # checks the old password and hashes the new one, see
+            # users/hashing.py
+            valid = await validate_form(request, form, save=True)
+        except TooManyAttempts:
+            return too_many_attempts(request,
+                                     "registration/change_password.html",
+                                     ChangePassword(user=user))
+        if valid:
+            # Django 5.0's aupdate_session_auth_hash checks request.user,
+            # which auser() doesn't resolve
+            request.user = user
+            await aupdate_session_auth_hash(request, form.user)
             return render(request, "index.html", {})
     return render(request, "registration/change_password.html", {"form": form})
 
 
-def signup(request):
+async def signup(request):
     form = SignUpForm(request.POST or None)
     if request.method == "POST":
-        if form.is_valid():
-            form.save()
+        try:
+            valid = await validate_form(request, form, save=True)
+        except TooManyAttempts:
+            return too_many_attempts(request, "registration/signup.html",
+                                     SignUpForm())
+        if valid:
             return redirect("users:login")
     return render(request, "registration/signup.html", {"form": form})
 
 
-def login_user(request):
+async def login_user(request):
     form = LoginForm(data=request.POST or None)
-    if form.is_valid():
-        username = form.cleaned_data.get("username")
-        password = form.cleaned_data.get("password")
-        user = authenticate(username=username, password=password)
-        if user is not None and user.approved:
-            login(request, user)
-            return redirect("users:index")
-        elif not user.approved:
+    if request.method == "POST":
+        try:
+            # the form authenticates, hashing the password
+            valid = await validate_form(request, form)
+        except TooManyAttempts:
+            return too_many_attempts(request, "registration/login.html",
+                                     LoginForm())
+        if valid:
+            user = form.get_user()
+            if user.approved:
+                await alogin(request, user)
+                return redirect("users:index")
             form.add_error(
                 None,
                 (
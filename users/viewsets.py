@@ -1,6 +1,17 @@
+from django.db.models import prefetch_related_objects
+from django.http import HttpResponse
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from users.models import CustomUser
 from rest_framework import viewsets
-from users.serializers import CustomUserSerializer
+from core.conditional import not_modified, set_conditional_headers
+from users.serializers import CustomUserSerializer, LoggedInUserSerializer
+from users.versioning import (
+    cached_profile_json,
+    profile_etag,
+    profile_version
+)
 
 
 class LoggedInUserViewSet(viewsets.ModelViewSet):
@@ -13,6 +24,42 @@ class LoggedInUserViewSet(viewsets.ModelViewSet):
             email=self.request.user.email
         )
 
+    def list(self, request, *args, **kwargs):
+        # ETag of the user's profile version, see users/versioning.py;
+        # a current client gets a 304 without the serializer running
+        etag = None
+        if request.user.is_authenticated:
+            etag = profile_etag(request.user.pk)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+        response = super().list(request, *args, **kwargs)
+        return set_conditional_headers(response, etag)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated])
+    def me(self, request):
+        """
+        The logged-in user, with tags nested by name, for the React app's
+        boot. The rendered JSON is cached per profile version, so repeated
+        reads are served from the cache without touching the database.
+        """
+        user = request.user
+        version = profile_version(user.pk)
+        etag = f'"{version}"'
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        def render():
+            prefetch_related_objects([user], *LoggedInUserSerializer.PREFETCH)
+            return JSONRenderer().render(LoggedInUserSerializer(user).data)
+
+        content = cached_profile_json(user.pk, version, render)
+        return set_conditional_headers(
+            HttpResponse(content, content_type='application/json'), etag
+        )
+
     def perform_create(self, serializer):
         # ensure current user is correctly populated on new objects
         serializer.save(user=self.request.user)